@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import scrolledtext, ttk
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
 from dotenv import load_dotenv
@@ -26,6 +27,10 @@ class DeepSeekChat:
         self.api_key = os.getenv("DEEPSEEK_API_KEY")
         if not self.api_key:
             raise ValueError("请在.env文件中设置DEEPSEEK_API_KEY")
+        
+        # 所有请求共用一个会话，保持与 api.deepseek.com 的长连接，不必每条消息都重新握手
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
             
         self.setup_ui()
         
@@ -93,10 +98,11 @@ class DeepSeekChat:
                 "messages": [{"role": "user", "content": message}]
             }
             
-            response = requests.post(
+            response = self.session.post(
                 "https://api.deepseek.com/v1/chat/completions",
                 headers=headers,
-                json=data
+                json=data,
+                timeout=(5, 120)
             )
             
             if response.status_code == 200:
@@ -0,0 +1,89 @@
+import pickle
+import os
+import sys
+import cv2
+
+PKL_PATH = os.path.join(os.path.dirname(__file__), 'shared_data.pkl')
+SHI_BIE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts', 'shi_bie')
+sys.path.insert(0, SHI_BIE_DIR)
+from template_index import TemplateIndex  # noqa: E402
+from layout_signature import compute_signature, encode_signature, SIGNATURE_DECODE_FLAGS
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff')
+
+USAGE = '''用法:
+  python add_templates.py <别名> <图片或目录>...   给别名追加模板样例的版面指纹
+  python add_templates.py <别名> --clear           清空别名的模板指纹
+  python add_templates.py --check <图片或目录>...  用现有指纹分类，打印最近别名和距离
+  python add_templates.py --list                   列出各别名的模板样例数'''
+
+
+def iter_image_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTS):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def read_signature(path):
+    image = cv2.imread(path, SIGNATURE_DECODE_FLAGS)
+    if image is None:
+        print(f"无法读取图片，跳过: {path}")
+        return None
+    return compute_signature(image)
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(USAGE)
+        return
+    with open(PKL_PATH, 'rb') as f:
+        data = pickle.load(f)
+
+    if args[0] == '--list':
+        for alias, scripts in data.items():
+            if alias != '__global__':
+                count = len(scripts.get('image_window', {}).get('signatures', []))
+                print(f"{alias}: {count} 个模板样例")
+        return
+
+    if args[0] == '--check':
+        index = TemplateIndex.from_pkl_data(data)
+        if not len(index):
+            print("还没有别名保存模板指纹")
+            return
+        for path in iter_image_paths(args[1:]):
+            signature = read_signature(path)
+            if signature is not None:
+                alias, distance = index.match_many(signature)[0]
+                print(f"{os.path.basename(path)}: {alias} (距离 {distance:.3f})")
+        return
+
+    alias = args[0]
+    if alias not in data or alias == '__global__':
+        print(f"别名不存在: {alias}")
+        return
+    window = data[alias].setdefault('image_window', {})
+    if args[1:] == ['--clear']:
+        window['signatures'] = []
+        print(f"已清空 {alias} 的模板指纹")
+    else:
+        added = [read_signature(path) for path in iter_image_paths(args[1:])]
+        added = [encode_signature(s) for s in added if s is not None]
+        if not added:
+            print("没有可用的图片")
+            return
+        window['signatures'] = window.get('signatures', []) + added
+        print(f"{alias}: 追加 {len(added)} 个模板样例，共 {len(window['signatures'])} 个")
+
+    with open(PKL_PATH, 'wb') as f:
+        pickle.dump(data, f)
+    print("已保存 shared_data.pkl！")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+模板图片的版面指纹
+
+编辑端 bian_ji/pkl1.py 保存别名时计算指纹并存入 shared_data.pkl，识别端 shi_bie/template_index.py
+读出后比较距离，两端必须用同一套算法，所以放在与 pkl 同目录的这个模块里，由两端共同导入。
+版面指纹是缩到 32x24 的灰度图，减去均值后归一化为单位向量，存入 pkl 时编码为 float16。
+"""
+import numpy as np
+import cv2
+
+# 指纹的网格尺寸 (宽, 高)
+SIGNATURE_SIZE = (32, 24)
+SIGNATURE_DIM = SIGNATURE_SIZE[0] * SIGNATURE_SIZE[1]
+# 指纹只需要很小的图，读取时按1/4缩小解码
+SIGNATURE_DECODE_FLAGS = cv2.IMREAD_REDUCED_GRAYSCALE_4
+
+
+def compute_signature(image: np.ndarray) -> np.ndarray:
+    """
+    计算图片的版面指纹
+
+    @param image {np.ndarray} 灰度或BGR图片
+    @return {np.ndarray} 长度为 SIGNATURE_DIM 的 float32 单位向量，纯色图片为零向量
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    vector = cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def encode_signature(signature: np.ndarray) -> bytes:
+    """
+    编码为存入 pkl 的字节串（float16，约1.5KB）
+    """
+    return np.asarray(signature, dtype=np.float16).tobytes()
+
+
+def decode_signature(data: bytes):
+    """
+    @return {np.ndarray|None} 指纹，长度与当前 SIGNATURE_SIZE 不符时返回None
+    """
+    signature = np.frombuffer(data, dtype=np.float16)
+    if signature.size != SIGNATURE_DIM:
+        return None
+    return signature.astype(np.float32)
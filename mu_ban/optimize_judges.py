@@ -0,0 +1,223 @@
+import pickle
+import os
+import re
+import sys
+import ast
+import numpy as np
+import cv2
+
+PKL_PATH = os.path.join(os.path.dirname(__file__), 'shared_data.pkl')
+SHI_BIE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts', 'shi_bie')
+sys.path.insert(0, SHI_BIE_DIR)
+from judge_lib import ImageFeatures  # noqa: E402
+
+# 默认用来校验改写结果的真实图片
+TEST_IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '测试图片们')
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+# 改写后的判别方案只能依赖所有加载方（包括 onefile_scripts 的单文件版）都会注入的名字
+BASE_NAMESPACE = {'np': np, 'cv2': cv2}
+
+# 匹配逐行求标准差、低于阈值就记下行号的循环：
+#     for y in range(a, b):
+#         row = img[y, x0:x1]
+#         std = np.std(row)
+#         if std < threshold:
+#             interruptions.append(y)
+ROW_LOOP_PATTERN = re.compile(
+    r'(?P<indent>[ \t]*)for (?P<y>\w+) in range\((?P<start>[^,\n]+),\s*(?P<stop>[^,\n]+)\):[ \t]*\n'
+    r'[ \t]+(?P<row>\w+) = (?P<img>\w+)\[(?P=y),\s*(?P<x0>[^:\]\n]*):(?P<x1>[^\]\n]*)\][ \t]*\n'
+    r'[ \t]+(?P<std>\w+) = np\.std\((?P=row)\)[ \t]*\n'
+    r'[ \t]+if (?P=std) < (?P<thr>[^:\n]+):[ \t]*\n'
+    r'[ \t]+(?P<var>\w+)\.append\((?P=y)\)[ \t]*\n')
+
+
+def rewrite_row_loops(code):
+    """
+    把逐行循环改写为一次按行求标准差的 np.std 调用，只用到 np，不依赖 judge_lib；
+    行号用 np.arange 花式下标取，负数和越界的处理与逐行下标相同。循环变量在循环后还被使用时不改写
+
+    @return {tuple} (新代码, 改写的循环数)
+    """
+    count = 0
+
+    def replace(m):
+        nonlocal count
+        rest = code[m.end():]
+        for name in (m.group('y'), m.group('row'), m.group('std')):
+            if re.search(rf'\b{name}\b', rest):
+                return m.group(0)
+        indent, img, std = m.group('indent'), m.group('img'), m.group('std')
+        start, stop = m.group('start').strip(), m.group('stop').strip()
+        count += 1
+        return (f"{indent}{std} = np.std({img}[np.arange({start}, {stop}), {m.group('x0')}:{m.group('x1')}], "
+                f"axis=tuple(range(1, {img}.ndim)))\n"
+                f"{indent}{m.group('var')}.extend((np.flatnonzero({std} < {m.group('thr').strip()}) + ({start})).tolist())\n")
+
+    return ROW_LOOP_PATTERN.sub(replace, code), count
+
+
+# 中线竖条：roi = img[:, x-5:x+5] 之后的 np.std(roi)
+STRIPE_PATTERN = re.compile(
+    r'(?P<indent>[ \t]*)(?P<roi>\w+) = (?P<expr>(?P<img>\w+)\[:,\s*(?P<x>[\w.]+)\s*-\s*(?P<k>\d+):(?P=x)\s*\+\s*(?P=k)\])'
+    r'[ \t]*\n')
+
+# rewrite_row_loops 改写出的按行标准差
+ROW_STD_PATTERN = re.compile(
+    r'(?P<std>\w+) = (?P<expr>np\.std\((?P<img>\w+)\[np\.arange\((?P<start>[^,\n]+),\s*(?P<stop>[^\n]+?)\),\s*'
+    r'(?P<x0>[^:\]\n]*):(?P<x1>[^\]\n]*)\], axis=tuple\(range\(1, (?P=img)\.ndim\)\)\))')
+
+
+def rewrite_to_features(code):
+    """
+    让判别函数可以使用共享特征包：增加 features=None 参数，按行标准差与中线竖条的 np.std
+    在传入 features 时改用特征包上的同名方法，同一张图片在各别名的判别函数之间只计算一次；
+    没有传入时仍按原来的 np 代码计算，只注入 np、cv2 的加载方（单文件版）照常可用
+
+    @return {tuple} (新代码, 改写处数)
+    """
+    tree = ast.parse(code)
+    func = next((node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name == 'judge'), None)
+    if func is None or not func.args.args:
+        return code, 0
+    arg_names = [a.arg for a in func.args.args + func.args.kwonlyargs]
+    if 'features' in arg_names or func.args.vararg or func.args.kwarg:
+        return code, 0
+    img = func.args.args[0].arg
+
+    count = 0
+
+    def replace_rows(m):
+        nonlocal count
+        if m.group('img') != img:
+            return m.group(0)
+        count += 1
+        x0 = m.group('x0').strip() or '0'
+        x1 = m.group('x1').strip() or 'None'
+        return (f"{m.group('std')} = features.row_std_profile({m.group('start').strip()}, {m.group('stop').strip()}, "
+                f"{x0}, {x1}) if features is not None else {m.group('expr')}")
+    new_code = ROW_STD_PATTERN.sub(replace_rows, code)
+
+    for m in STRIPE_PATTERN.finditer(code):
+        if m.group('img') != img:
+            continue
+        roi = m.group('roi')
+        new_code, n = re.subn(rf'np\.std\({roi}\)',
+                              f'features.vertical_stripe_std({m.group("x")}, {m.group("k")}) '
+                              f'if features is not None else np.std({m.group("expr")})', new_code)
+        count += n
+        # 竖条只用来求标准差时，原来的 roi = ... 这一行不再需要
+        if n and len(re.findall(rf'\b{roi}\b', new_code)) == 1:
+            new_code = new_code.replace(m.group(0), '', 1)
+    if not count:
+        return code, 0
+
+    # 参数表末尾加 features=None
+    lines = new_code.split('\n')
+    def_line = func.lineno - 1
+    lines[def_line] = re.sub(r'\)\s*:', ', features=None):', lines[def_line], count=1)
+    return '\n'.join(lines), count
+
+
+def load_judge(code):
+    namespace = dict(BASE_NAMESPACE)
+    exec(code, namespace)
+    return namespace['judge']
+
+
+def read_images(images_dir):
+    """
+    读取目录下的真实图片用于校验
+    """
+    images = []
+    if images_dir and os.path.isdir(images_dir):
+        for name in sorted(os.listdir(images_dir)):
+            if name.lower().endswith(IMAGE_EXTS):
+                image = cv2.imread(os.path.join(images_dir, name))
+                if image is not None:
+                    images.append(image)
+    return images
+
+
+def sample_images():
+    """
+    构造的样例图：纯色、随机噪声、中间有彩色竖条且右半边有/无中断
+    """
+    rng = np.random.default_rng(0)
+    images = [np.zeros((300, 400, 3), np.uint8),
+              rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)]
+    striped = np.zeros((300, 400, 3), np.uint8)
+    striped[:, 195:205] = rng.integers(0, 256, (300, 10, 3), dtype=np.uint8)
+    striped[:, 200:] = rng.integers(0, 256, (300, 200, 3), dtype=np.uint8)
+    images.append(striped)
+    broken = striped.copy()
+    broken[140:160, 200:] = 0
+    images.append(broken)
+    return images
+
+
+def same_results(old_code, new_code, images):
+    """
+    比较改写前后的判别结果（新判别函数带与不带特征包各比较一次），两者都只在 np、cv2 命名空间中加载
+
+    @param images {list} 校验用的图片
+    """
+    old_judge = load_judge(old_code)
+    new_judge = load_judge(new_code)
+    takes_features = 'features' in new_judge.__code__.co_varnames[:new_judge.__code__.co_argcount]
+    for img in images:
+        expected = bool(old_judge(img))
+        if bool(new_judge(img)) != expected:
+            return False
+        if takes_features and bool(new_judge(img, features=ImageFeatures(img))) != expected:
+            return False
+    return True
+
+
+def main():
+    args = sys.argv[1:]
+    dry_run = '--dry-run' in args
+    images_dir = args[args.index('--images') + 1] if '--images' in args[:-1] else TEST_IMAGES_DIR
+    real_images = read_images(images_dir)
+    if not real_images:
+        print(f"没有找到校验用的图片（{images_dir}），请用 --images <目录> 指定，未改写")
+        return
+    print(f"用 {len(real_images)} 张图片校验改写结果")
+    images = real_images + sample_images()
+    with open(PKL_PATH, 'rb') as f:
+        data = pickle.load(f)
+
+    changed = False
+    for alias, scripts in data.items():
+        if alias == '__global__' or 'pkl2' not in scripts or '图片类型判别方案' not in scripts['pkl2']:
+            continue
+        code = scripts['pkl2']['图片类型判别方案']
+        new_code, loops = rewrite_row_loops(code)
+        new_code, shared = rewrite_to_features(new_code)
+        if not loops and not shared:
+            continue
+        try:
+            ok = same_results(code, new_code, images)
+        except Exception as e:
+            print(f"校验 {alias} 的改写结果出错，跳过: {e}")
+            continue
+        if not ok:
+            print(f"{alias} 改写前后判别结果不一致，跳过")
+            continue
+        print(f"改写 {alias} 的判别方案: {loops} 处逐行循环 -> 按行 np.std，{shared} 处改用共享特征包")
+        if dry_run:
+            print(new_code)
+        else:
+            scripts['pkl2']['图片类型判别方案'] = new_code
+            changed = True
+
+    if changed:
+        with open(PKL_PATH, 'wb') as f:
+            pickle.dump(data, f)
+        print("已改写并保存 shared_data.pkl！")
+    elif not dry_run:
+        print("无需改写，没有找到可向量化的逐行循环或可共享的特征计算。")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,11 @@ from PyQt6.QtGui import QPixmap, QDragEnterEvent, QDropEvent
 import os
 import shutil
 from datetime import datetime
+import cv2
 from data_manager import DataManager
+# 版面指纹的算法与识别端共用，放在 mu_ban/layout_signature.py 中
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'mu_ban'))
+from layout_signature import compute_signature, encode_signature, SIGNATURE_DECODE_FLAGS
 
 class ImageWindow(QMainWindow):
     """
@@ -111,6 +115,10 @@ class ImageWindow(QMainWindow):
                     'size': self.saved_size,
                     'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 }
+                # 模板图片的版面指纹，识别时可按模板分类
+                signature = self.compute_template_signature()
+                if signature is not None:
+                    data['signatures'] = [signature]
                 self.data_manager.save_data(alias, 'image_window', data)
                 # 复制图片到lin_shi并用别名命名
                 if self.current_image_path:
@@ -118,6 +126,19 @@ class ImageWindow(QMainWindow):
                 print(f'已保存：别名={self.saved_alias}, 尺寸={self.saved_size}')
                 self.close()
 
+    def compute_template_signature(self):
+        """
+        计算当前图片的版面指纹
+        Returns:
+            bytes: 编码后的指纹，图片无法读取时返回None
+        """
+        if not self.current_image_path:
+            return None
+        image = cv2.imread(self.current_image_path, SIGNATURE_DECODE_FLAGS)
+        if image is None:
+            return None
+        return encode_signature(compute_signature(image))
+
     def copy_to_temp(self, file_path, alias):
         """
         将图片复制到lin_shi文件夹并重命名为别名+原扩展名
@@ -0,0 +1,160 @@
+"""
+百度OCR access_token 管理
+
+百度的 access_token 有效期约30天，不必每个批次都重新申请。TokenManager 把 token 和过期时间
+保存在 lin_shi/baidu_token.json，按需获取：第一个百度OCR识别区真正要调用接口时才读取或申请，
+没有识别区用百度OCR的批次不产生任何网络请求。距过期不到 REFRESH_MARGIN 时提前刷新。
+多个识别线程同时调用时只有一个线程去申请，其余线程等待并共用结果。
+密钥也只读一次，之后仅在密钥文件的修改时间变化或 token 被服务端作废时重新读取。
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import http_client
+from ingest import get_lin_shi_dir
+
+TOKEN_NAME = 'baidu_token.json'
+TOKEN_URL = 'https://aip.baidubce.com/oauth/2.0/token'
+# 距过期不到这么多秒时提前刷新
+REFRESH_MARGIN = 24 * 3600
+# 接口没有返回有效期时按这个计算（秒）
+DEFAULT_EXPIRES_IN = 30 * 24 * 3600
+# 申请失败后这么多秒内不再重试，避免每个识别区都去请求一次
+FAILURE_COOLDOWN = 30
+
+
+class TokenManager:
+    """
+    带磁盘缓存的 access_token，线程安全
+    """
+    def __init__(self, read_key, key_path: str = None):
+        """
+        @param read_key {Callable} 返回 (API_KEY, SECRET_KEY)
+        @param key_path {str} 密钥文件路径，修改时间变化时重新调用 read_key；None 时只在 token 失效后重读
+        """
+        self.read_key = read_key
+        self.key_path = key_path
+        self._key = None
+        self._key_mtime = None
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+        self._key_id = None
+        self._failed_at = None
+
+    @staticmethod
+    def get_cache_path() -> str:
+        return os.path.join(get_lin_shi_dir(), TOKEN_NAME)
+
+    @staticmethod
+    def _key_id_of(api_key: str) -> str:
+        # 缓存里只记 API_KEY 的哈希，用来判断密钥是否换过
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+    def _get_key(self) -> tuple:
+        """
+        @return {tuple} (API_KEY, SECRET_KEY)，密钥文件没变时用上次读到的
+        """
+        mtime = None
+        if self.key_path is not None:
+            try:
+                mtime = os.stat(self.key_path).st_mtime_ns
+            except OSError:
+                pass
+        if self._key is None or mtime != self._key_mtime:
+            self._key = self.read_key()
+            self._key_mtime = mtime
+        return self._key
+
+    def _fresh(self, key_id: str) -> bool:
+        return (self._token is not None and self._key_id == key_id
+                and self._expires_at - time.time() > REFRESH_MARGIN)
+
+    def _load_cache(self, key_id: str):
+        path = self.get_cache_path()
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except Exception as e:
+            print(f"读取access_token缓存失败: {e}")
+            return
+        if cached.get('key_id') == key_id and cached.get('access_token'):
+            self._token = cached['access_token']
+            self._expires_at = float(cached.get('expires_at', 0))
+            self._key_id = key_id
+
+    def _save_cache(self):
+        path = self.get_cache_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'key_id': self._key_id, 'access_token': self._token,
+                           'expires_at': self._expires_at}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"保存access_token缓存失败: {e}")
+
+    def _fetch(self, api_key: str, secret_key: str, key_id: str) -> bool:
+        try:
+            resp = http_client.get(TOKEN_URL, params={'grant_type': 'client_credentials',
+                                                      'client_id': api_key, 'client_secret': secret_key})
+            data = resp.json()
+        except Exception as e:
+            print(f"获取access_token失败: {e}")
+            return False
+        token = data.get('access_token')
+        if not token:
+            print(f"获取access_token失败: {data.get('error_description') or data}")
+            return False
+        self._token = token
+        self._expires_at = time.time() + float(data.get('expires_in') or DEFAULT_EXPIRES_IN)
+        self._key_id = key_id
+        self._save_cache()
+        return True
+
+    def get(self):
+        """
+        @return {str|None} access_token，密钥为空或申请失败时返回None
+        """
+        with self._lock:
+            api_key, secret_key = self._get_key()
+            if not api_key or not secret_key:
+                print("API_KEY 或 SECRET_KEY 为空，请在 mu_ban/baidu_ocr_key.txt 中填写！")
+                return None
+            key_id = self._key_id_of(api_key)
+            if self._fresh(key_id):
+                return self._token
+            self._load_cache(key_id)
+            if self._fresh(key_id):
+                return self._token
+            if self._failed_at is None or time.time() - self._failed_at >= FAILURE_COOLDOWN:
+                if self._fetch(api_key, secret_key, key_id):
+                    self._failed_at = None
+                    return self._token
+                self._failed_at = time.time()
+            # 申请失败（或还在失败冷却期内），旧 token 还没过期时继续使用
+            if self._key_id == key_id and self._expires_at > time.time():
+                return self._token
+            return None
+
+    def invalidate(self, token: str):
+        """
+        标记 token 已失效；只有它仍是当前 token 时才清除，多个线程同时报告时只会重新申请一次。
+        密钥可能已在控制台重置，下次申请前重新读取密钥文件
+        """
+        with self._lock:
+            if token == self._token:
+                self._key = None
+                self._token = None
+                self._expires_at = 0.0
+                self._failed_at = None
+                path = self.get_cache_path()
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,385 @@
+"""
+多进程分类
+
+判别函数是纯 Python 代码，单进程分类时只能用满一个核。这里用进程池并行解码和判别：
+判别方案源码在进程启动时只传一次，各进程自己编译（走 code_cache 的磁盘缓存），
+图片按小块分发给各进程，结果按输入顺序逐张返回，每项附带该图片解码和判别的耗时。
+进程用 spawn 方式启动，不继承界面进程的 Qt 状态，Windows 上同样可用。
+
+设置了单个判别函数/单张图片的时间预算时改用 GuardedClassifier：每个工作进程逐张判别并报告
+正在运行的别名，超时就直接结束该进程，这张图片记为 timeout，再启动新进程继续。
+同一个别名多次超时后，本批次剩余图片不再调用它。
+"""
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+from ocr2 import build_judge_functions, judge_image, get_classify_decode, get_judge_signature, order_by_batch
+from ingest import (list_batch_images, get_image_info, get_content_keys, load_hash_index, save_hash_index,
+                    lookup_classification, store_classification)
+from image_source import imread_source, close_archives
+from judge_order import JudgeOrder, merge_stats, save_judge_stats
+from size_index import SizeIndex
+
+# 每次分发给一个进程的图片数
+CHUNK_SIZE = 8
+# 启动进程约需一秒，每个进程至少分到这么多图片才值得启动
+MIN_IMAGES_PER_WORKER = 32
+# 同一别名超时这么多次后，本批次不再调用它
+MAX_TIMEOUTS = 3
+# 限时判别的工作进程在这么多秒内仍未就绪时视为启动失败，不计入图片的时间预算
+STARTUP_TIMEOUT = 60.0
+
+# 工作进程中的判别函数、解码方式与判别顺序，由 _init_worker 设置
+_worker_judges = None
+_worker_decode = None
+_worker_order = None
+
+
+def _init_worker(judge_sources: dict):
+    global _worker_judges, _worker_decode, _worker_order
+    _worker_judges = build_judge_functions(judge_sources)
+    _worker_decode = get_classify_decode(_worker_judges)
+    _worker_order = JudgeOrder(_worker_judges)
+
+
+def _classify_items(items: list, judge_functions: dict, decode: tuple, order: JudgeOrder) -> list:
+    """
+    解码并判别一组图片
+
+    @param items {list} [(图片名, 图片路径, 是否为有效图片, 候选别名), ...]，候选别名见 size_index.py
+    @param decode {tuple} get_classify_decode 的返回值
+    @param order {JudgeOrder} 判别顺序与统计
+    @return {list} [(图片名, 类别, 耗时秒), ...]
+    """
+    decode_scale, _, decode_flags = decode
+    results = []
+    for img_name, img_path, readable, candidates in items:
+        start = time.perf_counter()
+        if candidates is not None and not candidates:
+            # 没有尺寸相容的别名，不必解码
+            results.append((img_name, 'unknown', time.perf_counter() - start))
+            continue
+        image = imread_source(img_path, decode_flags) if readable else None
+        if image is None:
+            print(f"无法读取图片: {img_name}")
+            results.append((img_name, 'unreadable', time.perf_counter() - start))
+            continue
+        image_type = judge_image(image, judge_functions, img_name, decode_scale=decode_scale, order=order,
+                                 candidates=candidates)
+        results.append((img_name, image_type, time.perf_counter() - start))
+    close_archives()
+    return results
+
+
+def _classify_chunk(items: list) -> tuple:
+    """
+    @return {tuple} (判别结果, 本块的判别统计增量)，统计由主进程统一保存
+    """
+    results = _classify_items(items, _worker_judges, _worker_decode, _worker_order)
+    return results, _worker_order.take_delta()
+
+
+def _guard_main(conn, judge_sources: dict):
+    """
+    GuardedClassifier 的工作进程：逐张解码并判别，每个判别函数开始前报告别名
+    """
+    judge_functions = build_judge_functions(judge_sources)
+    decode_scale, _, decode_flags = get_classify_decode(judge_functions)
+    order = JudgeOrder(judge_functions)
+    on_judge = lambda alias: conn.send(('judge', alias))
+    # 启动和导入完成后再通知主进程，之后才开始给图片计时
+    conn.send(('ready',))
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        img_name, img_path, readable, candidates = task
+        if candidates is not None and not candidates:
+            # 没有尺寸相容的别名，不必解码
+            conn.send(('done', 'unknown', {}))
+            continue
+        image = imread_source(img_path, decode_flags) if readable else None
+        if image is None:
+            result = 'unreadable'
+        else:
+            result = judge_image(image, judge_functions, img_name, decode_scale=decode_scale,
+                                 order=order, on_judge=on_judge, candidates=candidates)
+        conn.send(('done', result, order.take_delta()))
+    close_archives()
+
+
+class GuardedClassifier:
+    """
+    在可随时结束的工作进程中判别，给单个判别函数和单张图片设时间预算
+    """
+    def __init__(self, judge_sources: dict, judge_timeout: float = None, image_timeout: float = None,
+                 shared: dict = None):
+        """
+        @param judge_sources {dict} {别名: 判别方案源码}
+        @param judge_timeout {float} 单个判别函数的时间预算（秒），None为不限
+        @param image_timeout {float} 单张图片（含解码）的时间预算（秒），None为不限
+        @param shared {dict} 多个 GuardedClassifier 共用的超时记录，见 new_guard_state
+        """
+        self.judge_sources = judge_sources
+        self.judge_timeout = judge_timeout
+        self.image_timeout = image_timeout
+        self.shared = shared if shared is not None else new_guard_state()
+        self.process = None
+        self.conn = None
+
+    def _start(self):
+        with self.shared['lock']:
+            disabled = set(self.shared['disabled'])
+        sources = {alias: code for alias, code in self.judge_sources.items() if alias not in disabled}
+        ctx = multiprocessing.get_context('spawn')
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_guard_main, args=(child_conn, sources), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def _kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def _record_timeout(self, alias: str):
+        with self.shared['lock']:
+            timeouts = self.shared['timeouts']
+            timeouts[alias] = timeouts.get(alias, 0) + 1
+            if alias != '读取' and timeouts[alias] >= MAX_TIMEOUTS and alias not in self.shared['disabled']:
+                self.shared['disabled'].add(alias)
+                print(f"[判别] 别名 {alias} 已超时 {timeouts[alias]} 次，本批次不再调用")
+
+    def classify(self, img_name: str, img_path: str, readable: bool = True, candidates: frozenset = None) -> str:
+        """
+        @param candidates {frozenset} 只尝试这些别名，None为全部
+        @return {str} 判别结果；超时为 timeout，工作进程异常退出为 unreadable
+        """
+        # 工作进程发来 ready 之后才开始计时
+        started = self.process is not None
+        if not started:
+            self._start()
+        self.conn.send((img_name, img_path, readable, candidates))
+        image_start = judge_start = time.monotonic()
+        current = '读取'
+        while True:
+            deadlines = []
+            if not started:
+                # 新启动的工作进程还在导入 cv2/numpy、编译判别函数，不计入图片的时间预算
+                deadlines.append(image_start + STARTUP_TIMEOUT)
+            elif self.image_timeout:
+                deadlines.append(image_start + self.image_timeout)
+            if self.judge_timeout and current != '读取':
+                deadlines.append(judge_start + self.judge_timeout)
+            wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            try:
+                ready = self.conn.poll(wait)
+                if ready:
+                    msg = self.conn.recv()
+            except (EOFError, OSError):
+                print(f"判别进程异常退出: {img_name}")
+                self._kill()
+                return 'unreadable'
+            if not ready:
+                if not started:
+                    print(f"[判别] 判别进程 {STARTUP_TIMEOUT:.0f} 秒内未能启动: {img_name}")
+                    self._kill()
+                    return 'unreadable'
+                print(f"[判别] {img_name} 超时，正在运行: {current}")
+                self._kill()
+                self._record_timeout(current)
+                return 'timeout'
+            if msg[0] == 'ready':
+                started = True
+                image_start = judge_start = time.monotonic()
+                continue
+            if msg[0] == 'judge':
+                current = msg[1]
+                judge_start = time.monotonic()
+                continue
+            _, result, delta = msg
+            with self.shared['lock']:
+                merge_stats(self.shared['stats'], delta)
+            return result
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.conn.send(None)
+                self.process.join(timeout=5)
+            except OSError:
+                pass
+            self._kill()
+
+
+def new_guard_state() -> dict:
+    """
+    一批图片共用的超时记录：{'timeouts': {别名: 次数}, 'disabled': 停用的别名, 'stats': 判别统计增量}
+    """
+    return {'lock': threading.Lock(), 'timeouts': {}, 'disabled': set(), 'stats': {}}
+
+
+def iter_classify_guarded(items: list, judge_sources: dict, workers: int, judge_timeout: float,
+                          image_timeout: float, state: dict):
+    """
+    用 GuardedClassifier 判别，每个线程驱动一个工作进程，结果按输入顺序产出
+    """
+    local = threading.local()
+    classifiers = []
+
+    def classify(item):
+        classifier = getattr(local, 'classifier', None)
+        if classifier is None:
+            classifier = local.classifier = GuardedClassifier(judge_sources, judge_timeout, image_timeout, state)
+            with state['lock']:
+                classifiers.append(classifier)
+        start = time.perf_counter()
+        image_type = classifier.classify(*item)
+        return item[0], image_type, time.perf_counter() - start
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(classify, items)
+    finally:
+        for classifier in classifiers:
+            classifier.close()
+        save_judge_stats(state['stats'])
+
+
+def iter_classify(images: list, judge_sources: dict, image_info: dict = None, workers: int = None,
+                  chunk_size: int = CHUNK_SIZE, judge_timeout: float = None, image_timeout: float = None,
+                  guard_state: dict = None, layout_sizes: dict = None):
+    """
+    并行判别一批图片，按输入顺序逐张产出结果
+
+    @param images {list} [(图片名, 图片路径), ...]
+    @param judge_sources {dict} {别名: 判别方案源码}
+    @param image_info {dict} get_image_info 返回的探测信息，探测失败的图片不解码
+    @param workers {int} 进程数，None为CPU核数
+    @param chunk_size {int} 每块的图片数
+    @param judge_timeout {float} 单个判别函数的时间预算（秒），与 image_timeout 都为None时不限时
+    @param image_timeout {float} 单张图片的时间预算（秒）
+    @param guard_state {dict} 限时判别时的超时记录，见 new_guard_state
+    @param layout_sizes {dict} {别名: 模板尺寸}，按图片的探测尺寸只下发宽高比相容的候选别名
+    @return {Iterator[tuple]} (图片名, 类别, 耗时秒)
+    """
+    size_index = SizeIndex(layout_sizes or {}, list(judge_sources))
+    items = []
+    for name, path in images:
+        info = None if image_info is None else image_info.get(name)
+        candidates = size_index.candidates_for(info) if layout_sizes else None
+        items.append((name, path, image_info is None or info is not None, candidates))
+    if judge_timeout or image_timeout:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(items)))
+        state = guard_state if guard_state is not None else new_guard_state()
+        yield from iter_classify_guarded(items, judge_sources, workers, judge_timeout, image_timeout, state)
+        return
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    workers = min(workers or os.cpu_count() or 1, len(chunks), len(items) // MIN_IMAGES_PER_WORKER)
+    if workers <= 1:
+        # 图片太少时不值得启动进程
+        judge_functions = build_judge_functions(judge_sources)
+        decode = get_classify_decode(judge_functions)
+        order = JudgeOrder(judge_functions)
+        try:
+            for chunk in chunks:
+                yield from _classify_items(chunk, judge_functions, decode, order)
+        finally:
+            save_judge_stats(order.take_delta())
+        return
+    ctx = multiprocessing.get_context('spawn')
+    stats = {}
+    try:
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(judge_sources,)) as pool:
+            for results, delta in pool.imap(_classify_chunk, chunks):
+                merge_stats(stats, delta)
+                yield from results
+    finally:
+        save_judge_stats(stats)
+
+
+def iter_classify_images(images_dir: str, judge_sources: dict, workers: int = None,
+                         judge_timeout: float = None, image_timeout: float = None, layout_sizes: dict = None):
+    """
+    多进程判别批次目录中的所有图片，逐张产出结果：先产出复用往次结果的图片，再按清单顺序产出新判别的
+
+    @param judge_timeout {float} 单个判别函数的时间预算（秒）
+    @param image_timeout {float} 单张图片的时间预算（秒）
+    @param layout_sizes {dict} {别名: 模板尺寸}，见 ocr2.load_layout_sizes
+    @return {Iterator[tuple]} (图片名, 类别, 耗时秒)，复用的结果耗时为0，超时的图片类别为 timeout
+    """
+    images = list_batch_images(images_dir)
+    # 图片内容和相关判别函数都没变的，直接复用往次的判别结果，不再分发
+    hash_index = load_hash_index()
+    content_keys = get_content_keys(images_dir)
+    signature = get_judge_signature(build_judge_functions(judge_sources, layout_sizes))
+    cached = {}
+    for name, _ in images:
+        stored = lookup_classification(hash_index, content_keys.get(name), signature)
+        if stored is not None:
+            cached[name] = stored
+    if cached:
+        print(f"[缓存] {len(cached)} 张图片复用往次判别结果")
+        for name, image_type in cached.items():
+            yield name, image_type, 0.0
+    pending = [(name, path) for name, path in images if name not in cached]
+
+    judged = {}
+    state = new_guard_state()
+    try:
+        for filename, image_type, elapsed in iter_classify(pending, judge_sources, get_image_info(images_dir),
+                                                           workers, judge_timeout=judge_timeout,
+                                                           image_timeout=image_timeout, guard_state=state,
+                                                           layout_sizes=layout_sizes):
+            judged[filename] = image_type
+            yield filename, image_type, elapsed
+    finally:
+        # 中途停止时也保存已判别部分的结果
+        if judge_timeout or image_timeout:
+            print_slow_summary(state)
+        # 有别名被停用时，其余图片的结果不完整，不写入缓存
+        if not state['disabled'] and judged:
+            for filename, image_type in judged.items():
+                store_classification(hash_index, content_keys.get(filename), image_type, signature)
+            save_hash_index(hash_index)
+
+
+def classify_images(images_dir: str, judge_sources: dict, workers: int = None,
+                    on_progress: Callable = None, judge_timeout: float = None,
+                    image_timeout: float = None, layout_sizes: dict = None) -> Dict[str, str]:
+    """
+    多进程判别批次目录中的所有图片
+
+    @param on_progress {Callable} on_progress(已判别数)
+    @return {Dict[str, str]} 图片名到类型的映射，按批次清单顺序
+    """
+    results = {}
+    for filename, image_type, _ in iter_classify_images(images_dir, judge_sources, workers,
+                                                        judge_timeout, image_timeout, layout_sizes):
+        results[filename] = image_type
+        if on_progress:
+            on_progress(len(results))
+    return order_by_batch(results, images_dir)
+
+
+def print_slow_summary(state: dict, slow_ms: float = 50.0):
+    """
+    打印分类小结：超时的别名，以及平均耗时超过 slow_ms 毫秒的别名
+    """
+    lines = []
+    for alias, count in sorted(state['timeouts'].items(), key=lambda kv: -kv[1]):
+        note = '，已停用' if alias in state['disabled'] else ''
+        lines.append(f"  {alias}: 超时 {count} 次{note}")
+    for alias, entry in state['stats'].items():
+        calls = entry.get('calls', 0)
+        mean_ms = entry.get('time', 0.0) / calls * 1000 if calls else 0.0
+        if mean_ms > slow_ms and alias not in state['timeouts']:
+            lines.append(f"  {alias}: 平均 {mean_ms:.1f} ms")
+    if lines:
+        print("[判别] 较慢的别名:\n" + '\n'.join(lines))
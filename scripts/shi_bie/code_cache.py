@@ -0,0 +1,140 @@
+"""
+方案代码的编译缓存
+
+判别方案、预处理方案、后处理方案都是保存在 shared_data.pkl 里的源码字符串。
+按源码文本的哈希缓存编译好的 code 对象：进程内放在字典里，每个识别区直接 exec 已编译的代码；
+同时用 marshal 写到 shared_data.pkl 旁边的 shared_data.codecache，下次启动不必再编译。
+方案被修改后源码哈希随之改变，自然会重新编译，不需要手动清理。
+"""
+import os
+import sys
+import marshal
+import hashlib
+import threading
+import importlib.util
+
+CACHE_NAME = 'shared_data.codecache'
+# 缓存文件最多保留的条目数，超出时丢弃最久未用的
+MAX_ENTRIES = 512
+
+_lock = threading.Lock()
+_codes = {}       # {源码哈希: code对象}，按最近使用排序
+_loaded = False
+_dirty = False
+
+
+def get_cache_path() -> str:
+    current_dir = os.path.dirname(os.path.abspath(__file__))  # scripts/shi_bie
+    project_dir = os.path.dirname(os.path.dirname(current_dir))
+    return os.path.join(project_dir, 'mu_ban', CACHE_NAME)
+
+
+def source_key(source: str, filename: str = '<scheme>') -> str:
+    """
+    源码的缓存键；带上解释器的字节码版本，换了Python版本时旧缓存自动失效
+    """
+    h = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+    h.update(filename.encode('utf-8') + b'\0')
+    h.update(source.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _read_cache_file() -> dict:
+    path = get_cache_path()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(len(importlib.util.MAGIC_NUMBER))
+            if magic != importlib.util.MAGIC_NUMBER:
+                return {}
+            codes = marshal.load(f)
+        return codes if isinstance(codes, dict) else {}
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        print(f"读取代码缓存失败: {e}")
+        return {}
+
+
+def _ensure_loaded():
+    global _loaded
+    if not _loaded:
+        disk = _read_cache_file()
+        disk.update(_codes)
+        _codes.clear()
+        _codes.update(disk)
+        _loaded = True
+
+
+def compile_cached(source: str, filename: str = '<scheme>'):
+    """
+    取得源码对应的 code 对象，未缓存时编译并记入缓存
+
+    @param source {str} 方案源码
+    @param filename {str} 编译时使用的文件名，出错信息中显示
+    @return {code} 编译好的代码，语法错误时抛出 SyntaxError
+    """
+    global _dirty
+    key = source_key(source, filename)
+    with _lock:
+        _ensure_loaded()
+        code = _codes.pop(key, None)
+        if code is not None:
+            _codes[key] = code
+            return code
+    code = compile(source, filename, 'exec')
+    with _lock:
+        _codes[key] = code
+        _dirty = True
+    return code
+
+
+def save_code_cache():
+    """
+    把本进程新编译的代码写入缓存文件；先与磁盘上的内容合并，避免覆盖其他进程写入的条目
+    """
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        merged = _read_cache_file()
+        for key in _codes:
+            merged.pop(key, None)
+        merged.update(_codes)
+        # 超出上限时丢弃最旧的条目
+        for key in list(merged)[:max(0, len(merged) - MAX_ENTRIES)]:
+            del merged[key]
+        path = get_cache_path()
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(importlib.util.MAGIC_NUMBER)
+                marshal.dump(merged, f)
+            os.replace(tmp_path, path)
+            _dirty = False
+        except (OSError, ValueError) as e:
+            print(f"保存代码缓存失败: {e}")
+
+
+def clear_code_cache():
+    """
+    清空进程内缓存并删除缓存文件
+    """
+    global _loaded, _dirty
+    with _lock:
+        _codes.clear()
+        _loaded = True
+        _dirty = False
+        try:
+            os.remove(get_cache_path())
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    # python code_cache.py --clear 删除缓存文件
+    if '--clear' in sys.argv[1:]:
+        clear_code_cache()
+        print(f"已删除代码缓存: {get_cache_path()}")
+    else:
+        codes = _read_cache_file()
+        print(f"代码缓存: {get_cache_path()}，共 {len(codes)} 条")
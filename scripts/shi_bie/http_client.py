@@ -0,0 +1,77 @@
+"""
+共享的 HTTP 客户端
+
+每次 requests.get / requests.request 都会新建一条 TCP + TLS 连接，每个识别区都要多一次握手。
+这里整个进程共用一个带连接池的 requests.Session，同一主机的连接保持长连接复用；
+连接池大小与识别并发数一致，所有请求都带默认超时，网络卡住时不会让识别线程一直挂着。
+"""
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# 每个主机保留的长连接数，ocr3.create_ocr_pool 会按 WORKERS 调整
+DEFAULT_POOL_SIZE = 8
+# (连接超时, 读取超时)，单位秒
+DEFAULT_TIMEOUT = (5, 30)
+
+# 网络错误（连接失败、超时等）的基类，调用方不必再单独导入 requests
+RequestException = requests.RequestException
+
+_lock = threading.Lock()
+_session = None
+_pool_size = DEFAULT_POOL_SIZE
+_timeout = DEFAULT_TIMEOUT
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    # 重试由调用方按接口的错误码处理，这里不自动重试
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def configure(pool_size: int = None, timeout=None):
+    """
+    调整连接池大小和默认超时；连接池大小变化时重建会话
+
+    @param pool_size {int} 每个主机的最大长连接数
+    @param timeout {float|tuple} 默认超时，秒数或 (连接超时, 读取超时)
+    """
+    global _session, _pool_size, _timeout
+    with _lock:
+        if timeout is not None:
+            _timeout = timeout
+        if pool_size and pool_size != _pool_size:
+            _pool_size = pool_size
+            if _session is not None:
+                _session.close()
+                _session = None
+
+
+def get_session() -> requests.Session:
+    """
+    进程共用的会话，第一次调用时创建
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _build_session(_pool_size)
+        return _session
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    用共享会话发送请求，参数同 requests.request；未指定 timeout 时使用默认超时
+    """
+    kwargs.setdefault('timeout', _timeout)
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request('POST', url, **kwargs)
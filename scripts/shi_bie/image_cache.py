@@ -0,0 +1,158 @@
+"""
+解码后图片的共享缓存
+
+分类、识别和结果浏览都通过 read_image 读取图片：同一张图片在一个进程里只解码一次，
+按最近最少使用淘汰，缓存占用的内存不超过预算。
+缓存键包含文件的大小和修改时间，批次目录里同名文件被替换后不会读到旧图。
+缓存保存自己的一份，每次读取都返回新的副本：判别函数、预处理方案原地修改图片不会出错，也不会改坏缓存。
+复制一张 1024x768 的彩色图约 0.3 毫秒，仍远快于重新解码。
+"""
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+from image_source import imread_source, split_archive_source
+
+# 默认内存预算（MB），约可缓存两百张 1024x768 的彩色图
+DEFAULT_BUDGET_MB = 512
+
+
+class DecodedImageCache:
+    """
+    按内存预算淘汰的 LRU 图片缓存，线程安全
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        @return {np.ndarray|None} 缓存图片的副本，调用方可以随意修改
+        """
+        with self._lock:
+            image = self._items.get(key)
+            if image is None:
+                return None
+            self._items.move_to_end(key)
+        # 缓存里的数组不会被修改，复制不必持锁
+        return image.copy()
+
+    def put(self, key, image: np.ndarray):
+        """
+        缓存图片的副本，调用方之后修改 image 不影响缓存
+        """
+        if image is None or image.nbytes > self.max_bytes:
+            return
+        image = image.copy()
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            self._items[key] = image
+            self.current_bytes += image.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def set_budget(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self._items and self.current_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def count(self, hit: bool):
+        """
+        记录一次命中/未命中；缓存由流水线的多个线程共用，计数也要持锁
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'images': len(self._items), 'bytes': self.current_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+_cache = DecodedImageCache(DEFAULT_BUDGET_MB << 20)
+
+
+def get_image_cache() -> DecodedImageCache:
+    return _cache
+
+
+def _file_identity(source: str):
+    """
+    图片来源对应文件的 (路径, 大小, 修改时间)，压缩包成员取压缩包本身
+    """
+    parts = split_archive_source(source)
+    path = parts[0] if parts is not None else source
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _derive(image: np.ndarray, flags: int):
+    """
+    从已缓存的原图得到缩小/灰度版本，比重新解码快得多
+    """
+    gray_flags = {cv2.IMREAD_GRAYSCALE: 1, cv2.IMREAD_REDUCED_GRAYSCALE_2: 2,
+                  cv2.IMREAD_REDUCED_GRAYSCALE_4: 4, cv2.IMREAD_REDUCED_GRAYSCALE_8: 8}
+    color_flags = {cv2.IMREAD_REDUCED_COLOR_2: 2, cv2.IMREAD_REDUCED_COLOR_4: 4, cv2.IMREAD_REDUCED_COLOR_8: 8}
+    if flags in gray_flags:
+        factor = gray_flags[flags]
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    elif flags in color_flags:
+        factor = color_flags[flags]
+    else:
+        return None
+    if factor > 1:
+        height, width = image.shape[:2]
+        size = (max(1, -(-width // factor)), max(1, -(-height // factor)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return image
+
+
+def read_image(source: str, flags: int = cv2.IMREAD_COLOR):
+    """
+    通过共享缓存读取图片，用法同 image_source.imread_source
+
+    @param source {str} 图片路径或压缩包成员来源
+    @param flags {int} cv2.imread 标志
+    @return {np.ndarray|None} 图片数组（调用方独有的副本），无法读取时返回None
+    """
+    identity = _file_identity(source)
+    if identity is None:
+        return imread_source(source, flags)
+    key = (source, identity, flags)
+    image = _cache.get(key)
+    if image is not None:
+        _cache.count(True)
+        return image
+    # 缩小/灰度解码时，原图已在缓存中就直接缩小
+    if flags != cv2.IMREAD_COLOR:
+        full = _cache.get((source, identity, cv2.IMREAD_COLOR))
+        if full is not None:
+            image = _derive(full, flags)
+    if image is None:
+        _cache.count(False)
+        image = imread_source(source, flags)
+    else:
+        _cache.count(True)
+    _cache.put(key, image)
+    return image
@@ -0,0 +1,156 @@
+"""
+只读文件头的图片探测
+
+根据文件开头的魔数判断真实格式，并从文件头中解析宽高，不解码像素。
+入库时用它过滤改了扩展名的非图片文件，探测到的宽高记录在批次清单里供后续阶段使用。
+"""
+import io
+import struct
+
+# 读取的文件头长度，足够覆盖 PNG/GIF/BMP/WEBP 的尺寸字段
+HEADER_SIZE = 64
+
+
+def _probe_jpeg(f):
+    """
+    逐个跳过 JPEG 段，直到 SOFn 段读出宽高
+    """
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        # 填充字节
+        while code == 0xFF:
+            b = f.read(1)
+            if not b:
+                return None
+            code = b[0]
+        # 无长度的独立标记
+        if code in (0x01, 0xD8) or 0xD0 <= code <= 0xD7:
+            continue
+        if code == 0xD9 or code == 0xDA:
+            # 到了图像数据还没找到 SOF
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        # SOF0~SOF15，排除 DHT(C4)、JPG(C8)、DAC(CC)
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def _probe_tiff(f, head):
+    """
+    读取 TIFF 第一个 IFD 中的 ImageWidth(256) / ImageLength(257)
+    """
+    endian = '<' if head[:2] == b'II' else '>'
+    offset = struct.unpack(endian + 'I', head[4:8])[0]
+    f.seek(offset)
+    count_bytes = f.read(2)
+    if len(count_bytes) < 2:
+        return None
+    count = struct.unpack(endian + 'H', count_bytes)[0]
+    width = height = None
+    for _ in range(count):
+        entry = f.read(12)
+        if len(entry) < 12:
+            break
+        tag, field_type = struct.unpack(endian + 'HH', entry[:4])
+        if field_type == 3:  # SHORT
+            value = struct.unpack(endian + 'H', entry[8:10])[0]
+        else:  # LONG
+            value = struct.unpack(endian + 'I', entry[8:12])[0]
+        if tag == 256:
+            width = value
+        elif tag == 257:
+            height = value
+        if width is not None and height is not None:
+            return width, height
+    return None
+
+
+def _probe_webp(head):
+    """
+    解析 VP8 / VP8L / VP8X 三种 WEBP 头
+    """
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and len(head) >= 30:
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(head) >= 25:
+        b = head[21:25]
+        width = 1 + (((b[1] & 0x3F) << 8) | b[0])
+        height = 1 + (((b[3] & 0x0F) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+        return width, height
+    if chunk == b'VP8X' and len(head) >= 30:
+        width = 1 + int.from_bytes(head[24:27], 'little')
+        height = 1 + int.from_bytes(head[27:30], 'little')
+        return width, height
+    return None
+
+
+def _probe_file(f):
+    """
+    从已打开的二进制文件对象中探测格式与尺寸
+
+    @return {tuple} (格式, (宽, 高))，不是可识别的图片时格式为None
+    """
+    head = f.read(HEADER_SIZE)
+    if head[:3] == b'\xff\xd8\xff':
+        return 'jpeg', _probe_jpeg(f)
+    if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+        return 'png', struct.unpack('>II', head[16:24])
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif', struct.unpack('<HH', head[6:10])
+    if head[:2] == b'BM' and len(head) >= 26:
+        header_size = struct.unpack('<I', head[14:18])[0]
+        if header_size == 12:
+            return 'bmp', struct.unpack('<HH', head[18:22])
+        width, height = struct.unpack('<ii', head[18:26])
+        return 'bmp', (width, abs(height))
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff', _probe_tiff(f, head)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp', _probe_webp(head)
+    return None, None
+
+
+def _to_result(fmt, size):
+    if fmt is None or not size or size[0] <= 0 or size[1] <= 0:
+        return None
+    return {'format': fmt, 'width': int(size[0]), 'height': int(size[1])}
+
+
+def probe_image(path: str):
+    """
+    探测图片格式与尺寸
+
+    @param path {str} 图片路径
+    @return {dict|None} {'format': 'jpeg'/'png'/..., 'width': int, 'height': int}，不是可识别的图片时返回None
+    """
+    try:
+        with open(path, 'rb') as f:
+            fmt, size = _probe_file(f)
+    except (OSError, struct.error) as e:
+        print(f"探测图片失败: {path}, {e}")
+        return None
+    return _to_result(fmt, size)
+
+
+def probe_image_bytes(data: bytes):
+    """
+    探测内存中图片数据（如压缩包成员）的格式与尺寸，返回值同 probe_image
+    """
+    try:
+        fmt, size = _probe_file(io.BytesIO(data))
+    except struct.error:
+        return None
+    return _to_result(fmt, size)
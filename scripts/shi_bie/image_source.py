@@ -0,0 +1,170 @@
+"""
+图片来源：普通文件或压缩包成员
+
+压缩包（.zip / .tar / .tar.gz / .tgz）里的图片不解压到磁盘，用 "压缩包路径::成员名" 表示，
+读取时把成员内容读进内存后用 cv2.imdecode 解码。
+每个线程各自缓存打开的压缩包，按成员顺序读取时 tar.gz 只需顺序解压一遍。
+线程用完后要关闭缓存的句柄（close_archives；线程池见 ArchiveHandles），否则压缩包一直被占用，
+Windows 或共享目录上无法删除、替换，长时间运行的监视进程也会耗尽文件句柄。
+"""
+import os
+import threading
+import tarfile
+import zipfile
+import numpy as np
+import cv2
+
+ARCHIVE_EXTS = ('.zip', '.tar', '.tar.gz', '.tgz')
+ARCHIVE_SEP = '::'
+
+_local = threading.local()
+
+
+def is_archive_file(path: str) -> bool:
+    """
+    按扩展名判断是否为支持的压缩包
+    """
+    return path.lower().endswith(ARCHIVE_EXTS)
+
+
+def make_archive_source(archive_path: str, member: str) -> str:
+    return f'{os.path.abspath(archive_path)}{ARCHIVE_SEP}{member}'
+
+
+def split_archive_source(source: str):
+    """
+    拆分压缩包成员来源
+
+    @return {tuple|None} (压缩包路径, 成员名)，普通文件返回None
+    """
+    if ARCHIVE_SEP not in source:
+        return None
+    archive_path, member = source.split(ARCHIVE_SEP, 1)
+    if not is_archive_file(archive_path):
+        return None
+    return archive_path, member
+
+
+def is_archive_source(source: str) -> bool:
+    return split_archive_source(source) is not None
+
+
+def _thread_cache() -> dict:
+    cache = getattr(_local, 'archives', None)
+    if cache is None:
+        cache = _local.archives = {}
+    return cache
+
+
+def _close_cache(cache: dict):
+    for _, handle, _ in cache.values():
+        handle.close()
+    cache.clear()
+
+
+def _open_archive(archive_path: str):
+    """
+    取得本线程缓存的压缩包句柄
+
+    @return {tuple} ('zip', ZipFile, None) 或 ('tar', TarFile, {成员名: TarInfo})
+    """
+    cache = _thread_cache()
+    handle = cache.get(archive_path)
+    if handle is None:
+        if archive_path.lower().endswith('.zip'):
+            handle = ('zip', zipfile.ZipFile(archive_path), None)
+        else:
+            tar = tarfile.open(archive_path, 'r:*')
+            handle = ('tar', tar, {m.name: m for m in tar.getmembers() if m.isfile()})
+        cache[archive_path] = handle
+    return handle
+
+
+def close_archives():
+    """
+    关闭本线程缓存的所有压缩包
+    """
+    _close_cache(getattr(_local, 'archives', None) or {})
+
+
+class ArchiveHandles:
+    """
+    线程池各工作线程缓存的压缩包句柄。ThreadPoolExecutor 没有线程结束时的回调，
+    把 register 作为线程池的 initializer，线程池结束（with 块退出）后调用 close 统一关闭
+    """
+    def __init__(self):
+        self._caches = []
+        self._lock = threading.Lock()
+
+    def register(self):
+        cache = _thread_cache()
+        with self._lock:
+            self._caches.append(cache)
+
+    def close(self):
+        with self._lock:
+            caches, self._caches = self._caches, []
+        for cache in caches:
+            _close_cache(cache)
+
+
+def iter_archive_images(archive_path: str, is_image_name):
+    """
+    按压缩包内顺序列出图片成员名
+
+    @param archive_path {str} 压缩包路径
+    @param is_image_name {Callable} 按文件名判断是否为图片
+    """
+    try:
+        if archive_path.lower().endswith('.zip'):
+            with zipfile.ZipFile(archive_path) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and is_image_name(info.filename):
+                        yield info.filename
+        else:
+            with tarfile.open(archive_path, 'r:*') as tar:
+                for member in tar:
+                    if member.isfile() and is_image_name(member.name):
+                        yield member.name
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        print(f"读取压缩包失败: {archive_path}, {e}")
+
+
+def read_source_bytes(source: str) -> bytes:
+    """
+    读取图片来源的原始字节
+    """
+    parts = split_archive_source(source)
+    if parts is None:
+        with open(source, 'rb') as f:
+            return f.read()
+    archive_path, member = parts
+    kind, handle, members = _open_archive(archive_path)
+    if kind == 'zip':
+        return handle.read(member)
+    f = handle.extractfile(members[member])
+    return f.read()
+
+
+def decode_bytes(data: bytes, flags: int = cv2.IMREAD_COLOR):
+    """
+    解码内存中的图片数据，失败时返回None
+    """
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+
+def imread_source(source: str, flags: int = cv2.IMREAD_COLOR):
+    """
+    读取图片来源为 np.ndarray，普通文件走 cv2.imread，压缩包成员在内存中解码
+
+    @return {np.ndarray|None} 图片，无法读取时返回None
+    """
+    if not is_archive_source(source):
+        return cv2.imread(source, flags)
+    try:
+        return decode_bytes(read_source_bytes(source), flags)
+    except (OSError, KeyError, zipfile.BadZipFile, tarfile.TarError) as e:
+        print(f"读取压缩包成员失败: {source}, {e}")
+        return None
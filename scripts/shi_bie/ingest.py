@@ -0,0 +1,706 @@
+"""
+待识别图片入库
+
+默认不再把图片逐字节复制到 lin_shi/dai_shi_bie，而是在该目录下写一份
+manifest.json 记录源文件路径；也可以选择硬链接/reflink（文件系统不支持时退回复制）。
+后续的判别、识别、浏览阶段统一通过 list_batch_images / get_image_path 读取图片。
+
+入库时先只读文件头探测真实格式和宽高（image_probe.py），不是图片的文件直接拒收；
+同时计算字节哈希作为内容键，入库时不解码：同一批次内字节相同的图片只保留一个工作项，
+往次运行已识别过的图片会被标记，识别阶段可直接复用 lin_shi/hash_index.json 中保存的结果。
+字节不同、像素相同的图片（如重新导出的）在识别前由 match_pixel_key 按已解码的图片认领往次结果。
+
+拖入的 .zip / .tar(.gz) 不解压，成员以 "压缩包路径::成员名" 登记（见 image_source.py），图片名即成员名。
+
+命令行入库：python ingest.py 文件或文件夹... [--mode manifest|link|copy]
+"""
+import os
+import sys
+import copy
+import json
+import argparse
+import time
+import shutil
+import hashlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from image_probe import probe_image, probe_image_bytes
+from image_source import (is_archive_file, is_archive_source, split_archive_source, make_archive_source,
+                          iter_archive_images, read_source_bytes, ArchiveHandles)
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp')
+MANIFEST_NAME = 'manifest.json'
+HASH_INDEX_NAME = 'hash_index.json'
+JOBS_DIR_NAME = 'jobs'
+
+# 入库模式
+INGEST_MANIFEST = 'manifest'  # 只记录源文件路径，不复制
+INGEST_LINK = 'link'          # 硬链接或reflink，都不支持时退回复制
+INGEST_COPY = 'copy'          # 原有行为：shutil.copy2 复制
+
+# Linux 下 reflink 使用的 ioctl 编号（FICLONE）
+_FICLONE = 0x40049409
+
+
+def get_lin_shi_dir() -> str:
+    """
+    获取临时目录 lin_shi
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))  # scripts/shi_bie
+    scripts_dir = os.path.dirname(current_dir)  # scripts
+    project_dir = os.path.dirname(scripts_dir)  # 项目根目录
+    return os.path.join(project_dir, 'lin_shi')
+
+
+def get_images_dir() -> str:
+    """
+    获取默认的待识别图片目录 lin_shi/dai_shi_bie（单独运行各 ocrN.py 时使用）
+    """
+    return os.path.join(get_lin_shi_dir(), 'dai_shi_bie')
+
+
+def create_job() -> tuple:
+    """
+    为一次运行创建独立的作业目录 lin_shi/jobs/<job_id>，多个批次可以同时运行互不干扰
+
+    @return {tuple} (job_id, 作业目录)
+    """
+    job_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    job_dir = get_job_dir(job_id)
+    os.makedirs(job_dir)
+    return job_id, job_dir
+
+
+def get_job_dir(job_id: str) -> str:
+    return os.path.join(get_lin_shi_dir(), JOBS_DIR_NAME, job_id)
+
+
+def remove_job(job_id: str):
+    """
+    删除作业目录（清单、链接/复制进来的图片），源文件不受影响
+    """
+    job_dir = get_job_dir(job_id)
+    if os.path.exists(job_dir):
+        clear_batch_dir(job_dir)
+        try:
+            os.rmdir(job_dir)
+        except OSError as e:
+            print(f'删除作业目录失败: {job_dir}, {e}')
+
+
+def is_image_file(file_path: str) -> bool:
+    """
+    按扩展名判断文件是否为图片
+
+    @param file_path {str} 文件路径
+    @return {bool} 是否为图片
+    """
+    return file_path.lower().endswith(IMAGE_EXTS)
+
+
+def load_manifest(images_dir: str) -> dict:
+    """
+    读取批次清单，不存在或损坏时返回空清单
+
+    @param images_dir {str} 待识别图片目录
+    @return {dict} {'images': {图片名: {'source', 'mode', 'sha256', 'content_key', 'cached',
+                                         'format', 'width', 'height'}},
+                    'duplicates': {重复图片名: 保留的图片名}}
+    """
+    manifest_path = os.path.join(images_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except Exception as e:
+            print(f"读取批次清单失败: {e}")
+    manifest.setdefault('images', {})
+    manifest.setdefault('duplicates', {})
+    return manifest
+
+
+def save_manifest(images_dir: str, manifest: dict):
+    """
+    保存批次清单（先写临时文件再替换，避免读到半截的json）
+    """
+    os.makedirs(images_dir, exist_ok=True)
+    manifest_path = os.path.join(images_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """
+    尝试用 FICLONE 做写时复制克隆，仅 Linux 的 btrfs/xfs 等文件系统支持
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.unlink(dst)
+        return False
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """
+    依次尝试硬链接、reflink，都不行时复制
+
+    @return {str} 实际使用的方式：hardlink / reflink / copy
+    """
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+    if _reflink(src, dst):
+        return 'reflink'
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def file_sha256(path: str) -> str:
+    """
+    计算文件内容的sha256（分块读取）
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _image_hash(image):
+    if image is None:
+        return None
+    h = hashlib.sha256(f'{image.shape}{image.dtype}'.encode('utf-8'))
+    h.update(np.ascontiguousarray(image).tobytes())
+    return h.hexdigest()
+
+
+def source_name(source: str) -> str:
+    """
+    图片来源对应的图片名：压缩包成员为成员名，普通文件为文件名
+    """
+    parts = split_archive_source(source)
+    if parts is not None:
+        return parts[1]
+    return os.path.basename(source)
+
+
+def load_hash_index() -> dict:
+    """
+    读取跨运行的内容哈希索引 lin_shi/hash_index.json
+
+    @return {dict} {'bytes': {sha256: content_key},
+                    'pixels': {像素哈希: content_key},
+                    'results': {content_key: {'name', 'alias', 'scheme', 'results', 'time'}},
+                    'classify': {content_key: {'type', 'judges'}}}
+    """
+    index_path = os.path.join(get_lin_shi_dir(), HASH_INDEX_NAME)
+    index = {}
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except Exception as e:
+            print(f"读取哈希索引失败: {e}")
+    index.setdefault('bytes', {})
+    index.setdefault('pixels', {})
+    index.setdefault('results', {})
+    index.setdefault('classify', {})
+    return index
+
+
+def save_hash_index(index: dict):
+    """
+    保存哈希索引；先与磁盘上的最新内容合并，避免覆盖其他批次写入的条目
+    """
+    lin_shi_dir = get_lin_shi_dir()
+    os.makedirs(lin_shi_dir, exist_ok=True)
+    merged = load_hash_index()
+    for key in ('bytes', 'pixels', 'results', 'classify'):
+        merged[key].update(index.get(key, {}))
+    index_path = os.path.join(lin_shi_dir, HASH_INDEX_NAME)
+    tmp_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+
+def match_pixel_key(index: dict, content_key: str, image) -> str:
+    """
+    入库时只按字节哈希建内容键，不为算像素哈希多解码一次；识别前拿到全尺寸解码的图片后，
+    再按像素哈希查找往次字节不同、像素相同的图片，找到时改用它的内容键，并把本图的字节哈希指向它，下次入库直接命中
+
+    @param image {np.ndarray} 按 IMREAD_COLOR 解码的图片
+    @return {str} 应使用的内容键
+    """
+    if not content_key or not content_key.startswith('bytes:'):
+        return content_key
+    pixel_key = _image_hash(image)
+    if pixel_key is None:
+        return content_key
+    pixels = index.setdefault('pixels', {})
+    known = pixels.get(pixel_key)
+    if known is None and (pixel_key in index['results'] or pixel_key in index.get('classify', {})):
+        # 旧版入库时直接以像素哈希为内容键
+        known = pixel_key
+    if known is None or known == content_key:
+        pixels[pixel_key] = content_key
+        return content_key
+    index['bytes'][content_key[len('bytes:'):]] = known
+    return known
+
+
+def lookup_stored_result(index: dict, content_key: str, alias: str, scheme: str = None):
+    """
+    查找往次运行保存的识别结果，类别一致、且识别方案没有修改过时才复用
+
+    @param scheme {str} 当前识别方案的哈希，见 ocr3.get_scheme_hash；为None时不比较方案
+    @return {list|None} 识别结果列表
+    """
+    stored = index['results'].get(content_key) if content_key else None
+    if stored and stored.get('alias') == alias and (scheme is None or stored.get('scheme') == scheme):
+        return stored.get('results')
+    return None
+
+
+def store_result(index: dict, content_key: str, img_name: str, alias: str, results: list, scheme: str = None):
+    """
+    把一张图片的识别结果记入哈希索引
+
+    @param scheme {str} 识别时所用识别方案的哈希
+    """
+    if not content_key:
+        return
+    index['results'][content_key] = {
+        'name': img_name,
+        'alias': alias,
+        'scheme': scheme,
+        'results': results,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def lookup_classification(index: dict, content_key: str, signature: list):
+    """
+    查找往次运行保存的判别结果
+
+    判别结果只取决于字典顺序在命中别名之前（含）的判别函数，这些别名及其源码哈希都没变时才复用；
+    都没命中的 unknown 要求全部判别函数不变（新增别名也会让它失效）。
+
+    @param signature {list} 当前的 [[别名, 源码哈希], ...]，按字典顺序
+    @return {str|None} 判别结果
+    """
+    stored = index.get('classify', {}).get(content_key) if content_key else None
+    if not stored:
+        return None
+    judges = stored.get('judges') or []
+    if stored.get('type') == 'unknown':
+        valid = judges == signature
+    else:
+        valid = bool(judges) and judges == signature[:len(judges)]
+    return stored.get('type') if valid else None
+
+
+def store_classification(index: dict, content_key: str, img_type: str, signature: list):
+    """
+    把一张图片的判别结果记入哈希索引，只记录影响结果的判别函数；读取失败/超时的不记录
+    """
+    if not content_key or img_type in ('unreadable', 'timeout'):
+        return
+    if any(source is None for _, source in signature):
+        return
+    if img_type == 'unknown':
+        judges = signature
+    else:
+        aliases = [alias for alias, _ in signature]
+        if img_type not in aliases:
+            return
+        judges = signature[:aliases.index(img_type) + 1]
+    index.setdefault('classify', {})[content_key] = {'type': img_type, 'judges': [list(j) for j in judges]}
+
+
+def scan_image_files(paths: list, cancel_event=None):
+    """
+    逐个产出拖入的文件/文件夹中的图片路径（os.scandir 非递归栈实现，几万个文件也不会爆栈）
+
+    @param paths {list} 文件或文件夹路径
+    @param cancel_event {threading.Event} 取消标志
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            if is_archive_file(path):
+                for member in iter_archive_images(path, is_image_file):
+                    yield make_archive_source(path, member)
+            # 单独拖入的文件按文件头判断，扩展名不对也能收进来
+            elif is_image_file(path) or probe_image(path):
+                yield path
+            continue
+        stack = [path]
+        while stack:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                print(f"读取文件夹失败: {current}, {e}")
+                continue
+            sub_dirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    sub_dirs.append(entry.path)
+                elif is_image_file(entry.name):
+                    yield entry.path
+                elif is_archive_file(entry.name):
+                    for member in iter_archive_images(entry.path, is_image_file):
+                        yield make_archive_source(entry.path, member)
+            stack.extend(reversed(sub_dirs))
+
+
+def _hash_one(image_file: str, known_bytes: dict, cancel_event):
+    """
+    工作线程：探测文件头并计算单个文件的内容键，不修改共享索引
+
+    @return {tuple|None} (sha256, content_key, 文件大小, 探测信息)，已取消时返回None
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        return None
+    if is_archive_source(image_file):
+        # 压缩包成员：读进内存后探测、哈希，不落盘
+        data = read_source_bytes(image_file)
+        probe = probe_image_bytes(data)
+        if probe is None:
+            raise ValueError('文件头不是可识别的图片格式')
+        sha256 = hashlib.sha256(data).hexdigest()
+        return sha256, known_bytes.get(sha256) or f'bytes:{sha256}', len(data), probe
+    probe = probe_image(image_file)
+    if probe is None:
+        raise ValueError('文件头不是可识别的图片格式')
+    sha256 = file_sha256(image_file)
+    return sha256, known_bytes.get(sha256) or f'bytes:{sha256}', os.path.getsize(image_file), probe
+
+
+def _place_one(image_file: str, target_path: str, mode: str, cancel_event):
+    """
+    工作线程：按入库模式放置单个文件
+
+    @return {tuple|None} (source, 实际方式)，已取消时返回None
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        return None
+    if is_archive_source(image_file):
+        # 压缩包成员只能按来源登记
+        return image_file, 'archive'
+    if mode == INGEST_MANIFEST:
+        # 同名的旧副本会挡住清单里的源路径，先删掉
+        if os.path.lexists(target_path):
+            os.unlink(target_path)
+        return os.path.abspath(image_file), 'manifest'
+    if mode == INGEST_LINK:
+        return target_path, link_or_copy(image_file, target_path)
+    shutil.copy2(image_file, target_path)
+    return target_path, 'copy'
+
+
+def _run_parallel(func, items: list, max_workers):
+    """
+    用线程池执行 func(item)，按输入顺序产出 (item, 结果, 异常)；结束后关闭工作线程打开的压缩包
+    """
+    handles = ArchiveHandles()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, initializer=handles.register) as pool:
+            futures = [pool.submit(func, item) for item in items]
+            for item, future in zip(items, futures):
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+    finally:
+        handles.close()
+
+
+def ingest_images(image_files: list, images_dir: str, mode: str = INGEST_MANIFEST,
+                  max_workers: int = None, progress_callback=None, cancel_event=None,
+                  names: dict = None) -> dict:
+    """
+    把图片登记到批次清单中
+
+    分两步并行执行：先用线程池计算内容哈希并按输入顺序去重，再并行放置（链接/复制）保留下来的图片。
+    取消时不写入清单，已放置的文件会被删除。
+
+    @param image_files {list} 源图片路径列表
+    @param images_dir {str} 待识别图片目录
+    @param mode {str} 入库模式 INGEST_MANIFEST / INGEST_LINK / INGEST_COPY
+    @param max_workers {int} 线程数，默认由线程池决定
+    @param progress_callback {Callable} progress_callback(阶段, 已完成数, 总数, 已处理字节数)
+    @param cancel_event {threading.Event} 取消标志
+    @param names {dict} {源路径: 图片名}，不在其中的按 source_name 取名；图片名可以含子目录，只用于 INGEST_MANIFEST
+    @return {dict} {'ingested': [图片名], 'overwritten': [图片名], 'errors': [(图片名, 错误信息)],
+                    'duplicates': [(图片名, 保留的图片名)], 'cached': [往次已识别的图片名],
+                    'cancelled': bool}
+    """
+    os.makedirs(images_dir, exist_ok=True)
+    manifest = load_manifest(images_dir)
+    images = manifest['images']
+    duplicates = manifest['duplicates']
+    index = load_hash_index()
+    # 本批次已有图片的内容键 -> 图片名
+    content_owner = {info['content_key']: name for name, info in images.items() if info.get('content_key')}
+    ingested, overwritten, errors = [], [], []
+    duplicate_files, cached_files = [], []
+    report = {
+        'ingested': ingested,
+        'overwritten': overwritten,
+        'errors': errors,
+        'duplicates': duplicate_files,
+        'cached': cached_files,
+        'cancelled': False,
+    }
+    total = len(image_files)
+    # tar 包只能顺序解压，有 tar 成员时哈希阶段单线程按顺序读取
+    hash_workers = max_workers
+    if any(is_archive_source(f) and not split_archive_source(f)[0].lower().endswith('.zip') for f in image_files):
+        hash_workers = 1
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    # 第一步：并行计算内容哈希，按输入顺序决定哪些是重复图片
+    to_place = []  # [(源路径, 图片名, sha256, content_key, 探测信息)]
+    pending = {}   # 本次新增的 图片名 -> to_place 下标，同名后来者覆盖前者
+    bytes_done = 0
+    hash_one = lambda f: _hash_one(f, index['bytes'], cancel_event)
+    for done, (image_file, hashed, error) in enumerate(_run_parallel(hash_one, image_files, hash_workers), 1):
+        file_name = names.get(image_file) if names else None
+        file_name = file_name or source_name(image_file)
+        if error is not None:
+            print(f"登记图片失败: {image_file}, {error}")
+            errors.append((file_name, str(error)))
+            continue
+        if hashed is None:
+            continue
+        sha256, content_key, size, probe = hashed
+        index['bytes'][sha256] = content_key
+        bytes_done += size
+        owner = content_owner.get(content_key)
+        if owner is not None and owner != file_name:
+            # 与本批次已有图片内容相同，合并为一个工作项
+            duplicates[file_name] = owner
+            duplicate_files.append((file_name, owner))
+        else:
+            if file_name in images or file_name in pending or (
+                    not is_archive_source(image_file) and os.path.exists(os.path.join(images_dir, file_name))):
+                overwritten.append(file_name)
+            if file_name in pending:
+                to_place[pending[file_name]] = None
+            pending[file_name] = len(to_place)
+            to_place.append((image_file, file_name, sha256, content_key, probe))
+            content_owner[content_key] = file_name
+        if progress_callback:
+            progress_callback('hash', done, total, bytes_done)
+    if cancelled():
+        report['cancelled'] = True
+        save_hash_index(index)
+        return report
+
+    # 第二步：并行放置保留下来的图片
+    to_place = [item for item in to_place if item is not None]
+    place_one = lambda item: _place_one(item[0], os.path.join(images_dir, item[1]), mode, cancel_event)
+    placed = []
+    bytes_done = 0
+    for done, (item, result, error) in enumerate(_run_parallel(place_one, to_place, max_workers), 1):
+        image_file, file_name, sha256, content_key, probe = item
+        if error is not None:
+            print(f"登记图片失败: {image_file}, {error}")
+            errors.append((file_name, str(error)))
+            continue
+        if result is None:
+            continue
+        source, used = result
+        placed.append(source)
+        cached = content_key in index['results']
+        images[file_name] = {
+            'source': source,
+            'mode': used,
+            'sha256': sha256,
+            'content_key': content_key,
+            'cached': cached,
+            'format': probe['format'],
+            'width': probe['width'],
+            'height': probe['height'],
+        }
+        duplicates.pop(file_name, None)
+        ingested.append(file_name)
+        if cached:
+            cached_files.append(file_name)
+        if progress_callback and used in ('hardlink', 'reflink', 'copy'):
+            bytes_done += os.path.getsize(source)
+            progress_callback('place', done, len(to_place), bytes_done)
+    if cancelled():
+        # 取消：删除已放进目录的文件，清单保持原样
+        for source in placed:
+            if mode != INGEST_MANIFEST and not is_archive_source(source) and os.path.dirname(source) == images_dir and os.path.lexists(source):
+                os.unlink(source)
+        report['cancelled'] = True
+        ingested.clear()
+        cached_files.clear()
+        save_hash_index(index)
+        return report
+    save_manifest(images_dir, manifest)
+    save_hash_index(index)
+    return report
+
+
+def list_batch_images(images_dir: str) -> list:
+    """
+    列出本批次所有待识别图片：先是清单中的图片，再是直接放进目录但未登记的图片
+
+    @param images_dir {str} 待识别图片目录
+    @return {list} [(图片名, 图片路径), ...]
+    """
+    if not os.path.isdir(images_dir):
+        return []
+    images = load_manifest(images_dir)['images']
+    result = [(name, info['source']) for name, info in images.items()]
+    for f in sorted(os.listdir(images_dir)):
+        if f not in images and is_image_file(f):
+            result.append((f, os.path.join(images_dir, f)))
+    return result
+
+
+def list_duplicate_images(images_dir: str) -> list:
+    """
+    列出内容重复、没有单独登记的图片，路径取保留的那一张
+
+    @return {list} [(图片名, 图片路径), ...]
+    """
+    if not os.path.isdir(images_dir):
+        return []
+    manifest = load_manifest(images_dir)
+    result = []
+    for name, owner in manifest['duplicates'].items():
+        info = manifest['images'].get(owner)
+        result.append((name, info['source'] if info else os.path.join(images_dir, owner)))
+    return result
+
+
+def expand_duplicates(images_dir: str, classify_result: dict, ocr_result: dict) -> tuple:
+    """
+    内容重复的图片只识别了保留的那一张，把它的类别和识别结果复制给每个重复的图片名（紧跟在保留的图片之后），
+    拖入多少个文件，结果和导出的excel就有多少行
+
+    @return {tuple} (classify_result, ocr_result)，新的字典
+    """
+    by_owner = {}
+    for name, owner in load_manifest(images_dir)['duplicates'].items():
+        by_owner.setdefault(owner, []).append(name)
+    if not by_owner:
+        return classify_result, ocr_result
+
+    def expand(result):
+        expanded = {}
+        for name, value in result.items():
+            expanded[name] = value
+            for duplicate in by_owner.get(name, []):
+                expanded.setdefault(duplicate, copy.deepcopy(value))
+        return expanded
+    return expand(classify_result), expand(ocr_result)
+
+
+def get_image_path(images_dir: str, img_name: str) -> str:
+    """
+    根据图片名取得实际读取路径
+    """
+    info = load_manifest(images_dir)['images'].get(img_name)
+    if info:
+        return info['source']
+    return os.path.join(images_dir, img_name)
+
+
+def get_content_keys(images_dir: str) -> dict:
+    """
+    获取本批次每张图片的内容键
+
+    @return {dict} {图片名: content_key}
+    """
+    images = load_manifest(images_dir)['images']
+    return {name: info.get('content_key') for name, info in images.items()}
+
+
+def get_image_info(images_dir: str) -> dict:
+    """
+    获取本批次每张图片的探测信息；清单中已有的直接用，未登记的散文件现场只读文件头探测
+
+    @return {dict} {图片名: {'format', 'width', 'height'} 或 None(不是图片)}
+    """
+    images = load_manifest(images_dir)['images']
+    info = {}
+    for name, path in list_batch_images(images_dir):
+        entry = images.get(name)
+        if entry and 'width' in entry:
+            info[name] = {'format': entry['format'], 'width': entry['width'], 'height': entry['height']}
+        else:
+            info[name] = probe_image(path)
+    return info
+
+
+def clear_batch_dir(images_dir: str):
+    """
+    清空批次目录（清单、链接/复制进来的图片），源文件不受影响
+    """
+    if not os.path.exists(images_dir):
+        return
+    for f in os.listdir(images_dir):
+        fp = os.path.join(images_dir, f)
+        try:
+            if os.path.isfile(fp) or os.path.islink(fp):
+                os.unlink(fp)
+            elif os.path.isdir(fp):
+                shutil.rmtree(fp)
+        except Exception as e:
+            print(f'清理临时文件失败: {fp}, {e}')
+
+
+def main():
+    """
+    命令行入库（无界面），支持图片、文件夹和 .zip / .tar(.gz) 压缩包
+    """
+    parser = argparse.ArgumentParser(description='把图片登记到待识别批次')
+    parser.add_argument('paths', nargs='+', help='图片、文件夹或压缩包')
+    parser.add_argument('--mode', choices=[INGEST_MANIFEST, INGEST_LINK, INGEST_COPY], default=INGEST_MANIFEST,
+                        help='入库模式')
+    parser.add_argument('--target', default=None, help='批次目录，默认 lin_shi/dai_shi_bie')
+    parser.add_argument('--workers', type=int, default=None, help='线程数')
+    args = parser.parse_args()
+    images_dir = args.target or get_images_dir()
+    image_files = list(scan_image_files(args.paths))
+    if not image_files:
+        print("没有找到任何图片文件")
+        return
+    report = ingest_images(image_files, images_dir, args.mode, max_workers=args.workers)
+    print(f"已登记 {len(report['ingested'])} 个图片到: {images_dir}")
+    print(f"内容重复 {len(report['duplicates'])} 个，往次已识别 {len(report['cached'])} 个，失败 {len(report['errors'])} 个")
+    for file_name, error in report['errors']:
+        print(f"  {file_name}: {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""
+判别函数用的向量化图像特征库
+
+pkl2 中的判别方案经常逐行/逐列调用 np.std 检查彩色条。这里的函数一次 NumPy 调用算出整段的
+统计量，load_judge_functions 会把它们和 np、cv2 一起注入判别函数的命名空间，判别方案里可以直接调用，
+例如 rows_below_std(img, y0, y1, x0, x1, threshold)。
+行、列下标的取法与 Python 切片/下标一致（负数从末尾数起），改写前后的判别结果不变。
+注意 onefile_scripts 的单文件版只注入 np 和 cv2，保存到 shared_data.pkl 的判别方案若要在两边通用，
+不能直接调用这里的函数（optimize_judges.py 的改写只用 np）。
+
+ImageFeatures 是一张图片的特征包：灰度图、缩略图、行列标准差曲线等都在第一次用到时计算并记住，
+所有别名的判别函数共用同一个特征包，注册的别名再多，每张图片的公共统计量也只算一次。
+"""
+import numpy as np
+import cv2
+
+
+def _as_index(start, stop, length):
+    """
+    range(start, stop) 对应的下标数组，负数下标按 Python 规则从末尾数起
+    """
+    idx = np.arange(start, stop)
+    if idx.size and (idx.min() < -length or idx.max() >= length):
+        raise IndexError(f'下标超出范围: range({start}, {stop})，长度 {length}')
+    return idx
+
+
+def row_std_profile(img: np.ndarray, y0: int, y1: int, x0: int = 0, x1: int = None) -> np.ndarray:
+    """
+    每一行在 [x0, x1) 列范围内的标准差，等价于
+    [np.std(img[y, x0:x1]) for y in range(y0, y1)]
+
+    @param img {np.ndarray} 图片（灰度或BGR）
+    @return {np.ndarray} 长度为 y1 - y0 的标准差数组
+    """
+    rows = img[_as_index(y0, y1, img.shape[0]), x0:x1]
+    if rows.shape[0] == 0:
+        return np.empty(0)
+    return rows.reshape(rows.shape[0], -1).std(axis=1)
+
+
+def col_std_profile(img: np.ndarray, x0: int, x1: int, y0: int = 0, y1: int = None) -> np.ndarray:
+    """
+    每一列在 [y0, y1) 行范围内的标准差，等价于
+    [np.std(img[y0:y1, x]) for x in range(x0, x1)]
+    """
+    cols = np.swapaxes(img[y0:y1, _as_index(x0, x1, img.shape[1])], 0, 1)
+    if cols.shape[0] == 0:
+        return np.empty(0)
+    return cols.reshape(cols.shape[0], -1).std(axis=1)
+
+
+def rows_below_std(img: np.ndarray, y0: int, y1: int, x0: int, x1: int, threshold: float) -> list:
+    """
+    [y0, y1) 中在 [x0, x1) 列范围内标准差小于阈值的行号（彩色条中断的位置）
+
+    @return {list} 行号列表，与逐行循环 append 的结果相同
+    """
+    profile = row_std_profile(img, y0, y1, x0, x1)
+    return (np.flatnonzero(profile < threshold) + y0).tolist()
+
+
+def cols_below_std(img: np.ndarray, x0: int, x1: int, y0: int, y1: int, threshold: float) -> list:
+    """
+    [x0, x1) 中在 [y0, y1) 行范围内标准差小于阈值的列号
+    """
+    profile = col_std_profile(img, x0, x1, y0, y1)
+    return (np.flatnonzero(profile < threshold) + x0).tolist()
+
+
+def vertical_stripe_std(img: np.ndarray, x: int = None, half_width: int = 5) -> float:
+    """
+    以 x 列为中心、宽 2*half_width 的竖条的标准差，默认取图片中线
+    """
+    if x is None:
+        x = img.shape[1] // 2
+    return float(np.std(img[:, x - half_width:x + half_width]))
+
+
+def horizontal_stripe_std(img: np.ndarray, y: int = None, half_width: int = 5) -> float:
+    """
+    以 y 行为中心、高 2*half_width 的横条的标准差，默认取图片中线
+    """
+    if y is None:
+        y = img.shape[0] // 2
+    return float(np.std(img[y - half_width:y + half_width, :]))
+
+
+def stripe_stats(profile: np.ndarray, threshold: float) -> dict:
+    """
+    统计一段标准差曲线中低于阈值的部分
+
+    @param profile {np.ndarray} row_std_profile / col_std_profile 的结果
+    @return {dict} {'below': 低于阈值的个数, 'longest_run': 最长连续段长度,
+                    'min': 最小值, 'mean': 平均值}
+    """
+    profile = np.asarray(profile)
+    if profile.size == 0:
+        return {'below': 0, 'longest_run': 0, 'min': 0.0, 'mean': 0.0}
+    mask = profile < threshold
+    longest = 0
+    if mask.any():
+        # 连续段的起止位置
+        edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        longest = int((ends - starts).max())
+    return {'below': int(mask.sum()), 'longest_run': longest,
+            'min': float(profile.min()), 'mean': float(profile.mean())}
+
+
+def projection_profile(img: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    灰度投影：axis=0 时为每一列的平均亮度，axis=1 时为每一行的平均亮度
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return gray.mean(axis=axis)
+
+
+def find_border(img: np.ndarray, threshold: float = 5.0) -> tuple:
+    """
+    检测四周的纯色边框（标准差低于阈值的整行/整列）
+
+    @return {tuple} (top, bottom, left, right) 去掉边框后内容区域的范围，bottom/right 不含
+    """
+    height, width = img.shape[:2]
+    row_flat = row_std_profile(img, 0, height) < threshold
+    col_flat = col_std_profile(img, 0, width) < threshold
+    content_rows = np.flatnonzero(~row_flat)
+    content_cols = np.flatnonzero(~col_flat)
+    if content_rows.size == 0 or content_cols.size == 0:
+        return 0, 0, 0, 0
+    return (int(content_rows[0]), int(content_rows[-1]) + 1,
+            int(content_cols[0]), int(content_cols[-1]) + 1)
+
+
+THUMBNAIL_SIZE = 256
+
+# 判别方案可在源码顶层声明 DECODE_SCALE = 2/4/8 与 DECODE_GRAYSCALE = True，
+# 表示判别函数只需要缩小/灰度解码的图片；(缩小倍数, 是否灰度) -> cv2.imread 标志
+DECODE_FLAGS = {
+    (1, False): cv2.IMREAD_COLOR,
+    (1, True): cv2.IMREAD_GRAYSCALE,
+    (2, False): cv2.IMREAD_REDUCED_COLOR_2,
+    (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (4, False): cv2.IMREAD_REDUCED_COLOR_4,
+    (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (8, False): cv2.IMREAD_REDUCED_COLOR_8,
+    (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+class ImageFeatures:
+    """
+    单张图片的特征包，各项特征按需计算并缓存
+
+    判别函数声明 features 参数即可使用，例如 def judge(img, threshold=30, features=None)；
+    judge_image 对每张图片只创建一个特征包，依次传给所有判别函数。
+    """
+    def __init__(self, image: np.ndarray, scale: int = 1):
+        """
+        @param image {np.ndarray} 已解码的图片
+        @param scale {int} 解码时的缩小倍数（1 为原图）
+        """
+        self.image = image
+        self.scale = scale
+        self._cache = {}
+
+    def at(self, scale: int = 1, grayscale: bool = False) -> 'ImageFeatures':
+        """
+        取得指定缩小倍数/灰度的特征包，供声明了 DECODE_SCALE / DECODE_GRAYSCALE 的判别函数使用；
+        只能从当前解码再缩小，要求的倍数小于当前解码倍数时返回当前特征包
+        """
+        factor = max(1, scale // self.scale)
+        want_gray = grayscale and self.image.ndim == 3
+        if factor == 1 and not want_gray:
+            return self
+
+        def compute():
+            image = self.gray if want_gray else self.image
+            if factor > 1:
+                height, width = image.shape[:2]
+                size = (max(1, -(-width // factor)), max(1, -(-height // factor)))
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            return ImageFeatures(image, self.scale * factor)
+        return self._memo(('view', factor, want_gray), compute)
+
+    def _memo(self, key, compute):
+        value = self._cache.get(key)
+        if value is None:
+            value = self._cache[key] = compute()
+        return value
+
+    @property
+    def shape(self) -> tuple:
+        return self.image.shape
+
+    @property
+    def height(self) -> int:
+        return self.image.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.image.shape[1]
+
+    @property
+    def gray(self) -> np.ndarray:
+        """
+        灰度图
+        """
+        def compute():
+            if self.image.ndim == 2:
+                return self.image
+            return cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        return self._memo('gray', compute)
+
+    @property
+    def thumbnail(self) -> np.ndarray:
+        """
+        长边不超过 THUMBNAIL_SIZE 的缩略图（BGR）
+        """
+        def compute():
+            scale = THUMBNAIL_SIZE / max(self.height, self.width)
+            if scale >= 1:
+                return self.image
+            size = (max(1, round(self.width * scale)), max(1, round(self.height * scale)))
+            return cv2.resize(self.image, size, interpolation=cv2.INTER_AREA)
+        return self._memo('thumbnail', compute)
+
+    def row_std_profile(self, y0: int, y1: int, x0: int = 0, x1: int = None) -> np.ndarray:
+        return self._memo(('row_std', y0, y1, x0, x1),
+                          lambda: row_std_profile(self.image, y0, y1, x0, x1))
+
+    def col_std_profile(self, x0: int, x1: int, y0: int = 0, y1: int = None) -> np.ndarray:
+        return self._memo(('col_std', x0, x1, y0, y1),
+                          lambda: col_std_profile(self.image, x0, x1, y0, y1))
+
+    def rows_below_std(self, y0: int, y1: int, x0: int, x1: int, threshold: float) -> list:
+        profile = self.row_std_profile(y0, y1, x0, x1)
+        return (np.flatnonzero(profile < threshold) + y0).tolist()
+
+    def cols_below_std(self, x0: int, x1: int, y0: int, y1: int, threshold: float) -> list:
+        profile = self.col_std_profile(x0, x1, y0, y1)
+        return (np.flatnonzero(profile < threshold) + x0).tolist()
+
+    def vertical_stripe_std(self, x: int = None, half_width: int = 5) -> float:
+        if x is None:
+            x = self.width // 2
+        return self._memo(('v_stripe', x, half_width),
+                          lambda: vertical_stripe_std(self.image, x, half_width))
+
+    def horizontal_stripe_std(self, y: int = None, half_width: int = 5) -> float:
+        if y is None:
+            y = self.height // 2
+        return self._memo(('h_stripe', y, half_width),
+                          lambda: horizontal_stripe_std(self.image, y, half_width))
+
+    def projection_profile(self, axis: int = 0) -> np.ndarray:
+        return self._memo(('projection', axis), lambda: self.gray.mean(axis=axis))
+
+    def find_border(self, threshold: float = 5.0) -> tuple:
+        return self._memo(('border', threshold), lambda: find_border(self.image, threshold))
+
+
+# 注入判别函数命名空间的名字
+JUDGE_NAMESPACE = {
+    'np': np,
+    'cv2': cv2,
+    'row_std_profile': row_std_profile,
+    'col_std_profile': col_std_profile,
+    'rows_below_std': rows_below_std,
+    'cols_below_std': cols_below_std,
+    'vertical_stripe_std': vertical_stripe_std,
+    'horizontal_stripe_std': horizontal_stripe_std,
+    'stripe_stats': stripe_stats,
+    'projection_profile': projection_profile,
+    'find_border': find_border,
+    'ImageFeatures': ImageFeatures,
+}
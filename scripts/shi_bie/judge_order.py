@@ -0,0 +1,148 @@
+"""
+按代价调整判别函数的尝试顺序
+
+记录每个别名判别函数的调用次数、命中次数和累计耗时，保存在 lin_shi/judge_stats.json。
+判别时按 平均耗时 / 命中率 从小到大尝试，便宜且常命中的判别函数排在前面。
+结果与按 pkl 字典顺序依次尝试完全一致：某个别名命中后，再补判字典顺序在它之前、还没判过的别名，
+其中第一个命中的才是结果。多个别名都能命中时，统计数据不影响判别结果。
+判别方案源码改动后，该别名的统计自动清零。
+"""
+import os
+import json
+import threading
+from ingest import get_lin_shi_dir
+
+STATS_NAME = 'judge_stats.json'
+# 每判别这么多张图片重新排一次顺序
+REORDER_INTERVAL = 16
+# 没有统计数据时假定的单次耗时（秒）
+DEFAULT_COST = 1e-3
+
+_save_lock = threading.Lock()
+
+
+def get_stats_path() -> str:
+    return os.path.join(get_lin_shi_dir(), STATS_NAME)
+
+
+def load_judge_stats() -> dict:
+    """
+    @return {dict} {别名: {'source': 源码哈希, 'calls': 调用次数, 'hits': 命中次数, 'time': 累计耗时}}
+    """
+    path = get_stats_path()
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取判别统计失败: {e}")
+    return {}
+
+
+def merge_stats(stats: dict, delta: dict):
+    """
+    把统计增量累加到 stats 中；源码哈希不同的条目直接替换
+    """
+    for alias, entry in delta.items():
+        _merge_entry(stats, alias, entry)
+
+
+def _merge_entry(stats: dict, alias: str, entry: dict):
+    current = stats.get(alias)
+    if current is None or current.get('source') != entry.get('source'):
+        stats[alias] = dict(entry)
+        return
+    for key in ('calls', 'hits', 'time'):
+        current[key] = current.get(key, 0) + entry.get(key, 0)
+
+
+def save_judge_stats(delta: dict):
+    """
+    把本次新增的统计累加到磁盘上的最新内容中，多个批次同时运行时不会互相覆盖
+
+    @param delta {dict} JudgeOrder.take_delta 返回的增量
+    """
+    if not delta:
+        return
+    with _save_lock:
+        stats = load_judge_stats()
+        merge_stats(stats, delta)
+        path = get_stats_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"保存判别统计失败: {e}")
+
+
+class JudgeOrder:
+    """
+    一批图片的判别顺序，边判别边更新统计
+    """
+    def __init__(self, judge_functions: dict, stats: dict = None):
+        """
+        @param judge_functions {dict} {别名: 判别函数}，字典顺序即判别优先级
+        @param stats {dict} 已有的统计，不传时从磁盘读取
+        """
+        self.priority = list(judge_functions)
+        self.rank = {alias: i for i, alias in enumerate(self.priority)}
+        self.sources = {alias: getattr(f, 'source_hash', None) for alias, f in judge_functions.items()}
+        self.stats = {}
+        self.delta = {}
+        for alias, entry in (load_judge_stats() if stats is None else stats).items():
+            if alias in self.sources and entry.get('source') == self.sources[alias]:
+                self.stats[alias] = dict(entry)
+        self._order = None
+        self._since_reorder = 0
+
+    def expected_cost(self, alias: str) -> float:
+        """
+        直到命中为止的期望代价：平均耗时 / 命中率（命中率做加一平滑）
+        """
+        entry = self.stats.get(alias)
+        if not entry or not entry.get('calls'):
+            return DEFAULT_COST * len(self.priority)
+        mean_time = entry['time'] / entry['calls']
+        hit_rate = (entry['hits'] + 1) / (entry['calls'] + 2)
+        return mean_time / hit_rate
+
+    def order(self) -> list:
+        """
+        当前的尝试顺序；期望代价相同时按字典顺序
+        """
+        if self._order is None or self._since_reorder >= REORDER_INTERVAL:
+            self._order = sorted(self.priority, key=lambda a: (self.expected_cost(a), self.rank[a]))
+            self._since_reorder = 0
+        return self._order
+
+    def record(self, alias: str, elapsed: float, hit: bool):
+        for stats in (self.stats, self.delta):
+            entry = stats.setdefault(alias, {'source': self.sources.get(alias), 'calls': 0, 'hits': 0, 'time': 0.0})
+            entry['calls'] += 1
+            entry['hits'] += int(bool(hit))
+            entry['time'] += elapsed
+
+    def image_done(self):
+        self._since_reorder += 1
+
+    def take_delta(self) -> dict:
+        """
+        取出并清空尚未保存的统计增量
+        """
+        delta, self.delta = self.delta, {}
+        return delta
+
+    def summary(self) -> list:
+        """
+        @return {list} [(别名, 平均耗时毫秒, 命中率, 调用次数), ...]，按当前顺序
+        """
+        rows = []
+        for alias in self.order():
+            entry = self.stats.get(alias, {})
+            calls = entry.get('calls', 0)
+            rows.append((alias, entry.get('time', 0.0) / calls * 1000 if calls else 0.0,
+                         entry.get('hits', 0) / calls if calls else 0.0, calls))
+        return rows
@@ -1,37 +1,114 @@
 import sys
 import os
-import shutil
-from PyQt6.QtWidgets import QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget, QMessageBox
-from PyQt6.QtCore import Qt, QMimeData
+import time
+import threading
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget, QMessageBox,
+                             QProgressBar, QPushButton)
+from PyQt6.QtCore import Qt, QMimeData, QThread, pyqtSignal
 from PyQt6.QtGui import QDragEnterEvent, QDropEvent
+from ingest import INGEST_MANIFEST, get_images_dir, ingest_images, is_image_file, scan_image_files
+
+class IngestThread(QThread):
+    """
+    后台扫描并登记图片的线程，扫描/哈希/复制都不占用界面线程
+    """
+    progress_signal = pyqtSignal(str, int, int, float)  # 阶段, 已完成数, 总数(扫描阶段为0), 字节/秒
+    result_signal = pyqtSignal(dict)                    # 登记结果，见 ingest_images
+
+    # 进度信号的最小间隔（秒），避免几万个文件时把事件队列塞满
+    EMIT_INTERVAL = 0.1
+
+    def __init__(self, paths, target_dir, ingest_mode, max_workers=None):
+        super().__init__()
+        self.paths = paths
+        self.target_dir = target_dir
+        self.ingest_mode = ingest_mode
+        self.max_workers = max_workers
+        self.cancel_event = threading.Event()
+        self._last_emit = 0.0
+        self._start_time = 0.0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _emit_progress(self, stage, done, total, bytes_done, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_emit < self.EMIT_INTERVAL and done != total:
+            return
+        self._last_emit = now
+        elapsed = max(now - self._start_time, 1e-6)
+        self.progress_signal.emit(stage, done, total, bytes_done / elapsed)
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as e:
+            # 压缩包损坏、磁盘出错等；无论如何都要发出结果，否则进度对话框会一直等下去
+            print(f"登记图片出错: {e}")
+            self.result_signal.emit({'cancelled': False, 'error': str(e)})
+
+    def _run(self):
+        self._start_time = time.monotonic()
+        # 扫描阶段：总数未知，只报告已找到的数量
+        image_files = []
+        for image_file in scan_image_files(self.paths, self.cancel_event):
+            image_files.append(image_file)
+            self._emit_progress('scan', len(image_files), 0, 0)
+        self._emit_progress('scan', len(image_files), 0, 0, force=True)
+        if self.cancel_event.is_set():
+            self.result_signal.emit({'cancelled': True, 'found': len(image_files)})
+            return
+        if not image_files:
+            self.result_signal.emit({'cancelled': False, 'found': 0})
+            return
+
+        self._start_time = time.monotonic()
+        def on_progress(stage, done, total, bytes_done):
+            self._emit_progress(stage, done, total, bytes_done)
+        report = ingest_images(image_files, self.target_dir, self.ingest_mode,
+                               max_workers=self.max_workers, progress_callback=on_progress,
+                               cancel_event=self.cancel_event)
+        report['found'] = len(image_files)
+        self.result_signal.emit(report)
 
 class DropWindow(QMainWindow):
     """
     拖拽窗口类
     """
-    def __init__(self):
+    STAGE_NAMES = {'scan': '扫描', 'hash': '校验', 'place': '复制'}
+
+    def __init__(self, ingest_mode: str = INGEST_MANIFEST, max_workers: int = None, target_dir: str = None):
         super().__init__()
+        self.ingest_mode = ingest_mode
+        self.max_workers = max_workers
+        self.ingest_thread = None
         self.setWindowTitle('拖拽文件/文件夹到这里')
         self.setGeometry(100, 100, 400, 300)
-        
+
         # 创建中央部件和布局
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         layout = QVBoxLayout(central_widget)
-        
+
         # 创建提示标签
         self.label = QLabel('将文件或文件夹拖拽到这里')
         self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.label)
-        
+
+        # 登记进度（拖入后才显示）
+        self.progress_bar = QProgressBar()
+        self.progress_bar.hide()
+        layout.addWidget(self.progress_bar)
+        self.cancel_btn = QPushButton('取消')
+        self.cancel_btn.clicked.connect(self.cancel_ingest)
+        self.cancel_btn.hide()
+        layout.addWidget(self.cancel_btn)
+
         # 设置接受拖拽
         self.setAcceptDrops(True)
-        
+
         # 确保目标文件夹存在
-        current_dir = os.path.dirname(os.path.abspath(__file__))  # scripts/shi_bie
-        scripts_dir = os.path.dirname(current_dir)  # scripts
-        project_dir = os.path.dirname(scripts_dir)  # 项目根目录
-        self.target_dir = os.path.join(project_dir, 'lin_shi', 'dai_shi_bie')
+        self.target_dir = target_dir or get_images_dir()
         print(f"目标文件夹路径: {self.target_dir}")  # 调试信息
         os.makedirs(self.target_dir, exist_ok=True)
 
@@ -39,88 +116,128 @@ class DropWindow(QMainWindow):
         """
         处理拖拽进入事件
         """
-        if event.mimeData().hasUrls():
+        if event.mimeData().hasUrls() and self.ingest_thread is None:
             event.acceptProposedAction()
 
     def dropEvent(self, event: QDropEvent):
         """
-        处理拖拽放下事件
+        处理拖拽放下事件：在后台线程中扫描并登记图片
         """
         # 获取拖拽的文件/文件夹路径
         urls = event.mimeData().urls()
         paths = [url.toLocalFile() for url in urls]
-        
-        # 收集所有图片文件
-        image_files = []
-        for path in paths:
-            if os.path.isfile(path):
-                # 如果是文件，检查是否为图片
-                if self.is_image_file(path):
-                    image_files.append(path)
-            else:
-                # 如果是文件夹，递归查找所有图片
-                for root, _, files in os.walk(path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        if self.is_image_file(file_path):
-                            image_files.append(file_path)
-        
-        # 复制图片到目标文件夹
-        if image_files:
-            copied_files = []
-            overwritten_files = []
-            for image_file in image_files:
-                try:
-                    # 获取文件名
-                    file_name = os.path.basename(image_file)
-                    # 构建目标路径
-                    target_path = os.path.join(self.target_dir, file_name)
-                    print(f"正在复制: {image_file} -> {target_path}")  # 调试信息
-                    
-                    # 检查目标文件是否已存在
-                    if os.path.exists(target_path):
-                        overwritten_files.append(file_name)
-                    
-                    # 复制文件
-                    shutil.copy2(image_file, target_path)
-                    copied_files.append(file_name)
-                except Exception as e:
-                    print(f"复制文件失败: {e}")  # 调试信息
-                    QMessageBox.warning(self, '错误', f'复制文件 {file_name} 失败: {str(e)}')
-            
-            if copied_files:
-                # 构建成功消息
-                success_msg = f'已成功复制 {len(copied_files)} 个图片文件到:\n{self.target_dir}'
-                if overwritten_files:
-                    success_msg += f'\n\n其中覆盖了 {len(overwritten_files)} 个已存在的文件:\n' + '\n'.join(overwritten_files)
-                # 显示成功消息
-                QMessageBox.information(self, '成功', success_msg)
-                self.close()  # 拖拽成功后自动关闭窗口
-            else:
-                # 显示失败消息
-                QMessageBox.warning(self, '失败', '没有成功复制任何文件')
+
+        self.setAcceptDrops(False)
+        self.label.setText('正在扫描...')
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.show()
+        self.cancel_btn.setEnabled(True)
+        self.cancel_btn.show()
+
+        self.ingest_thread = IngestThread(paths, self.target_dir, self.ingest_mode, self.max_workers)
+        self.ingest_thread.progress_signal.connect(self.on_ingest_progress)
+        self.ingest_thread.result_signal.connect(self.on_ingest_finished)
+        self.ingest_thread.start()
+
+    def on_ingest_progress(self, stage, done, total, bytes_per_sec):
+        """
+        显示实时进度：文件数与吞吐量
+        """
+        stage_name = self.STAGE_NAMES.get(stage, stage)
+        if total:
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(done)
+            text = f'{stage_name}: {done} / {total}'
         else:
+            text = f'{stage_name}: 已找到 {done} 个图片'
+        if bytes_per_sec > 0:
+            text += f'\n{bytes_per_sec / (1 << 20):.1f} MB/s'
+        self.label.setText(text)
+
+    def cancel_ingest(self):
+        if self.ingest_thread is not None:
+            self.cancel_btn.setEnabled(False)
+            self.label.setText('正在取消...')
+            self.ingest_thread.cancel()
+
+    def reset_ingest_ui(self):
+        self.ingest_thread = None
+        self.progress_bar.hide()
+        self.cancel_btn.hide()
+        self.label.setText('将文件或文件夹拖拽到这里')
+        self.setAcceptDrops(True)
+
+    def on_ingest_finished(self, report):
+        """
+        后台登记完成后的提示
+        """
+        if self.ingest_thread is not None:
+            self.ingest_thread.wait()
+        self.reset_ingest_ui()
+
+        if report.get('cancelled'):
+            QMessageBox.information(self, '已取消', '已取消登记，本次拖入的图片未加入批次')
+            return
+        if report.get('error'):
+            QMessageBox.critical(self, '错误', f'登记图片出错:\n{report["error"]}')
+            return
+        if not report.get('found'):
             # 显示无图片消息
             QMessageBox.warning(self, '警告', '没有找到任何图片文件')
+            return
+
+        for file_name, error in report['errors']:
+            print(f"登记文件 {file_name} 失败: {error}")
+        ingested_files = report['ingested']
+        overwritten_files = report['overwritten']
+        if ingested_files or report['duplicates']:
+            # 构建成功消息
+            success_msg = f'已成功登记 {len(ingested_files)} 个图片文件到:\n{self.target_dir}'
+            if overwritten_files:
+                success_msg += f'\n\n其中覆盖了 {len(overwritten_files)} 个已存在的文件:\n' + '\n'.join(overwritten_files)
+            if report['duplicates']:
+                success_msg += f'\n\n{len(report["duplicates"])} 个文件内容重复，只识别一次，结果复制到各自的行:\n' + '\n'.join(
+                    f'{name} = {owner}' for name, owner in report['duplicates'])
+            if report['cached']:
+                success_msg += f'\n\n其中 {len(report["cached"])} 个图片往次已识别，将复用保存的结果'
+            if report['errors']:
+                success_msg += f'\n\n{len(report["errors"])} 个文件登记失败:\n' + '\n'.join(
+                    f'{name}: {error}' for name, error in report['errors'])
+            # 显示成功消息
+            QMessageBox.information(self, '成功', success_msg)
+            self.close()  # 拖拽成功后自动关闭窗口
+        else:
+            # 显示失败消息
+            QMessageBox.warning(self, '失败', '没有成功登记任何文件')
+
+    def closeEvent(self, event):
+        """
+        关闭窗口时取消并等待后台登记线程
+        """
+        if self.ingest_thread is not None:
+            self.ingest_thread.cancel()
+            self.ingest_thread.wait()
+        super().closeEvent(event)
 
     def is_image_file(self, file_path: str) -> bool:
         """
         判断文件是否为图片
-        
+
         @param file_path {str} 文件路径
         @return {bool} 是否为图片
         """
-        # 获取文件扩展名（小写）
-        ext = os.path.splitext(file_path)[1].lower()
-        # 检查是否为常见图片格式
-        return ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp']
+        return is_image_file(file_path)
 
-def run_ocr1():
+def run_ocr1(ingest_mode: str = INGEST_MANIFEST, max_workers: int = None, images_dir: str = None):
     """
     运行拖拽窗口，供主流程调用
+
+    @param ingest_mode {str} 入库模式，见 ingest.py
+    @param max_workers {int} 登记时的线程数
+    @param images_dir {str} 本次作业的批次目录，默认 lin_shi/dai_shi_bie
     """
-    app = QApplication(sys.argv)
-    window = DropWindow()
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = DropWindow(ingest_mode, max_workers, images_dir)
     window.show()
     app.exec()
 
@@ -131,4 +248,4 @@ def main():
     run_ocr1()
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,143 +1,431 @@
 import os
 import pickle
 import importlib.util
+import inspect
+import functools
+import time
+import hashlib
 from typing import Dict, Any, Callable
 import numpy as np
 import cv2
-from ocr5 import show_progress_window
+from ocr5 import show_stream_progress
+from ingest import (get_images_dir, list_batch_images, get_image_info, get_content_keys, load_hash_index,
+                    save_hash_index, lookup_classification, store_classification)
+from image_cache import read_image
+from code_cache import compile_cached, save_code_cache
+from judge_lib import JUDGE_NAMESPACE, DECODE_FLAGS, ImageFeatures
+from judge_order import JudgeOrder, save_judge_stats
+from template_index import TemplateIndex, SIGNATURE_DECODE_FLAGS
+from size_index import SizeIndex
 
 # 这些库会被动态执行的判别函数使用
 # 如果判别函数需要其他库，可以在这里添加
 
-def load_judge_functions(pkl_path: str) -> Dict[str, Callable]:
+def load_judge_sources(pkl_path: str) -> Dict[str, str]:
     """
-    从pkl文件中加载所有别名的判别函数
-    只查找 pkl2 下的 图片类型判别方案 字段，且函数名必须为 judge
+    从pkl文件中读取所有别名的判别方案源码
+    只查找 pkl2 下的 图片类型判别方案 字段
+
+    @return {Dict[str, str]} {别名: 源码}
     """
-    judge_functions = {}
+    sources = {}
     try:
         with open(pkl_path, 'rb') as f:
             data = pickle.load(f)
         for alias in data:
             if alias == '__global__':
                 continue
-            func_code = None
             # 只查找 pkl2 下的 图片类型判别方案
             if 'pkl2' in data[alias] and '图片类型判别方案' in data[alias]['pkl2']:
                 func_code = data[alias]['pkl2']['图片类型判别方案']
-            if func_code:
-                try:
-                    spec = importlib.util.spec_from_loader('temp_module', loader=None)
-                    module = importlib.util.module_from_spec(spec)
-                    # 注入依赖
-                    module.__dict__['np'] = np
-                    module.__dict__['cv2'] = cv2
-                    exec(func_code, module.__dict__)
-                    if hasattr(module, 'judge'):
-                        judge_functions[alias] = getattr(module, 'judge')
-                except Exception as e:
-                    print(f"加载别名 {alias} 的判别函数失败: {e}")
+                if func_code:
+                    sources[alias] = func_code
+    except Exception as e:
+        print(f"读取pkl文件失败: {e}")
+    return sources
+
+def load_layout_sizes(pkl_path: str) -> Dict[str, tuple]:
+    """
+    从pkl文件中读取各别名 image_window 下保存的模板图片尺寸
+
+    @return {Dict[str, tuple]} {别名: (宽, 高)}
+    """
+    sizes = {}
+    try:
+        with open(pkl_path, 'rb') as f:
+            data = pickle.load(f)
+        for alias, scripts in data.items():
+            if alias == '__global__':
+                continue
+            size = scripts.get('image_window', {}).get('size')
+            if size:
+                sizes[alias] = tuple(size)
+    except Exception as e:
+        print(f"读取pkl文件失败: {e}")
+    return sizes
+
+def load_template_index(pkl_path: str) -> TemplateIndex:
+    """
+    从pkl文件中读取各别名 image_window 下保存的模板指纹，建立版面指纹索引
+    """
+    try:
+        with open(pkl_path, 'rb') as f:
+            return TemplateIndex.from_pkl_data(pickle.load(f))
     except Exception as e:
         print(f"读取pkl文件失败: {e}")
+        return TemplateIndex({})
+
+def build_judge_functions(sources: Dict[str, str], sizes: Dict[str, tuple] = None) -> Dict[str, Callable]:
+    """
+    执行判别方案源码得到判别函数，函数名必须为 judge
+
+    @param sources {Dict[str, str]} load_judge_sources 返回的 {别名: 源码}
+    @param sizes {Dict[str, tuple]} load_layout_sizes 返回的模板尺寸，记在判别函数的 layout_size 上，见 size_index.py
+    @return {Dict[str, Callable]} {别名: 判别函数}
+    """
+    sizes = sizes or {}
+    judge_functions = {}
+    for alias, func_code in sources.items():
+        try:
+            spec = importlib.util.spec_from_loader('temp_module', loader=None)
+            module = importlib.util.module_from_spec(spec)
+            # 注入依赖：np、cv2 以及向量化特征函数，见 judge_lib.py
+            module.__dict__.update(JUDGE_NAMESPACE)
+            exec(compile_cached(func_code, f'<{alias}>'), module.__dict__)
+            if hasattr(module, 'judge'):
+                judge_func = getattr(module, 'judge')
+                # 判别方案声明的解码方式，见 judge_lib.DECODE_FLAGS
+                scale = module.__dict__.get('DECODE_SCALE', 1)
+                if scale not in (1, 2, 4, 8):
+                    print(f"别名 {alias} 的 DECODE_SCALE={scale} 无效，按原图解码")
+                    scale = 1
+                judge_func.decode_scale = scale
+                judge_func.decode_grayscale = bool(module.__dict__.get('DECODE_GRAYSCALE', False))
+                # 源码哈希，源码改动后该别名的统计/缓存随之失效
+                judge_func.source_hash = hashlib.sha256(func_code.encode('utf-8')).hexdigest()[:16]
+                # 源码本身，限时判别时要在工作进程中重新编译，见 classify_pool.py
+                judge_func.source = func_code
+                judge_func.layout_size = sizes.get(alias)
+                judge_functions[alias] = judge_func
+        except Exception as e:
+            print(f"加载别名 {alias} 的判别函数失败: {e}")
     return judge_functions
 
-def judge_images(images_dir: str, judge_functions: Dict[str, Callable]) -> Dict[str, str]:
+def load_judge_functions(pkl_path: str) -> Dict[str, Callable]:
     """
-    对图片进行类型判别
-    
+    从pkl文件中加载所有别名的判别函数
+    只查找 pkl2 下的 图片类型判别方案 字段，且函数名必须为 judge
+    """
+    judge_functions = build_judge_functions(load_judge_sources(pkl_path), load_layout_sizes(pkl_path))
+    save_code_cache()
+    return judge_functions
+
+@functools.lru_cache(maxsize=None)
+def accepts_features(judge_func: Callable) -> bool:
+    """
+    判别函数是否声明了 features 参数（可以使用共享的特征包）
+    """
+    try:
+        return 'features' in inspect.signature(judge_func).parameters
+    except (TypeError, ValueError):
+        return False
+
+def get_judge_signature(judge_functions: Dict[str, Callable]) -> list:
+    """
+    判别函数的签名，判别结果缓存据此判断是否失效
+    模板尺寸决定了哪些图片会调用该判别函数，也计入签名
+
+    @return {list} [[别名, 源码哈希], ...]，按字典顺序
+    """
+    signature = []
+    for alias, f in judge_functions.items():
+        source_hash = getattr(f, 'source_hash', None)
+        size = getattr(f, 'layout_size', None)
+        if source_hash is not None and size:
+            source_hash = f'{source_hash}@{size[0]}x{size[1]}'
+        signature.append([alias, source_hash])
+    return signature
+
+def get_judge_decode(judge_func: Callable) -> tuple:
+    """
+    @return {tuple} 判别函数需要的 (缩小倍数, 是否灰度)
+    """
+    return getattr(judge_func, 'decode_scale', 1), getattr(judge_func, 'decode_grayscale', False)
+
+def get_classify_decode(judge_functions: Dict[str, Callable]) -> tuple:
+    """
+    分类阶段的解码方式：取所有判别函数中要求最高的分辨率，都要灰度时才按灰度解码
+
+    @return {tuple} (缩小倍数, 是否灰度, cv2.imread 标志)
+    """
+    decodes = [get_judge_decode(f) for f in judge_functions.values()] or [(1, False)]
+    scale = min(s for s, _ in decodes)
+    grayscale = all(g for _, g in decodes)
+    return scale, grayscale, DECODE_FLAGS[(scale, grayscale)]
+
+def call_judge(judge_func: Callable, features: ImageFeatures, filename: str = '') -> bool:
+    """
+    按判别函数声明的分辨率/灰度调用它，出错时视为不命中
+    """
+    try:
+        view = features.at(*get_judge_decode(judge_func))
+        if accepts_features(judge_func):
+            return bool(judge_func(view.image, features=view))
+        return bool(judge_func(view.image))
+    except Exception as e:
+        print(f"判别图片 {filename} 时出错: {e}")
+        return False
+
+def judge_image(image: np.ndarray, judge_functions: Dict[str, Callable], filename: str = '',
+                features: ImageFeatures = None, decode_scale: int = 1, order: JudgeOrder = None,
+                on_judge: Callable = None, candidates: frozenset = None) -> str:
+    """
+    对一张已解码的图片依次尝试判别函数
+    所有判别函数共用同一个特征包，灰度图、行列标准差等公共统计量只算一次
+
+    @param image {np.ndarray} BGR图片
+    @param judge_functions {Dict[str, Callable]} 判别函数字典
+    @param filename {str} 图片名，仅用于打印错误
+    @param features {ImageFeatures} 图片的特征包，不传时自动创建
+    @param decode_scale {int} image 解码时的缩小倍数，见 get_classify_decode
+    @param order {JudgeOrder} 按代价排序并记录统计，不传时按字典顺序尝试；两种方式结果相同
+    @param on_judge {Callable} on_judge(别名)，每个判别函数开始前调用，供超时监控使用
+    @param candidates {frozenset} 只尝试这些别名（SizeIndex 按尺寸筛出的候选），None为全部
+    @return {str} 命中的别名，都不命中时为 unknown
+    """
+    if features is None:
+        features = ImageFeatures(image, decode_scale)
+    if order is None:
+        for alias, judge_func in judge_functions.items():
+            if candidates is not None and alias not in candidates:
+                continue
+            if on_judge:
+                on_judge(alias)
+            if call_judge(judge_func, features, filename):
+                return alias
+        return 'unknown'
+
+    def timed_call(alias):
+        if on_judge:
+            on_judge(alias)
+        start = time.perf_counter()
+        hit = call_judge(judge_functions[alias], features, filename)
+        order.record(alias, time.perf_counter() - start, hit)
+        return hit
+
+    result = 'unknown'
+    evaluated = set()
+    for alias in order.order():
+        if candidates is not None and alias not in candidates:
+            continue
+        evaluated.add(alias)
+        if timed_call(alias):
+            result = alias
+            # 补判字典顺序在前、还没判过的别名，保证结果与按字典顺序尝试一致
+            for earlier in order.priority[:order.rank[alias]]:
+                if candidates is not None and earlier not in candidates:
+                    continue
+                if earlier not in evaluated and timed_call(earlier):
+                    result = earlier
+                    break
+            break
+    order.image_done()
+    return result
+
+def iter_judge_images(images_dir: str, judge_functions: Dict[str, Callable]):
+    """
+    在当前进程中逐张判别图片，每判完一张就产出结果
+
     @param images_dir {str} 图片目录
     @param judge_functions {Dict[str, Callable]} 判别函数字典
-    @return {Dict[str, str]} 图片名到类型的映射
+    @return {Iterator[tuple]} (图片名, 类型, 耗时秒)，按批次清单顺序；复用往次结果的耗时为0
     """
-    results = {}
+    image_info = get_image_info(images_dir)
+    # 按判别函数需要的最小分辨率解码，JPEG 缩小解码时只做部分反变换
+    decode_scale, _, decode_flags = get_classify_decode(judge_functions)
+    order = JudgeOrder(judge_functions)
+    # 图片内容和相关判别函数都没变的，直接复用往次的判别结果
+    hash_index = load_hash_index()
+    content_keys = get_content_keys(images_dir)
+    signature = get_judge_signature(judge_functions)
+    # 只调用宽高比与图片相容的别名的判别函数
+    size_index = SizeIndex.from_judges(judge_functions)
+    cached = 0
     
-    # 遍历所有图片
-    for filename in os.listdir(images_dir):
-        if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp')):
-            image_path = os.path.join(images_dir, filename)
-            
+    try:
+        # 遍历批次清单中的所有图片
+        for filename, image_path in list_batch_images(images_dir):
+            start = time.perf_counter()
+            # 文件头探测失败的不是图片，不必再完整解码
+            if image_info.get(filename) is None:
+                print(f"不是有效的图片: {filename}")
+                yield filename, 'unreadable', time.perf_counter() - start
+                continue
+            stored = lookup_classification(hash_index, content_keys.get(filename), signature)
+            if stored is not None:
+                cached += 1
+                yield filename, stored, 0.0
+                continue
+            candidates = size_index.candidates_for(image_info[filename])
+            if candidates is not None and not candidates:
+                # 没有尺寸相容的别名，不必解码
+                yield filename, 'unknown', time.perf_counter() - start
+                continue
             # 读取图片为 np.ndarray
-            image = cv2.imread(image_path)
+            image = read_image(image_path, decode_flags)
             if image is None:
                 print(f"无法读取图片: {filename}")
-                results[filename] = 'unreadable'
+                yield filename, 'unreadable', time.perf_counter() - start
                 continue
             
-            # 尝试每个判别函数
-            image_type = 'unknown'
-            for alias, judge_func in judge_functions.items():
-                try:
-                    if judge_func(image):
-                        image_type = alias
-                        break
-                except Exception as e:
-                    print(f"判别图片 {filename} 时出错: {e}")
-                    continue
-            
-            results[filename] = image_type
-            
-    return results
+            # 尝试每个候选别名的判别函数
+            image_type = judge_image(image, judge_functions, filename, decode_scale=decode_scale, order=order,
+                                     candidates=candidates)
+            store_classification(hash_index, content_keys.get(filename), image_type, signature)
+            yield filename, image_type, time.perf_counter() - start
+    finally:
+        # 中途停止时也保存已判别部分的结果与统计
+        save_hash_index(hash_index)
+        if cached:
+            print(f"[缓存] {cached} 张图片复用往次判别结果")
+        save_judge_stats(order.take_delta())
+        print("判别顺序: " + ', '.join(f'{alias}({ms:.2f}ms, 命中{rate:.0%})'
+                                     for alias, ms, rate, _ in order.summary()))
 
-def main() -> Dict[str, str]:
+def judge_images(images_dir: str, judge_functions: Dict[str, Callable]) -> Dict[str, str]:
     """
-    主函数
+    对图片进行类型判别
     
-    @return {Dict[str, str]} 判别结果字典
+    @param images_dir {str} 图片目录
+    @param judge_functions {Dict[str, Callable]} 判别函数字典
+    @return {Dict[str, str]} 图片名到类型的映射
+    """
+    return {filename: image_type for filename, image_type, _ in iter_judge_images(images_dir, judge_functions)}
+
+def iter_template_images(images_dir: str, index: TemplateIndex):
+    """
+    按模板版面指纹逐张分类，不调用判别函数
+
+    @param images_dir {str} 图片目录
+    @param index {TemplateIndex} 模板指纹索引
+    @return {Iterator[tuple]} (图片名, 类型, 耗时秒)，按批次清单顺序
     """
-    # 获取项目根目录
+    image_info = get_image_info(images_dir)
+    for filename, image_path in list_batch_images(images_dir):
+        start = time.perf_counter()
+        image = read_image(image_path, SIGNATURE_DECODE_FLAGS) if image_info.get(filename) is not None else None
+        if image is None:
+            print(f"无法读取图片: {filename}")
+            yield filename, 'unreadable', time.perf_counter() - start
+            continue
+        alias, _ = index.match(image)
+        yield filename, alias, time.perf_counter() - start
+
+def get_pkl_path() -> str:
     current_dir = os.path.dirname(os.path.abspath(__file__))  # scripts/shi_bie
     scripts_dir = os.path.dirname(current_dir)  # scripts
     project_dir = os.path.dirname(scripts_dir)  # 项目根目录
-    
-    # 构建路径
-    pkl_path = os.path.join(project_dir, 'mu_ban', 'shared_data.pkl')
-    images_dir = os.path.join(project_dir, 'lin_shi', 'dai_shi_bie')
+    return os.path.join(project_dir, 'mu_ban', 'shared_data.pkl')
+
+def stream_classify(images_dir: str = None, workers: int = 1, judge_timeout: float = None,
+                    image_timeout: float = None, use_templates: bool = False):
+    """
+    判别批次目录中的图片，每判完一张就产出结果，供进度窗口等实时显示
+
+    @param images_dir {str} 批次目录，默认 lin_shi/dai_shi_bie
+    @param workers {int} 判别进程数，大于1时使用多进程分类（见 classify_pool.py），None为CPU核数
+    @param judge_timeout {float} 单个判别函数的时间预算（秒），设置后在可结束的工作进程中判别
+    @param image_timeout {float} 单张图片的时间预算（秒），超时的图片判为 timeout
+    @param use_templates {bool} 按模板版面指纹分类（见 template_index.py），没有别名保存过指纹时仍用判别函数
+    @return {Iterator[tuple]} (图片名, 类型, 耗时秒)
+    """
+    pkl_path = get_pkl_path()
+    images_dir = images_dir or get_images_dir()
     
     # 检查路径是否存在
     if not os.path.exists(pkl_path):
         print(f"错误: pkl文件不存在: {pkl_path}")
-        return {}
+        return
     if not os.path.exists(images_dir):
         print(f"错误: 图片目录不存在: {images_dir}")
-        return {}
-    
-    # 加载判别函数
-    judge_functions = load_judge_functions(pkl_path)
-    if not judge_functions:
-        print("警告: 没有找到任何判别函数")
-        return {}
+        return
     
-    # 进行判别
-    results = judge_images(images_dir, judge_functions)
+    if use_templates:
+        index = load_template_index(pkl_path)
+        if len(index):
+            yield from iter_template_images(images_dir, index)
+            return
+        print("警告: 没有别名保存了模板指纹，改用判别函数分类")
     
-    # 打印结果
+    if workers is None or workers > 1 or judge_timeout or image_timeout:
+        # 在这里导入，避免与 classify_pool 循环导入
+        from classify_pool import iter_classify_images
+        judge_sources = load_judge_sources(pkl_path)
+        if not judge_sources:
+            print("警告: 没有找到任何判别函数")
+            return
+        yield from iter_classify_images(images_dir, judge_sources, workers, judge_timeout, image_timeout,
+                                        load_layout_sizes(pkl_path))
+    else:
+        # 加载判别函数
+        judge_functions = load_judge_functions(pkl_path)
+        if not judge_functions:
+            print("警告: 没有找到任何判别函数")
+            return
+        yield from iter_judge_images(images_dir, judge_functions)
+
+def order_by_batch(results: Dict[str, str], images_dir: str) -> Dict[str, str]:
+    """
+    把判别结果按批次清单顺序排列，多进程分类时复用的结果先产出
+    """
+    return {name: results[name] for name, _ in list_batch_images(images_dir) if name in results}
+
+def print_results(results: Dict[str, str]):
     print("\n判别结果:")
     for filename, image_type in results.items():
         print(f"{filename}: {image_type}")
+
+def main(images_dir: str = None, workers: int = 1, on_progress: Callable = None,
+         judge_timeout: float = None, image_timeout: float = None, use_templates: bool = False) -> Dict[str, str]:
+    """
+    主函数
     
+    @param images_dir {str} 批次目录，默认 lin_shi/dai_shi_bie
+    @param workers {int} 判别进程数，大于1时使用多进程分类（见 classify_pool.py），None为CPU核数
+    @param on_progress {Callable} on_progress(已判别数)，每张图片判别完调用
+    @param judge_timeout {float} 单个判别函数的时间预算（秒），设置后在可结束的工作进程中判别
+    @param image_timeout {float} 单张图片的时间预算（秒），超时的图片判为 timeout
+    @param use_templates {bool} 按模板版面指纹分类，见 stream_classify
+    @return {Dict[str, str]} 判别结果字典
+    """
+    images_dir = images_dir or get_images_dir()
+    results = {}
+    for filename, image_type, _ in stream_classify(images_dir, workers, judge_timeout, image_timeout,
+                                                   use_templates):
+        results[filename] = image_type
+        if on_progress:
+            on_progress(len(results))
+    results = order_by_batch(results, images_dir)
+    print_results(results)
     return results
 
-def classify_with_progress():
-    # 统计待分类图片
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    scripts_dir = os.path.dirname(current_dir)
-    project_dir = os.path.dirname(scripts_dir)
-    images_dir = os.path.join(project_dir, 'lin_shi', 'dai_shi_bie')
-    image_files = [f for f in os.listdir(images_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp'))]
-    total = len(image_files)
+def classify_with_progress(images_dir: str = None, workers: int = 1, judge_timeout: float = None,
+                           image_timeout: float = None, use_templates: bool = False):
+    """
+    在后台线程中分类，进度窗口随每张图片的结果实时更新进度、速度和预计剩余时间
+
+    @return {Dict[str, str]} 判别结果字典
+    """
+    images_dir = images_dir or get_images_dir()
+    total = len(list_batch_images(images_dir))
     classify_result = {}
-    def process_func(update_copy, update_judge, update_recognize):
-        # 复制阶段（已完成，直接更新）
-        update_copy(total)
-        # 判断阶段
-        result = main()  # 直接调用本文件的main函数
-        for i, _ in enumerate(result):
-            update_judge(i+1)
-        # 识别阶段跳过
-        update_recognize(0)
-        classify_result.update(result)
-    show_progress_window(total, total, total, process_func)
+    def on_item(filename, image_type, elapsed):
+        classify_result[filename] = image_type
+    show_stream_progress(total, lambda: stream_classify(images_dir, workers, judge_timeout, image_timeout,
+                                                        use_templates), on_item)
+    classify_result = order_by_batch(classify_result, images_dir)
+    print_results(classify_result)
     return classify_result
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -1,53 +1,86 @@
 import os
+import json
 import pickle
+import hashlib
 import importlib.util
 import numpy as np
 import cv2
 import base64
 import urllib
-import requests
+import http_client
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from ocr5 import show_progress_window
+from ocr_pool import OcrPool, DEFAULT_WORKERS, DEFAULT_QPS
+from baidu_token import TokenManager
+from ocr_retry import OcrError, TRANSIENT, check_response, call_with_retry
+from roi_mosaic import build_mosaics
+from image_cache import read_image
+from image_source import ArchiveHandles
+from code_cache import compile_cached, save_code_cache
+from ingest import (get_images_dir, get_image_path, get_content_keys, load_hash_index,
+                    save_hash_index, lookup_stored_result, store_result, match_pixel_key)
 import pytesseract
 from PIL import Image
 
 # 百度OCR API的API Key和Secret Key改为从txt文件读取
 
-def read_baidu_ocr_key():
+def get_baidu_ocr_key_path() -> str:
     current_dir = os.path.dirname(os.path.abspath(__file__))
     scripts_dir = os.path.dirname(current_dir)
     project_dir = os.path.dirname(scripts_dir)
-    key_path = os.path.join(project_dir, 'mu_ban', 'baidu_ocr_key.txt')
-    api_key = ''
-    secret_key = ''
+    return os.path.join(project_dir, 'mu_ban', 'baidu_ocr_key.txt')
+
+def read_baidu_ocr_settings():
+    """
+    读取 mu_ban/baidu_ocr_key.txt 中所有 名称 = 值 的行
+
+    @return {dict} {名称: 值}，读取失败时为空字典
+    """
+    key_path = get_baidu_ocr_key_path()
+    settings = {}
     try:
         with open(key_path, 'r', encoding='utf-8') as f:
             for line in f:
                 line = line.strip()
-                if line.startswith('API_KEY'):
+                if '=' in line and not line.startswith('#'):
                     # 解析等号右侧内容，去除引号和空格
-                    api_key = line.split('=', 1)[1].strip().strip('"').strip("'")
-                elif line.startswith('SECRET_KEY'):
-                    secret_key = line.split('=', 1)[1].strip().strip('"').strip("'")
-        return api_key, secret_key
+                    name, value = line.split('=', 1)
+                    settings[name.strip()] = value.strip().strip('"').strip("'")
     except Exception as e:
         print(f"读取百度OCR密钥文件失败: {e}")
-        return '', ''
+    return settings
 
-# 获取access_token
+def read_baidu_ocr_key():
+    settings = read_baidu_ocr_settings()
+    return settings.get('API_KEY', ''), settings.get('SECRET_KEY', '')
 
-def get_access_token():
-    API_KEY, SECRET_KEY = read_baidu_ocr_key()
-    if not API_KEY or not SECRET_KEY:
-        print("API_KEY 或 SECRET_KEY 为空，请在 mu_ban/baidu_ocr_key.txt 中填写！")
-        return None
+def create_ocr_pool():
+    """
+    按 baidu_ocr_key.txt 中的 WORKERS / QPS 创建识别线程池，见 ocr_pool.py
+    """
+    settings = read_baidu_ocr_settings()
     try:
-        url = f'https://aip.baidubce.com/oauth/2.0/token?grant_type=client_credentials&client_id={API_KEY}&client_secret={SECRET_KEY}'
-        resp = requests.get(url)
-        data = resp.json()
-        return data.get('access_token', None)
-    except Exception as e:
-        print(f"获取access_token失败: {e}")
-        return None
+        workers = int(settings.get('WORKERS', DEFAULT_WORKERS))
+        qps = float(settings.get('QPS', DEFAULT_QPS))
+    except ValueError as e:
+        print(f"WORKERS / QPS 配置无效，使用默认值: {e}")
+        workers, qps = DEFAULT_WORKERS, DEFAULT_QPS
+    # 每个在途请求占一条长连接
+    http_client.configure(pool_size=workers)
+    return OcrPool(workers, qps)
+
+def read_mosaic_setting() -> bool:
+    """
+    baidu_ocr_key.txt 中 MOSAIC = 1 时启用拼图识别，见 roi_mosaic.py
+    """
+    return read_baidu_ocr_settings().get('MOSAIC', '0').lower() in ('1', 'true', 'yes', 'on')
+
+# 获取access_token，进程内共用，并缓存到 lin_shi/baidu_token.json，见 baidu_token.py
+# 密钥文件只在修改后重新读取
+_token_manager = TokenManager(read_baidu_ocr_key, get_baidu_ocr_key_path())
+
+def get_access_token():
+    return _token_manager.get()
 
 def get_file_content_as_base64(image_array, urlencoded=False):
     _, img_encoded = cv2.imencode('.png', image_array)
@@ -56,28 +89,60 @@ def get_file_content_as_base64(image_array, urlencoded=False):
         content = urllib.parse.quote_plus(content)
     return content
 
-def baidu_ocr(image_array, access_token):
+def build_baidu_payload(image_array) -> bytes:
+    image_base64 = get_file_content_as_base64(image_array, True)
+    payload = f'image={image_base64}&language_type=CHN_ENG&detect_direction=false&paragraph=false&probability=false&multidirectional_recognize=false'
+    return payload.encode("utf-8")
+
+def request_baidu_ocr(payload: bytes, access_token: str, endpoint: str = 'accurate_basic') -> dict:
+    """
+    请求一次百度通用文字识别（高精度版）
+
+    @param endpoint {str} accurate_basic 只返回文字；accurate 为含位置版，每行附带 location
+    @return {dict} 接口结果
+    @raise {OcrError} 网络错误或接口返回错误码，见 ocr_retry.py
+    """
+    url = f"https://aip.baidubce.com/rest/2.0/ocr/v1/{endpoint}?access_token={access_token}"
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Accept': 'application/json'
+    }
     try:
-        url = f"https://aip.baidubce.com/rest/2.0/ocr/v1/accurate_basic?access_token={access_token}"
-        image_base64 = get_file_content_as_base64(image_array, True)
-        payload = f'image={image_base64}&language_type=CHN_ENG&detect_direction=false&paragraph=false&probability=false&multidirectional_recognize=false'
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept': 'application/json'
-        }
-        response = requests.request("POST", url, headers=headers, data=payload.encode("utf-8"))
-        result = response.json()
-        if "words_result" in result:
-            words = result["words_result"]
-            formatted_text = ""
-            for word in words:
-                formatted_text += word["words"] + "\n"
-            return formatted_text.strip()
-        else:
-            return ""
-    except Exception as e:
-        print(f"百度OCR识别出错: {str(e)}")
-        return ""
+        response = http_client.post(url, headers=headers, data=payload)
+    except http_client.RequestException as e:
+        raise OcrError(f'网络错误: {e}', TRANSIENT)
+    return check_response(response)
+
+def baidu_ocr(image_array, limiter=None):
+    """
+    百度OCR识别；限流和临时错误退避重试，access_token 失效时重新获取后重放
+
+    @param limiter {TokenBucket} 百度OCR的限速器，每次请求前先取令牌
+    @return {str} 识别文本
+    @raise {OcrError} 永久错误，或重试次数用完
+    """
+    payload = build_baidu_payload(image_array)
+    result = call_with_retry(lambda token: request_baidu_ocr(payload, token), _token_manager, limiter)
+    formatted_text = ""
+    for word in result.get("words_result", []):
+        formatted_text += word["words"] + "\n"
+    return formatted_text.strip()
+
+def baidu_ocr_lines(image_array, limiter=None) -> list:
+    """
+    百度OCR识别并返回每行文字的位置（高精度含位置版），供拼图模式使用
+
+    @return {list} [(文本, (left, top, width, height)), ...]
+    @raise {OcrError} 永久错误，或重试次数用完
+    """
+    payload = build_baidu_payload(image_array)
+    result = call_with_retry(lambda token: request_baidu_ocr(payload, token, 'accurate'), _token_manager, limiter)
+    lines = []
+    for word in result.get("words_result", []):
+        location = word.get("location") or {}
+        box = tuple(location.get(k, 0) for k in ('left', 'top', 'width', 'height'))
+        lines.append((word["words"], box))
+    return lines
 
 def tesseract_ocr(image_array, access_token=None):
     # image_array: numpy.ndarray (BGR)
@@ -91,11 +156,46 @@ def tesseract_ocr(image_array, access_token=None):
         print(f"Tesseract OCR识别出错: {e}")
         return ""
 
+def tesseract_ocr_lines(image_array, limiter=None) -> list:
+    """
+    Tesseract识别并返回每行文字的位置，供拼图模式使用
+
+    @return {list} [(文本, (left, top, width, height)), ...]
+    """
+    try:
+        rgb_img = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
+        data = pytesseract.image_to_data(Image.fromarray(rgb_img), lang='chi_sim+eng',
+                                         output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        print(f"Tesseract OCR识别出错: {e}")
+        return []
+    # image_to_data 按词返回，同一 (块, 段, 行) 的词合成一行，行框取各词框的并集
+    lines = {}
+    for i, word in enumerate(data['text']):
+        word = word.strip()
+        if not word:
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        x1, y1 = data['left'][i], data['top'][i]
+        x2, y2 = x1 + data['width'][i], y1 + data['height'][i]
+        if key not in lines:
+            lines[key] = [[], [x1, y1, x2, y2]]
+        words, box = lines[key]
+        words.append(word)
+        box[:] = [min(box[0], x1), min(box[1], y1), max(box[2], x2), max(box[3], y2)]
+    return [(' '.join(words), (x1, y1, x2 - x1, y2 - y1)) for words, (x1, y1, x2, y2) in lines.values()]
+
 OCR_ENGINES = {
     'tesseractOCR': tesseract_ocr,
     '百度OCR': baidu_ocr
 }
 
+# 拼图模式使用的带位置识别函数，签名为 (图像, 限速器)
+OCR_LINE_ENGINES = {
+    'tesseractOCR': tesseract_ocr_lines,
+    '百度OCR': baidu_ocr_lines
+}
+
 def load_recognition_schemes(pkl_path):
     """
     读取shared_data.pkl，获取每个类别的识别区划分方案、预处理、后处理、OCR引擎
@@ -123,144 +223,407 @@ def load_recognition_schemes(pkl_path):
 def exec_code(code_str, local_vars):
     """
     动态执行代码字符串，local_vars为本地变量字典
+    代码按源码哈希只编译一次，见 code_cache.py
     """
     try:
-        exec(code_str, {}, local_vars)
+        exec(compile_cached(code_str), {}, local_vars)
     except Exception as e:
         print(f'执行动态代码出错: {e}')
 
 
-def recognize_images(classify_result: dict) -> dict:
+def warm_code_cache(schemes: dict, global_basic_types: dict):
     """
-    主识别流程
-    classify_result: {图片名: 类别}
-    返回: {图片名: [ {area_name, type, coords, text}, ... ] }
+    预先编译所有预处理/后处理方案，识别时每个识别区直接取缓存
+    """
+    area_infos = list(global_basic_types.values())
+    for type_scheme in schemes.values():
+        if isinstance(type_scheme, dict):
+            area_infos.extend(type_scheme.values())
+    for area_info in area_infos:
+        if not isinstance(area_info, dict):
+            continue
+        for field in ('预处理方案', '后处理方案'):
+            code_str = area_info.get(field)
+            if code_str:
+                try:
+                    compile_cached(code_str)
+                except SyntaxError as e:
+                    print(f'{field} 存在语法错误: {e}')
+    save_code_cache()
+
+
+def prepare_recognition(hash_index: dict = None, images_dir: str = None):
+    """
+    读取识别所需的方案、标注等，整个批次只做一次；access_token 在第一个百度OCR识别区调用时才获取
+
+    @param hash_index {dict} 内容哈希索引，不传时自动读取
+    @param images_dir {str} 批次图片目录，默认 lin_shi/dai_shi_bie
+    @return {dict} 识别上下文
     """
     # 路径准备
     current_dir = os.path.dirname(os.path.abspath(__file__))
     scripts_dir = os.path.dirname(current_dir)
     project_dir = os.path.dirname(scripts_dir)
     pkl_path = os.path.join(project_dir, 'mu_ban', 'shared_data.pkl')
-    images_dir = os.path.join(project_dir, 'lin_shi', 'dai_shi_bie')
+    images_dir = images_dir or get_images_dir()
 
     # 读取识别区划分方案等
     schemes, global_basic_types = load_recognition_schemes(pkl_path)
-
-    # 获取access_token
-    access_token = get_access_token()
-    if not access_token:
-        print('获取access_token失败，无法进行百度OCR识别！')
-        return {}
+    warm_code_cache(schemes, global_basic_types)
 
     # 读取pkl3标注
     with open(pkl_path, 'rb') as f:
         all_data = pickle.load(f)
 
-    results = {}
-    for img_name, img_type in classify_result.items():
-        img_path = os.path.join(images_dir, img_name)
-        image = cv2.imread(img_path)
-        if image is None:
-            results[img_name] = [{'error': '图片无法读取'}]
+    return {
+        'images_dir': images_dir,
+        'schemes': schemes,
+        'global_basic_types': global_basic_types,
+        'all_data': all_data,
+        'hash_index': hash_index if hash_index is not None else load_hash_index(),
+        'content_keys': get_content_keys(images_dir),
+        'ocr_pool': create_ocr_pool(),
+        'mosaic': read_mosaic_setting(),
+        # 别名 -> 识别方案哈希，按需计算，见 get_scheme_hash
+        'scheme_hashes': {},
+    }
+
+def get_scheme_hash(img_type: str, context: dict) -> str:
+    """
+    一个别名的识别方案的哈希：pkl3 标注框、pkl5 识别区以及全局 basic_type 的预处理/后处理/OCR引擎，
+    任何一项修改过，保存的识别结果都不再整张复用
+
+    @return {str} 16位十六进制哈希
+    """
+    hashes = context['scheme_hashes']
+    if img_type not in hashes:
+        alias_data = context['all_data'].get(img_type, {})
+        scheme = {
+            'boxes': alias_data.get('pkl3', {}).get('boxes', []),
+            'areas': context['schemes'].get(img_type) or {},
+            'basic_types': context['global_basic_types'],
+        }
+        text = json.dumps(scheme, sort_keys=True, ensure_ascii=False, default=str)
+        hashes[img_type] = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+    return hashes[img_type]
+
+def close_recognition(context: dict):
+    """
+    批次结束时关闭识别线程池
+    """
+    pool = context.get('ocr_pool') if context else None
+    if pool is not None:
+        pool.shutdown()
+
+def recognize_roi(roi, area_info: dict, limiter=None):
+    """
+    对单个识别区执行 预处理 -> OCR -> 后处理
+
+    @param limiter {TokenBucket} 百度OCR的限速器，调用前先取令牌
+    @raise {OcrError} 百度OCR重试后仍失败
+    """
+    roi = preprocess_roi(roi, area_info)
+    ocr_engine_name = area_info.get('OCR引擎', 'tesseractOCR')
+    ocr_func = OCR_ENGINES.get(ocr_engine_name, tesseract_ocr)
+    if ocr_engine_name == '百度OCR':
+        ocr_result = ocr_func(roi, limiter)
+    else:
+        ocr_result = ocr_func(roi)
+    return postprocess_text(ocr_result, area_info)
+
+def preprocess_roi(roi, area_info: dict):
+    pre_code = area_info.get('预处理方案', '')
+    if pre_code:
+        # 识别区是整张图片的视图，预处理可能原地修改，先复制，免得影响相邻或重叠的识别区
+        local_vars = {'img': roi.copy(), 'np': np, 'cv2': cv2}
+        exec_code(pre_code, local_vars)
+        roi = local_vars.get('img', roi)
+    return roi
+
+def postprocess_text(text: str, area_info: dict) -> str:
+    post_code = area_info.get('后处理方案', '')
+    if post_code:
+        local_vars = {'text': text}
+        exec_code(post_code, local_vars)
+        text = local_vars.get('text', text)
+    return text
+
+def recognize_regions(regions: list, context: dict) -> list:
+    """
+    并发识别一张图片的多个识别区
+
+    @param regions {list} [(识别区图像, 识别区配置), ...]
+    @return {list} [(识别文本, 错误信息或None), ...]，与 regions 顺序一致
+    """
+    if context.get('mosaic'):
+        return recognize_regions_mosaic(regions, context)
+    pool = context.get('ocr_pool')
+    limiter = pool.baidu_limiter if pool is not None else None
+    def run(region):
+        roi, area_info = region
+        try:
+            return recognize_roi(roi, area_info, limiter=limiter), None
+        except OcrError as e:
+            print(f"百度OCR识别失败: {e}")
+            return '', str(e)
+    if pool is None or len(regions) <= 1:
+        return [run(region) for region in regions]
+    return pool.map(run, regions)
+
+def recognize_regions_mosaic(regions: list, context: dict) -> list:
+    """
+    拼图模式：同一OCR引擎的识别区预处理后拼到画布上，每张画布只调用一次OCR，见 roi_mosaic.py
+
+    @return {list} 同 recognize_regions；一张画布识别失败时，画布上的识别区都记为失败
+    """
+    pool = context.get('ocr_pool')
+    limiter = pool.baidu_limiter if pool is not None else None
+    by_engine = {}
+    for index, (roi, area_info) in enumerate(regions):
+        engine = area_info.get('OCR引擎', 'tesseractOCR')
+        if engine not in OCR_LINE_ENGINES:
+            engine = 'tesseractOCR'
+        by_engine.setdefault(engine, []).append((index, preprocess_roi(roi, area_info)))
+    jobs = [(engine, mosaic) for engine, rois in by_engine.items() for mosaic in build_mosaics(rois)]
+    def run(job):
+        engine, mosaic = job
+        try:
+            return mosaic.assign(OCR_LINE_ENGINES[engine](mosaic.image, limiter)), None
+        except OcrError as e:
+            print(f"百度OCR识别失败: {e}")
+            return {}, str(e)
+    if pool is None or len(jobs) <= 1:
+        outcomes = [run(job) for job in jobs]
+    else:
+        outcomes = pool.map(run, jobs)
+    texts, errors = {}, {}
+    for (_, mosaic), (assigned, error) in zip(jobs, outcomes):
+        for index, _, _ in mosaic.slots:
+            if error:
+                errors[index] = error
+            else:
+                texts[index] = '\n'.join(assigned.get(index, []))
+    results = []
+    for index, (_, area_info) in enumerate(regions):
+        if index in errors:
+            results.append(('', errors[index]))
+        else:
+            results.append((postprocess_text(texts.get(index, ''), area_info), None))
+    return results
+
+def get_stored_result(img_name: str, img_type: str, context: dict):
+    """
+    往次运行已识别过且类别一致的图片直接复用结果，不再消耗OCR额度
+
+    @return {list|None} 保存的识别结果
+    """
+    content_key = context['content_keys'].get(img_name)
+    stored = lookup_stored_result(context['hash_index'], content_key, img_type, get_scheme_hash(img_type, context))
+    if stored is None:
+        return None
+    failed = count_failed_regions(stored)
+    if failed:
+        # 交给 recognize_image，只重新识别失败的识别区
+        print(f"[缓存] {img_name} 有 {failed} 个识别区上次识别失败，重新识别")
+        return None
+    print(f"[缓存] {img_name} 复用往次识别结果")
+    return stored
+
+def count_failed_regions(img_result: list) -> int:
+    return sum(1 for area in img_result if isinstance(area, dict) and area.get('error'))
+
+def get_region_hash(area_info: dict) -> str:
+    """
+    单个识别区的 预处理方案 / 后处理方案 / OCR引擎 的哈希
+    """
+    scheme = [area_info.get('预处理方案', ''), area_info.get('后处理方案', ''), area_info.get('OCR引擎', 'tesseractOCR')]
+    return hashlib.sha256(json.dumps(scheme, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+def reuse_region(previous: list, slot: int, area: dict) -> bool:
+    """
+    往次结果中同一位置的识别区识别成功、且区域和处理方案都未变时，沿用它的文本
+    """
+    old = previous[slot] if previous and slot < len(previous) else None
+    if not old or old.get('error') or old.get('area_name') != area['area_name']:
+        return False
+    if old.get('scheme') != area['scheme']:
+        return False
+    # 哈希索引是JSON，坐标读回来是列表
+    if list(old.get('coords') or []) != list(area['coords']):
+        return False
+    area['text'] = old.get('text', '')
+    return True
+
+def recognize_image(image, img_name: str, img_type: str, context: dict) -> list:
+    """
+    识别一张已解码的图片，并把结果记入哈希索引
+
+    往次运行中识别失败的识别区带有 error 字段；同一图片再次识别时只重新识别这些识别区，
+    以及坐标或 预处理/后处理/OCR引擎 修改过的识别区，其余识别区沿用往次的文本。
+
+    @param image {np.ndarray} BGR图片
+    @param img_name {str} 图片名
+    @param img_type {str} 图片类别（别名）
+    @param context {dict} prepare_recognition 返回的识别上下文
+    @return {list} [ {area_name, type, coords, scheme, text[, error]}, ... ]
+    """
+    global_basic_types = context['global_basic_types']
+    # 入库时的内容键只按字节计算；像素相同的往次图片在这里认领，它识别过的识别区下面逐个沿用。
+    # 预处理可能原地修改识别区，像素哈希要在切出识别区之前计算
+    content_key = match_pixel_key(context['hash_index'], context['content_keys'].get(img_name), image)
+    if content_key:
+        context['content_keys'][img_name] = content_key
+    img_result = []
+    # 先收集所有识别区，再一起并发识别；slots 记录每个识别区在 img_result 中的位置
+    regions = []
+    slots = []
+    # 读取该图片的pkl3标注
+    pkl3_data = context['all_data'].get(img_type, {}).get('pkl3', {})
+    boxes = pkl3_data.get('boxes', [])
+    # 遍历所有框，按type对应basic_type_x
+    for box in boxes:
+        box_type = box.get('type')
+        area_name = box.get('area_name') or f'basic_type_{box_type}'
+        pt1 = box.get('pt1')
+        pt2 = box.get('pt2')
+        print(f"[调试] box: type={box_type}, area_name={area_name}, pt1={pt1}, pt2={pt2}")
+        if not (1 <= box_type <= 4):
             continue
-        img_result = []
-        # 读取该图片的pkl3标注
-        pkl3_data = all_data.get(img_type, {}).get('pkl3', {})
-        boxes = pkl3_data.get('boxes', [])
-        # 遍历所有框，按type对应basic_type_x
-        for box in boxes:
-            box_type = box.get('type')
-            area_name = box.get('area_name') or f'basic_type_{box_type}'
-            pt1 = box.get('pt1')
-            pt2 = box.get('pt2')
-            print(f"[调试] box: type={box_type}, area_name={area_name}, pt1={pt1}, pt2={pt2}")
-            if not (1 <= box_type <= 4):
-                continue
-            basic_type_key = f'basic_type_{box_type}'
-            area_info = global_basic_types.get(basic_type_key, {})
-            if not pt1 or not pt2:
-                img_result.append({'area_name': area_name, 'type': box_type, 'coords': None, 'text': '无区域坐标'})
-                print(f"[调试] 跳过box: type={box_type}, area_name={area_name}，无坐标")
+        basic_type_key = f'basic_type_{box_type}'
+        area_info = global_basic_types.get(basic_type_key, {})
+        if not pt1 or not pt2:
+            img_result.append({'area_name': area_name, 'type': box_type, 'coords': None, 'text': '无区域坐标'})
+            print(f"[调试] 跳过box: type={box_type}, area_name={area_name}，无坐标")
+            continue
+        x1, y1 = pt1
+        x2, y2 = pt2
+        roi = image[min(y1, y2):max(y1, y2), min(x1, x2):max(x1, x2)]
+        regions.append((roi, area_info))
+        slots.append(len(img_result))
+        img_result.append({
+            'area_name': area_name,
+            'type': box_type,
+            'coords': (x1, y1, x2, y2),
+            'scheme': get_region_hash(area_info),
+            'text': ''
+        })
+    # 2. 处理pkl5下的所有非basic_type_x区（如有）
+    type_scheme = context['schemes'].get(img_type)
+    if type_scheme:
+        for area_name, area_info in type_scheme.items():
+            if area_name.startswith('basic_type_'):
+                continue  # 跳过与全局重复的basic_type_x
+            coords = area_info.get('coords')
+            if not coords:
+                img_result.append({'area_name': area_name, 'type': None, 'coords': None, 'text': '无区域坐标'})
+                print(f"[调试] 跳过pkl5区: area_name={area_name}，无坐标")
                 continue
-            x1, y1 = pt1
-            x2, y2 = pt2
-            roi = image[min(y1, y2):max(y1, y2), min(x1, x2):max(x1, x2)]
-            pre_code = area_info.get('预处理方案', '')
-            if pre_code:
-                local_vars = {'img': roi, 'np': np, 'cv2': cv2}
-                exec_code(pre_code, local_vars)
-                roi = local_vars.get('img', roi)
-            ocr_engine_name = area_info.get('OCR引擎', 'tesseractOCR')
-            ocr_func = OCR_ENGINES.get(ocr_engine_name, tesseract_ocr)
-            if ocr_engine_name == '百度OCR':
-                ocr_result = ocr_func(roi, access_token)
-            else:
-                ocr_result = ocr_func(roi)
-            post_code = area_info.get('后处理方案', '')
-            if post_code:
-                local_vars = {'text': ocr_result}
-                exec_code(post_code, local_vars)
-                ocr_result = local_vars.get('text', ocr_result)
-            print(f"[调试] box识别内容: type={box_type}, area_name={area_name}, text={ocr_result}")
+            x1, y1, x2, y2 = coords
+            roi = image[y1:y2, x1:x2]
+            regions.append((roi, area_info))
+            slots.append(len(img_result))
             img_result.append({
                 'area_name': area_name,
-                'type': box_type,
+                'type': None,
                 'coords': (x1, y1, x2, y2),
-                'text': ocr_result
+                'scheme': get_region_hash(area_info),
+                'text': ''
             })
-        # 2. 处理pkl5下的所有非basic_type_x区（如有）
-        type_scheme = schemes.get(img_type)
-        if type_scheme:
-            for area_name, area_info in type_scheme.items():
-                if area_name.startswith('basic_type_'):
-                    continue  # 跳过与全局重复的basic_type_x
-                coords = area_info.get('coords')
-                if not coords:
-                    img_result.append({'area_name': area_name, 'type': None, 'coords': None, 'text': '无区域坐标'})
-                    print(f"[调试] 跳过pkl5区: area_name={area_name}，无坐标")
-                    continue
-                x1, y1, x2, y2 = coords
-                roi = image[y1:y2, x1:x2]
-                pre_code = area_info.get('预处理方案', '')
-                if pre_code:
-                    local_vars = {'img': roi, 'np': np, 'cv2': cv2}
-                    exec_code(pre_code, local_vars)
-                    roi = local_vars.get('img', roi)
-                ocr_engine_name = area_info.get('OCR引擎', 'tesseractOCR')
-                ocr_func = OCR_ENGINES.get(ocr_engine_name, tesseract_ocr)
-                if ocr_engine_name == '百度OCR':
-                    ocr_result = ocr_func(roi, access_token)
-                else:
-                    ocr_result = ocr_func(roi)
-                post_code = area_info.get('后处理方案', '')
-                if post_code:
-                    local_vars = {'text': ocr_result}
-                    exec_code(post_code, local_vars)
-                    ocr_result = local_vars.get('text', ocr_result)
-                print(f"[调试] pkl5区识别内容: area_name={area_name}, text={ocr_result}")
-                img_result.append({
-                    'area_name': area_name,
-                    'type': None,
-                    'coords': (x1, y1, x2, y2),
-                    'text': ocr_result
-                })
-        results[img_name] = img_result
-    return results
+    scheme = get_scheme_hash(img_type, context)
+    # 整张复用要求识别方案完全一致（见 get_stored_result）；走到这里说明有识别区失败过或方案改过，
+    # 按识别区逐个比较，只重新识别需要的
+    previous = lookup_stored_result(context['hash_index'], content_key, img_type)
+    if previous:
+        pending = [(region, slot) for region, slot in zip(regions, slots)
+                   if not reuse_region(previous, slot, img_result[slot])]
+        regions = [region for region, _ in pending]
+        slots = [slot for _, slot in pending]
+    for slot, (ocr_result, error) in zip(slots, recognize_regions(regions, context)):
+        img_result[slot]['text'] = ocr_result
+        if error:
+            img_result[slot]['error'] = error
+        print(f"[调试] 识别内容: type={img_result[slot]['type']}, area_name={img_result[slot]['area_name']}, text={ocr_result}")
+    failed = count_failed_regions(img_result)
+    if failed:
+        print(f"{img_name}: {failed} 个识别区识别失败，下次运行时只重新识别这些识别区")
+    store_result(context['hash_index'], content_key, img_name, img_type, img_result, scheme)
+    return img_result
+
+def recognize_images(classify_result: dict, context: dict = None, images_dir: str = None) -> dict:
+    """
+    主识别流程
+    classify_result: {图片名: 类别}
+    context: prepare_recognition 返回的识别上下文，不传时自动准备并在结束时保存哈希索引
+    images_dir: 批次目录，不传context时使用，默认 lin_shi/dai_shi_bie
+    返回: {图片名: [ {area_name, type, coords, text}, ... ] }
+    """
+    own_context = context is None
+    if own_context:
+        context = prepare_recognition(images_dir=images_dir)
+
+    results = dict(iter_recognize_images(classify_result, context))
+    if own_context:
+        save_hash_index(context['hash_index'])
+        close_recognition(context)
+    # 并发识别按完成顺序返回，这里按输入顺序整理
+    return {name: results[name] for name in classify_result if name in results}
+
+def recognize_one(img_name: str, img_type: str, context: dict) -> list:
+    """
+    识别一张图片：复用缓存结果，或读取原图后识别
+    """
+    if img_type == 'timeout':
+        return [{'error': '判别超时'}]
+    stored = get_stored_result(img_name, img_type, context)
+    if stored is not None:
+        return stored
+    img_path = get_image_path(context['images_dir'], img_name)
+    image = read_image(img_path)
+    if image is None:
+        return [{'error': '图片无法读取'}]
+    try:
+        return recognize_image(image, img_name, img_type, context)
+    except Exception as e:
+        print(f"识别图片 {img_name} 出错: {e}")
+        return [{'error': f'识别出错: {e}'}]
+
+def iter_recognize_images(classify_result: dict, context: dict):
+    """
+    多张图片同时识别，每张图片的识别区再交给识别线程池并发请求
+
+    @return {Iterator[tuple]} (图片名, 识别结果)，按完成顺序
+    """
+    pool = context.get('ocr_pool')
+    workers = pool.workers if pool is not None else 1
+    # 工作线程读取压缩包成员时缓存的句柄，识别结束后关闭
+    handles = ArchiveHandles()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognize',
+                                initializer=handles.register) as executor:
+            futures = {executor.submit(recognize_one, img_name, img_type, context): img_name
+                       for img_name, img_type in classify_result.items()}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    finally:
+        handles.close()
 
-def recognize_with_progress(classify_result):
+def recognize_with_progress(classify_result, images_dir: str = None):
     total = len(classify_result)
     ocr_result = {}
+    # 方案和标注整个批次只准备一次
+    context = prepare_recognition(images_dir=images_dir)
     def process_func(update_copy, update_judge, update_recognize):
         update_copy(total)
         update_judge(total)
         processed = 0
-        for img_name, img_type in classify_result.items():
-            single_result = recognize_images({img_name: img_type})
-            ocr_result.update(single_result)
+        for img_name, single_result in iter_recognize_images(classify_result, context):
+            ocr_result[img_name] = single_result
             processed += 1
             update_recognize(processed)
     show_progress_window(total, total, total, process_func)
-    return ocr_result
+    save_hash_index(context['hash_index'])
+    close_recognition(context)
+    return {name: ocr_result[name] for name in classify_result if name in ocr_result}
 
 if __name__ == '__main__':
     # 演示用：假设有分类结果
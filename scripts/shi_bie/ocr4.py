@@ -1,8 +1,22 @@
 import sys
 import os
 from PyQt6.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout
-from PyQt6.QtGui import QPixmap, QPainter, QColor, QFont, QFontMetrics
+from PyQt6.QtGui import QPixmap, QImage, QPainter, QColor, QFont, QFontMetrics
 from PyQt6.QtCore import Qt, QRect, QSize, pyqtSignal
+from ingest import get_images_dir, list_batch_images, list_duplicate_images
+from image_cache import read_image
+
+def load_pixmap(img_path):
+    """
+    加载图片为QPixmap；通过共享缓存读取，分类/识别阶段解码过的图片不再重复解码
+    """
+    image = read_image(img_path)
+    if image is None:
+        return QPixmap()
+    height, width = image.shape[:2]
+    qimage = QImage(image.data, width, height, image.strides[0], QImage.Format.Format_BGR888)
+    # QImage 不持有 numpy 的内存，转换为 QPixmap 时会复制一份
+    return QPixmap.fromImage(qimage)
 
 class ImageWindow(QWidget):
     def __init__(self, image_paths, on_index_change, save_callback=None):
@@ -13,6 +27,9 @@ class ImageWindow(QWidget):
         self.index = 0
         self.on_index_change = on_index_change
         self.save_callback = save_callback
+        # 当前图片的QPixmap，翻页时才重新加载，缩放窗口时复用
+        self._pixmap = None
+        self._pixmap_index = None
 
         self.image_label = QLabel()
         self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -41,9 +58,14 @@ class ImageWindow(QWidget):
 
         self.update_image()
 
+    def current_pixmap(self):
+        if self._pixmap_index != self.index:
+            self._pixmap = load_pixmap(self.image_paths[self.index])
+            self._pixmap_index = self.index
+        return self._pixmap
+
     def update_image(self):
-        img_path = self.image_paths[self.index]
-        pixmap = QPixmap(img_path)
+        pixmap = self.current_pixmap()
         if not pixmap.isNull():
             scaled = pixmap.scaled(self.image_label.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
             self.image_label.setPixmap(scaled)
@@ -53,8 +75,7 @@ class ImageWindow(QWidget):
         self.on_index_change(self.index, self.get_image_display_info())
 
     def get_image_display_info(self):
-        img_path = self.image_paths[self.index]
-        pixmap = QPixmap(img_path)
+        pixmap = self.current_pixmap()
         label_size = self.image_label.size()
         if pixmap.isNull() or label_size.width() == 0 or label_size.height() == 0:
             return None
@@ -91,11 +112,13 @@ class ImageWindow(QWidget):
 
 class ResultOverlayWindow(QWidget):
     save_requested = pyqtSignal(dict)  # 新增信号
-    def __init__(self, image_paths, ocr_results, get_display_info_func, save_callback=None, classify_result=None):
+    def __init__(self, image_paths, ocr_results, get_display_info_func, save_callback=None, classify_result=None, image_names=None):
         super().__init__()
         self.setWindowTitle('识别结果')
         self.setGeometry(950, 100, 800, 600)
         self.image_paths = image_paths
+        # 清单模式下图片名不一定等于路径的basename
+        self.image_names = image_names or [os.path.basename(p) for p in image_paths]
         self.ocr_results = ocr_results
         self.index = 0
         self.display_info = None
@@ -117,7 +140,7 @@ class ResultOverlayWindow(QWidget):
         super().paintEvent(event)
         if not self.display_info:
             return
-        img_name = os.path.basename(self.image_paths[self.index])
+        img_name = self.image_names[self.index]
         result = self.ocr_results.get(img_name, [])
         painter = QPainter(self)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
@@ -125,6 +148,8 @@ class ResultOverlayWindow(QWidget):
             for area_info in result:
                 coords = area_info.get('coords')
                 text = area_info.get('text', '')
+                if area_info.get('error'):
+                    text = f"[识别失败] {area_info['error']}"
                 area_type = area_info.get('type')
                 area_name = area_info.get('area_name')
                 if coords:
@@ -175,14 +200,12 @@ class ResultOverlayWindow(QWidget):
 
     # get_area_coords 已不再需要，所有坐标已在识别结果中
 
-def show_image_and_results(ocr_results: dict, classify_result: dict, save_callback=None):
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    scripts_dir = os.path.dirname(current_dir)
-    project_dir = os.path.dirname(scripts_dir)
-    images_dir = os.path.join(project_dir, 'lin_shi', 'dai_shi_bie')
-    image_paths = [os.path.join(images_dir, f) for f in os.listdir(images_dir)
-                   if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp'))]
-    image_paths.sort()
+def show_image_and_results(ocr_results: dict, classify_result: dict, save_callback=None, images_dir: str = None):
+    images_dir = images_dir or get_images_dir()
+    # 内容重复的图片显示保留的那一张
+    images = sorted(list_batch_images(images_dir) + list_duplicate_images(images_dir))
+    image_names = [name for name, _ in images]
+    image_paths = [path for _, path in images]
     if not image_paths:
         print('未找到图片')
         return
@@ -195,7 +218,7 @@ def show_image_and_results(ocr_results: dict, classify_result: dict, save_callba
             if display_info:
                 result_win.resize(display_info['show_w'], display_info['show_h'])
         else:
-            result_win = ResultOverlayWindow(image_paths, ocr_results, None, save_callback, classify_result)
+            result_win = ResultOverlayWindow(image_paths, ocr_results, None, save_callback, classify_result, image_names)
             result_win.show_result(idx, display_info)
             result_win.show()
     def save_callback_wrapper():
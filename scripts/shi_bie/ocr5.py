@@ -1,10 +1,17 @@
 import sys
+import time
+from collections import deque
 from PyQt6.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout, QProgressBar, QTextEdit
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QThread, QEventLoop, pyqtSignal
+
+# 按最近这么多张实际判别的图片估算速度
+RATE_WINDOW = 32
 
 class ProgressWindow(QWidget):
-    def __init__(self, total_copy, total_judge, total_recognize):
+    def __init__(self, total_copy, total_judge, total_recognize, streaming=False):
         super().__init__()
+        # 流水线模式下三个阶段同时推进，三行进度一起显示
+        self.streaming = streaming
         self.setWindowTitle('处理进度')
         self.setGeometry(400, 300, 400, 220)
         self.total_copy = total_copy
@@ -13,6 +20,11 @@ class ProgressWindow(QWidget):
         self.copy_count = 0
         self.judge_count = 0
         self.recognize_count = 0
+        # 流式分类时的速度统计：开始时间、最近判别完成的时刻、复用往次结果的张数
+        self.judge_started = None
+        self.judge_times = deque(maxlen=RATE_WINDOW)
+        self.judge_cached = 0
+        self.last_judged = ''
         layout = QVBoxLayout()
         self.text = QTextEdit()
         self.text.setReadOnly(True)
@@ -29,9 +41,19 @@ class ProgressWindow(QWidget):
         self.update_text()
     def update_text(self):
         lines = []
+        if self.streaming:
+            lines.append(f'已读取: {self.copy_count} / {self.total_copy}')
+            lines.append(f'已判断: {self.judge_count} / {self.total_judge}')
+            lines.append(f'已识别: {self.recognize_count} / {self.total_recognize}')
+            self.text.setText('\n'.join(lines))
+            return
         lines.append(f'已复制: {self.copy_count} / {self.total_copy}')
         if self.copy_count >= self.total_copy:
             lines.append(f'已判断: {self.judge_count} / {self.total_judge}')
+            if self.judge_started is not None and self.judge_count < self.total_judge:
+                lines.append(self.judge_rate_text())
+                if self.last_judged:
+                    lines.append(f'最近: {self.last_judged}')
         if self.judge_count >= self.total_judge and self.total_judge > 0:
             lines.append(f'已识别: {self.recognize_count} / {self.total_recognize}')
         self.text.setText('\n'.join(lines))
@@ -47,6 +69,37 @@ class ProgressWindow(QWidget):
         self.progress_bar.setValue(val)
         self.update_text()
         QApplication.processEvents()
+    def judge_rate_text(self):
+        """
+        速度与预计剩余时间；复用往次结果的图片不计入速度
+        """
+        judged = self.judge_count - self.judge_cached
+        elapsed = time.perf_counter() - self.judge_started
+        if len(self.judge_times) >= 2 and self.judge_times[-1] > self.judge_times[0]:
+            rate = (len(self.judge_times) - 1) / (self.judge_times[-1] - self.judge_times[0])
+        elif judged and elapsed > 0:
+            rate = judged / elapsed
+        else:
+            return '速度: 计算中'
+        remaining = (self.total_judge - self.judge_count) / rate
+        minutes, seconds = divmod(int(remaining + 0.5), 60)
+        return f'速度: {rate:.1f} 张/秒  预计剩余: {minutes:02d}:{seconds:02d}'
+    def judge_item(self, filename, image_type, elapsed):
+        """
+        流式分类每判完一张图片调用一次，运行在界面线程的事件循环中，不需要 processEvents
+        """
+        now = time.perf_counter()
+        if self.judge_started is None:
+            self.judge_started = now
+        self.judge_count += 1
+        if elapsed > 0:
+            self.judge_times.append(now)
+            self.last_judged = f'{filename} -> {image_type} ({elapsed * 1000:.0f} ms)'
+        else:
+            self.judge_cached += 1
+        self.progress_bar.setMaximum(self.total_judge)
+        self.progress_bar.setValue(self.judge_count)
+        self.update_text()
     def update_recognize(self, val):
         self.recognize_count = val
         self.progress_bar.setMaximum(self.total_recognize)
@@ -54,12 +107,13 @@ class ProgressWindow(QWidget):
         self.update_text()
         QApplication.processEvents()
 
-def show_progress_window(total_copy, total_judge, total_recognize, process_func):
+def show_progress_window(total_copy, total_judge, total_recognize, process_func, streaming=False):
     """
     显示进度窗口，process_func需接收3个回调：update_copy, update_judge, update_recognize
+    streaming为True时三个阶段的进度同时显示
     """
     app = QApplication.instance() or QApplication(sys.argv)
-    win = ProgressWindow(total_copy, total_judge, total_recognize)
+    win = ProgressWindow(total_copy, total_judge, total_recognize, streaming)
     win.show()
     def update_copy(val):
         win.update_copy(val)
@@ -68,4 +122,51 @@ def show_progress_window(total_copy, total_judge, total_recognize, process_func)
     def update_recognize(val):
         win.update_recognize(val)
     process_func(update_copy, update_judge, update_recognize)
+    win.close()
+
+class StreamWorker(QThread):
+    """
+    在工作线程中遍历 produce() 返回的生成器，每产出一项就发出 item_ready 信号，
+    信号排队交给界面线程处理，界面在整个过程中保持响应
+    """
+    item_ready = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    def __init__(self, produce):
+        super().__init__()
+        self.produce = produce
+    def run(self):
+        try:
+            for item in self.produce():
+                self.item_ready.emit(item)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+def show_stream_progress(total, produce, on_item=None):
+    """
+    显示分类进度窗口：在 StreamWorker 中运行 produce()，界面线程的事件循环按产出实时更新
+    已判断数、速度和预计剩余时间，分类结束后关闭窗口
+
+    @param total {int} 图片总数
+    @param produce {Callable} 返回生成器的函数，生成器产出 (图片名, 类型, 耗时秒)
+    @param on_item {Callable} on_item(图片名, 类型, 耗时秒)，在界面线程中对每一项调用
+    """
+    app = QApplication.instance() or QApplication(sys.argv)
+    win = ProgressWindow(total, total, total)
+    win.copy_count = total  # 复制阶段已完成
+    win.judge_started = time.perf_counter()
+    win.update_text()
+    win.show()
+    worker = StreamWorker(produce)
+    loop = QEventLoop()
+    def handle(item):
+        if on_item:
+            on_item(*item)
+        win.judge_item(*item)
+    worker.item_ready.connect(handle)
+    worker.failed.connect(lambda msg: print(f"分类出错: {msg}"))
+    # 信号按发出顺序排队，finished 到达时所有结果都已处理
+    worker.finished.connect(loop.quit)
+    worker.start()
+    loop.exec()
+    worker.wait()
     win.close() 
\ No newline at end of file
@@ -4,11 +4,62 @@ import openpyxl
 from openpyxl.styles import Alignment, Font
 from collections import defaultdict
 
-def save_to_excel(results, classify_result):
+HEADERS = ['图片类型', '图片名', '识别区1', '识别区2', '识别区3', '识别区4']
+
+def build_row(type_name, img_name, area_list):
+    """
+    把一张图片的识别结果整理成一行：同类型识别区的内容按【序号】合并到一个单元格
+    """
+    region_contents = {1: [], 2: [], 3: [], 4: []}
+    for area in area_list:
+        region_type = area.get('type', '')
+        text = area.get('text', '')
+        if area.get('error'):
+            # 识别失败的识别区标出原因，不与识别出空文本混淆
+            text = f"[识别失败] {area['error']}"
+        if region_type in [1, 2, 3, 4]:
+            region_contents[region_type].append(text)
+    row = [type_name, img_name]
+    for i in range(1, 5):
+        if region_contents[i]:
+            cell_text = '\n'.join([f'【{idx+1}】\n{t}' for idx, t in enumerate(region_contents[i])])
+        else:
+            cell_text = ''
+        row.append(cell_text)
+    return row
+
+def append_to_excel(results, classify_result, save_path):
+    """
+    把识别结果追加到指定的excel末尾（文件不存在时先写表头），用于监视目录模式持续写入
+    :param results: {图片名: [ {area_name, type, coords, text}, ... ] }
+    :param classify_result: {图片名: 图片类型/别名}
+    :param save_path: excel路径
+    """
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    if os.path.exists(save_path):
+        wb = openpyxl.load_workbook(save_path)
+        ws = wb.active
+    else:
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = '识别结果'
+        ws.append(HEADERS)
+        for cell in ws[1]:
+            cell.font = Font(bold=True)
+            cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    for img_name, area_list in results.items():
+        ws.append(build_row(classify_result.get(img_name, '未知类型'), img_name, area_list))
+        for cell in ws[ws.max_row]:
+            cell.alignment = Alignment(wrap_text=True, vertical='top')
+    wb.save(save_path)
+    print(f"[保存] 已追加 {len(results)} 条识别结果到: {save_path}")
+
+def save_to_excel(results, classify_result, job_id=None):
     """
     保存识别结果为宽表结构，按 classify_result（图片名->类型/别名）分组，每组前插入合并单元格的类型行。
     :param results: {图片名: [ {area_name, type, coords, text}, ... ] }
     :param classify_result: {图片名: 图片类型/别名}
+    :param job_id: 作业id，写进文件名，避免同时运行的批次在同一秒保存时互相覆盖
     """
     # 1. 确定保存路径
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -17,7 +68,10 @@ def save_to_excel(results, classify_result):
     results_dir = os.path.join(project_dir, 'results')
     os.makedirs(results_dir, exist_ok=True)
     now_str = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    save_path = os.path.join(results_dir, f'ocr_results_{now_str}.xlsx')
+    if job_id:
+        save_path = os.path.join(results_dir, f'ocr_results_{now_str}_{job_id}.xlsx')
+    else:
+        save_path = os.path.join(results_dir, f'ocr_results_{now_str}.xlsx')
 
     # 2. 用 classify_result 获取每张图片的类型
     img_type_map = {}  # {图片名: 图片类型}
@@ -33,7 +87,7 @@ def save_to_excel(results, classify_result):
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = '识别结果'
-    headers = ['图片类型', '图片名', '识别区1', '识别区2', '识别区3', '识别区4']
+    headers = HEADERS
     ws.append(headers)
     for cell in ws[1]:
         cell.font = Font(bold=True)
@@ -50,21 +104,7 @@ def save_to_excel(results, classify_result):
         row_idx += 1
         # 插入该类型下所有图片数据
         for img_name in img_list:
-            area_list = results[img_name]
-            region_contents = {1: [], 2: [], 3: [], 4: []}
-            for area in area_list:
-                region_type = area.get('type', '')
-                text = area.get('text', '')
-                if region_type in [1, 2, 3, 4]:
-                    region_contents[region_type].append(text)
-            row = [type_name, img_name]
-            for i in range(1, 5):
-                if region_contents[i]:
-                    cell_text = '\n'.join([f'【{idx+1}】\n{t}' for idx, t in enumerate(region_contents[i])])
-                else:
-                    cell_text = ''
-                row.append(cell_text)
-            ws.append(row)
+            ws.append(build_row(type_name, img_name, results[img_name]))
             row_idx += 1
 
     # 6. 设置所有数据单元格自动换行
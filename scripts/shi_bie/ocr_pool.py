@@ -0,0 +1,74 @@
+"""
+并发识别
+
+每个识别区的 OCR 都是一次网络往返，逐个调用时整批耗时约等于 识别区数 x 往返时间。
+OcrPool 用线程池让多个识别区的请求同时在途，百度OCR的调用先从令牌桶取令牌，
+平均速率不超过账号的 QPS 限额；结果按提交顺序放回对应图片的对应识别区。
+
+并发数和 QPS 可在 mu_ban/baidu_ocr_key.txt 中追加配置（不写时使用默认值）：
+    WORKERS = 4
+    QPS = 2
+追加 MOSAIC = 1 时把一张图片的识别区拼成一张画布识别，见 roi_mosaic.py
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 同时在途的识别请求数
+DEFAULT_WORKERS = 4
+# 百度通用文字识别（高精度版）免费额度的 QPS 限额
+DEFAULT_QPS = 2
+
+
+class TokenBucket:
+    """
+    令牌桶限速，线程安全：平均每秒放行 rate 次，最多连续放行 capacity 次
+    """
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        @param rate {float} 每秒补充的令牌数，即 QPS 限额
+        @param capacity {float} 桶容量；默认1，请求之间至少间隔 1/rate 秒，任意一秒内都不会超限
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        取一个令牌，不够时阻塞等待
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class OcrPool:
+    """
+    一个批次共用的识别线程池与百度OCR限速器
+    """
+    def __init__(self, workers: int = DEFAULT_WORKERS, qps: float = DEFAULT_QPS):
+        """
+        @param workers {int} 同时在途的识别请求数
+        @param qps {float} 百度OCR每秒请求数上限，0或None为不限
+        """
+        self.workers = max(1, int(workers))
+        self.baidu_limiter = TokenBucket(qps) if qps else None
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ocr')
+
+    def map(self, func, *iterables) -> list:
+        """
+        并发执行 func，结果按输入顺序返回；任务出错时抛出第一个异常
+        """
+        return list(self._executor.map(func, *iterables))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,126 @@
+"""
+百度OCR的错误分类与重试
+
+接口出错时按错误码分为四类分别处理，而不是一律当作空文本：
+    throttle   超过 QPS 限额（18）等，按带随机抖动的指数退避等待后重试
+    transient  网络错误、HTTP 5xx、服务暂时不可用（1、2、282000）等，同样退避后重试
+    auth       access_token 无效或过期（110、111），作废旧 token、重新申请后立即重放一次
+    permanent  图片格式、尺寸、每日额度用尽等，重试也不会成功，直接失败
+每个识别区最多尝试 MAX_ATTEMPTS 次；仍失败时抛出 OcrError，由调用方记到对应识别区上。
+"""
+import time
+import random
+
+THROTTLE = 'throttle'
+TRANSIENT = 'transient'
+AUTH = 'auth'
+PERMANENT = 'permanent'
+
+# 4: 集群超限额  18: QPS 超限额
+THROTTLE_CODES = {4, 18}
+# 1: 服务器内部错误  2: 服务暂不可用  282000: 服务器内部错误
+TRANSIENT_CODES = {1, 2, 282000}
+# 110: access_token 无效  111: access_token 过期
+AUTH_CODES = {110, 111}
+
+# 每个识别区最多请求的次数（含第一次）
+MAX_ATTEMPTS = 5
+# 退避的基准和上限（秒），第 n 次重试前等待 [0, min(MAX_DELAY, BASE_DELAY * 2^n)] 内的随机时长
+BASE_DELAY = 0.5
+MAX_DELAY = 8.0
+
+
+class OcrError(Exception):
+    """
+    OCR 请求失败
+
+    @param kind {str} 错误类别，THROTTLE / TRANSIENT / AUTH / PERMANENT
+    @param code {int|None} 接口返回的错误码
+    """
+    def __init__(self, message: str, kind: str = PERMANENT, code=None):
+        super().__init__(message)
+        self.kind = kind
+        self.code = code
+
+
+def classify_error_code(code) -> str:
+    """
+    @return {str} 错误码对应的类别，未列出的错误码视为 PERMANENT
+    """
+    try:
+        code = int(code)
+    except (TypeError, ValueError):
+        return PERMANENT
+    if code in THROTTLE_CODES:
+        return THROTTLE
+    if code in TRANSIENT_CODES:
+        return TRANSIENT
+    if code in AUTH_CODES:
+        return AUTH
+    return PERMANENT
+
+
+def check_response(response) -> dict:
+    """
+    检查百度接口的响应
+
+    @param response {requests.Response} 接口响应
+    @return {dict} 解析后的结果
+    @raise {OcrError} HTTP 状态码或 error_code 表示出错时
+    """
+    if response.status_code == 429:
+        raise OcrError(f'HTTP {response.status_code}', THROTTLE)
+    if response.status_code >= 500:
+        raise OcrError(f'HTTP {response.status_code}', TRANSIENT)
+    try:
+        result = response.json()
+    except ValueError:
+        raise OcrError(f'响应不是有效的JSON (HTTP {response.status_code})', TRANSIENT)
+    code = result.get('error_code')
+    if code:
+        raise OcrError(f"{code} {result.get('error_msg', '')}".strip(), classify_error_code(code), code)
+    return result
+
+
+def backoff_delay(retry: int) -> float:
+    """
+    第 retry 次重试前的等待时长（full jitter），多个线程同时被限流时不会在同一时刻一起重试
+    """
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** retry))
+
+
+def call_with_retry(request, tokens, limiter=None, max_attempts: int = MAX_ATTEMPTS):
+    """
+    按错误类别重试一次 OCR 请求
+
+    @param request {Callable} request(access_token)，成功时返回结果，失败时抛出 OcrError
+    @param tokens {TokenManager} access_token 来源，见 baidu_token.py
+    @param limiter {TokenBucket} 限速器，每次请求前先取令牌
+    @param max_attempts {int} 最多请求次数
+    @return 请求结果
+    @raise {OcrError} 永久错误，或重试次数用完
+    """
+    refreshed = False
+    error = None
+    for attempt in range(max_attempts):
+        token = tokens.get()
+        if not token:
+            raise OcrError('获取access_token失败', AUTH)
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return request(token)
+        except OcrError as e:
+            error = e
+        if error.kind == AUTH and not refreshed:
+            # 缓存的 token 被服务端作废（如密钥重置），换新 token 后立即重放，只做一次
+            print(f"access_token 失效（{error}），重新获取后重试")
+            tokens.invalidate(token)
+            refreshed = True
+            continue
+        if error.kind not in (THROTTLE, TRANSIENT) or attempt + 1 >= max_attempts:
+            break
+        delay = backoff_delay(attempt)
+        print(f"百度OCR请求失败（{error}），{delay:.1f} 秒后第 {attempt + 1} 次重试")
+        time.sleep(delay)
+    raise error
@@ -1,44 +1,67 @@
+import argparse
 from ocr1 import run_ocr1
 from ocr2 import classify_with_progress
 from ocr3 import recognize_with_progress
 from ocr4 import show_image_and_results
 from ocr6 import save_to_excel
-import os
-import shutil
+from pipeline import pipeline_with_progress
+from ingest import create_job, remove_job, get_images_dir, expand_duplicates
 
-def main():
-    run_ocr1()
-    classify_result = classify_with_progress()
-    if not classify_result:
-        print("分类失败，程序结束")
-        return
-    ocr_result = recognize_with_progress(classify_result)
+def main(streaming=True, classify_workers=None, judge_timeout=None, image_timeout=None, use_templates=False):
+    """
+    @param streaming {bool} True时读取、判别、识别按流水线并行；False时按原来的三个阶段依次执行
+    @param classify_workers {int} 判别进程数，None为CPU核数；流水线和分阶段执行都生效
+    @param judge_timeout {float} 单个判别函数的时间预算（秒），None为不限；流水线和分阶段执行都生效
+    @param image_timeout {float} 单张图片判别的时间预算（秒），None为不限
+    @param use_templates {bool} 按模板版面指纹分类，不调用判别函数；流水线和分阶段执行都生效
+    """
+    # 每次运行使用独立的作业目录，多个批次可同时运行
+    job_id, images_dir = create_job()
+    print(f"作业: {job_id}")
+    try:
+        run_job(job_id, images_dir, streaming, classify_workers, judge_timeout, image_timeout, use_templates)
+    finally:
+        # 程序结束前删除本次作业的临时目录
+        remove_job(job_id)
+
+def run_job(job_id, images_dir, streaming=True, classify_workers=None, judge_timeout=None, image_timeout=None,
+            use_templates=False):
+    run_ocr1(images_dir=images_dir)
+    if streaming:
+        classify_result, ocr_result = pipeline_with_progress(images_dir=images_dir, judge_timeout=judge_timeout,
+                                                             image_timeout=image_timeout,
+                                                             classify_workers=classify_workers,
+                                                             use_templates=use_templates)
+        if not classify_result:
+            print("分类失败，程序结束")
+            return
+    else:
+        classify_result = classify_with_progress(images_dir, classify_workers, judge_timeout, image_timeout,
+                                                 use_templates)
+        if not classify_result:
+            print("分类失败，程序结束")
+            return
+        ocr_result = recognize_with_progress(classify_result, images_dir)
     if not ocr_result:
         print("识别失败，程序结束")
         return
+    # 内容重复的图片沿用保留的那一张的结果，每个拖入的文件都有一行
+    classify_result, ocr_result = expand_duplicates(images_dir or get_images_dir(), classify_result, ocr_result)
 
     # 保存回调，调用ocr6保存excel
     def save_callback(results, classify_result):
         print("[保存回调] 收到保存请求，正在保存到Excel...")
-        save_to_excel(results, classify_result)
-
-    show_image_and_results(ocr_result, classify_result, save_callback=save_callback)
+        save_to_excel(results, classify_result, job_id)
 
-    # 程序结束前清空临时文件夹
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    scripts_dir = os.path.dirname(current_dir)
-    project_dir = os.path.dirname(scripts_dir)
-    temp_dir = os.path.join(project_dir, 'lin_shi', 'dai_shi_bie')
-    if os.path.exists(temp_dir):
-        for f in os.listdir(temp_dir):
-            fp = os.path.join(temp_dir, f)
-            try:
-                if os.path.isfile(fp) or os.path.islink(fp):
-                    os.unlink(fp)
-                elif os.path.isdir(fp):
-                    shutil.rmtree(fp)
-            except Exception as e:
-                print(f'清理临时文件失败: {fp}, {e}')
+    show_image_and_results(ocr_result, classify_result, save_callback=save_callback, images_dir=images_dir)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='角膜地形图识别')
+    parser.add_argument('--staged', action='store_true', help='按判别、识别两个阶段依次执行，不使用流水线')
+    parser.add_argument('--classify-workers', type=int, default=None, help='判别进程数，默认为CPU核数')
+    parser.add_argument('--judge-timeout', type=float, default=None, help='单个判别函数的时间预算（秒）')
+    parser.add_argument('--image-timeout', type=float, default=None, help='单张图片判别的时间预算（秒）')
+    parser.add_argument('--templates', action='store_true', help='按模板版面指纹分类，不调用判别函数')
+    args = parser.parse_args()
+    main(streaming=not args.staged, classify_workers=args.classify_workers, judge_timeout=args.judge_timeout,
+         image_timeout=args.image_timeout, use_templates=args.templates) 
\ No newline at end of file
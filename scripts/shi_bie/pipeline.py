@@ -0,0 +1,328 @@
+"""
+流式识别流水线：读取 -> 判别 -> 识别
+
+每张图片读取后立即进入判别，判别完立即进入识别，阶段之间用有界队列连接，
+百度OCR的网络等待与本地解码/判别重叠进行，整批耗时接近最慢阶段的耗时。
+给判别设了时间预算、或图片足够多可以多进程判别时，读取和判别改由 classify_pool 的工作进程完成
+（多核并行；限时时卡死的判别函数可以被结束），判别完的图片同样立即进入识别，识别阶段按原图重读。
+有别名保存了模板指纹且选择按模板分类时，判别阶段改用 TemplateIndex（见 template_index.py），不调用判别函数。
+"""
+import os
+import queue
+import threading
+from PyQt6.QtWidgets import QApplication
+from ocr2 import (load_judge_functions, load_template_index, judge_image, get_classify_decode,
+                  get_judge_signature)
+from template_index import SIGNATURE_DECODE_FLAGS
+from judge_order import JudgeOrder, save_judge_stats
+from size_index import SizeIndex
+from ocr3 import prepare_recognition, get_stored_result, get_scheme_hash, recognize_image, close_recognition
+from ocr5 import show_progress_window
+from ingest import (get_images_dir, list_batch_images, get_image_info, save_hash_index, lookup_stored_result,
+                    lookup_classification, store_classification)
+from classify_pool import iter_classify, new_guard_state, print_slow_summary, MIN_IMAGES_PER_WORKER
+import cv2
+from image_source import close_archives
+from image_cache import read_image
+
+# 队列结束标记
+_DONE = object()
+# 判别结果已缓存、不需要解码的图片
+_SKIPPED = object()
+
+
+def run_pipeline(images: list, judge_functions: dict, context: dict, queue_size: int = 8,
+                 recognize_workers: int = 1, on_event=None, image_info: dict = None,
+                 judge_timeout: float = None, image_timeout: float = None, classify_workers: int = None,
+                 template_index=None):
+    """
+    以流水线方式处理一批图片
+
+    @param images {list} [(图片名, 图片路径), ...]
+    @param judge_functions {dict} 判别函数字典
+    @param context {dict} prepare_recognition 返回的识别上下文
+    @param queue_size {int} 阶段之间队列的容量，限制已解码但未处理的图片数量
+    @param recognize_workers {int} 识别阶段的线程数
+    @param on_event {Callable} on_event(阶段, 图片名)，阶段为 decode / judge / recognize，在工作线程中调用
+    @param image_info {dict} get_image_info 返回的探测信息，探测失败的图片不解码
+    @param judge_timeout {float} 单个判别函数的时间预算（秒），设置后在可结束的工作进程中判别
+    @param image_timeout {float} 单张图片判别的时间预算（秒），超时的图片判为 timeout
+    @param classify_workers {int} 判别进程数，None为CPU核数；为1或图片太少时在本进程判别
+    @param template_index {TemplateIndex} 按模板版面指纹分类，为None或没有任何指纹时用判别函数
+    @return {tuple} (classify_result, ocr_result)
+    """
+    decode_q = queue.Queue(maxsize=queue_size)
+    recognize_q = queue.Queue(maxsize=queue_size)
+    classify_result = {}
+    ocr_result = {}
+    # 按模板指纹分类只需一次矩阵运算，不调用判别函数，也不需要限时和多进程
+    templates = template_index is not None and len(template_index) > 0
+    # 限时判别：读取和判别都在工作进程中，超时的判别函数连同进程一起结束
+    guarded = bool(judge_timeout or image_timeout) and not templates
+    # 多进程判别：每个进程至少分到 MIN_IMAGES_PER_WORKER 张时才值得启动，
+    # 否则在本进程判别，全尺寸解码的图片可以直接交给识别阶段
+    classify_workers = classify_workers or os.cpu_count() or 1
+    pooled = guarded or (not templates and classify_workers > 1 and len(images) >= 2 * MIN_IMAGES_PER_WORKER)
+    guard_state = new_guard_state()
+    # 工作进程的判别结果，pool_stage 先写入再放进队列，判别阶段从队列取出后读取
+    judged = {}
+    # 读取阶段按分类需要的分辨率解码；缩小解码时，需要识别的图片在识别阶段再按原图读取
+    decode_scale, _, decode_flags = get_classify_decode(judge_functions)
+    if templates:
+        decode_flags = SIGNATURE_DECODE_FLAGS
+    full_decode = decode_flags == cv2.IMREAD_COLOR and not pooled
+    # 判别阶段只有一个线程，按代价排序的统计不需要加锁
+    order = JudgeOrder(judge_functions)
+    # 往次判别过且相关判别函数没变的图片直接用缓存的类别；按模板分类的结果与判别函数无关，不读写该缓存
+    signature = get_judge_signature(judge_functions)
+    hash_index = context['hash_index']
+    content_keys = context['content_keys']
+    cached_types = {}
+    for img_name, _ in images:
+        cached_type = None if templates else lookup_classification(hash_index, content_keys.get(img_name),
+                                                                   signature)
+        if cached_type is not None:
+            cached_types[img_name] = cached_type
+    # 按探测到的尺寸筛出候选别名，空集表示没有宽高比相容的别名，直接判为 unknown
+    size_index = SizeIndex.from_judges(judge_functions)
+    candidates = {img_name: size_index.candidates_for(image_info.get(img_name))
+                  for img_name, _ in images} if image_info is not None and not templates else {}
+
+    def emit(stage, img_name):
+        if on_event:
+            on_event(stage, img_name)
+
+    def decode_one(img_name, img_path):
+        """
+        @return 解码后的图片；不需要解码时为 _SKIPPED，无法读取时为None
+        """
+        # 文件头探测失败的不是图片，不必再完整解码
+        if image_info is not None and image_info.get(img_name) is None:
+            return None
+        # 类别已缓存时，识别结果也已缓存或识别阶段本来就要重读原图，这里不必解码
+        cached_type = cached_types.get(img_name)
+        if cached_type is None and candidates.get(img_name) == frozenset():
+            return _SKIPPED
+        if cached_type is not None and (not full_decode or lookup_stored_result(
+                hash_index, content_keys.get(img_name), cached_type,
+                get_scheme_hash(cached_type, context)) is not None):
+            return _SKIPPED
+        return read_image(img_path, decode_flags)
+
+    def decode_stage():
+        try:
+            for img_name, img_path in images:
+                try:
+                    image = decode_one(img_name, img_path)
+                except Exception as e:
+                    print(f"读取图片 {img_name} 出错: {e}")
+                    image = None
+                decode_q.put((img_name, img_path, image))
+                emit('decode', img_name)
+        finally:
+            close_archives()
+            decode_q.put(_DONE)
+
+    def pool_stage():
+        """
+        代替读取阶段：类别未缓存的图片交给工作进程读取并判别，判别结果随队列传给判别阶段
+        """
+        paths = dict(images)
+        pending = []
+        try:
+            for img_name, img_path in images:
+                if img_name in cached_types:
+                    decode_q.put((img_name, img_path, _SKIPPED))
+                    emit('decode', img_name)
+                else:
+                    pending.append((img_name, img_path))
+            judge_sources = {alias: f.source for alias, f in judge_functions.items()}
+            layout_sizes = {alias: f.layout_size for alias, f in judge_functions.items() if f.layout_size}
+            for img_name, img_type, _ in iter_classify(pending, judge_sources, image_info, classify_workers,
+                                                       judge_timeout=judge_timeout, image_timeout=image_timeout,
+                                                       guard_state=guard_state, layout_sizes=layout_sizes):
+                judged[img_name] = img_type
+                decode_q.put((img_name, paths[img_name], None if img_type == 'unreadable' else _SKIPPED))
+                emit('decode', img_name)
+        except Exception as e:
+            # 工作进程池出错时，还没判别的图片记为无法读取，每张图片仍然有一行结果
+            print(f"多进程判别出错: {e}")
+            for img_name, img_path in pending:
+                if img_name not in judged:
+                    judged[img_name] = 'unreadable'
+                    decode_q.put((img_name, img_path, None))
+                    emit('decode', img_name)
+        finally:
+            decode_q.put(_DONE)
+
+    def judge_one(img_name, img_path, image):
+        if image is None:
+            print(f"无法读取图片: {img_name}")
+            classify_result[img_name] = 'unreadable'
+            ocr_result[img_name] = [{'error': '图片无法读取'}]
+            emit('judge', img_name)
+            emit('recognize', img_name)
+            return
+        img_type = cached_types.get(img_name)
+        if img_type is None:
+            img_candidates = candidates.get(img_name)
+            if img_name in judged:
+                img_type = judged[img_name]
+            elif templates:
+                img_type, _ = template_index.match(image)
+            elif img_candidates is not None and not img_candidates:
+                img_type = 'unknown'
+            else:
+                img_type = judge_image(image, judge_functions, img_name, decode_scale=decode_scale,
+                                       order=order, candidates=img_candidates)
+            # 有别名因超时被停用时，之后的判别结果不完整，不写入缓存
+            if not templates and not guard_state['disabled']:
+                store_classification(hash_index, content_keys.get(img_name), img_type, signature)
+        classify_result[img_name] = img_type
+        emit('judge', img_name)
+        if img_type == 'timeout':
+            ocr_result[img_name] = [{'error': '判别超时'}]
+            emit('recognize', img_name)
+            return
+        stored = get_stored_result(img_name, img_type, context)
+        if stored is not None:
+            ocr_result[img_name] = stored
+            emit('recognize', img_name)
+            return
+        # 分类用的是缩小解码或没有解码时，识别阶段按原图重读
+        recognize_q.put((img_name, img_type, image if full_decode and image is not _SKIPPED else img_path))
+
+    def judge_stage():
+        item = None
+        try:
+            while True:
+                item = decode_q.get()
+                if item is _DONE:
+                    break
+                img_name, img_path, image = item
+                try:
+                    judge_one(img_name, img_path, image)
+                except Exception as e:
+                    print(f"判别图片 {img_name} 出错: {e}")
+                    if img_name not in classify_result:
+                        classify_result[img_name] = 'unreadable'
+                        emit('judge', img_name)
+                    ocr_result[img_name] = [{'error': f'判别出错: {e}'}]
+                    emit('recognize', img_name)
+        finally:
+            # 判别阶段意外退出时继续取空队列，读取阶段不会卡在已满的队列上；识别线程总能收到结束标记
+            while item is not _DONE:
+                item = decode_q.get()
+            for _ in range(recognize_workers):
+                recognize_q.put(_DONE)
+
+    def recognize_stage():
+        while True:
+            item = recognize_q.get()
+            if item is _DONE:
+                break
+            img_name, img_type, image = item
+            try:
+                if isinstance(image, str):
+                    image = read_image(image)
+                    if image is None:
+                        ocr_result[img_name] = [{'error': '图片无法读取'}]
+                        emit('recognize', img_name)
+                        continue
+                ocr_result[img_name] = recognize_image(image, img_name, img_type, context)
+            except Exception as e:
+                print(f"识别图片 {img_name} 出错: {e}")
+                ocr_result[img_name] = [{'error': f'识别出错: {e}'}]
+            emit('recognize', img_name)
+        close_archives()
+
+    threads = [threading.Thread(target=pool_stage if pooled else decode_stage, daemon=True),
+               threading.Thread(target=judge_stage, daemon=True)]
+    threads += [threading.Thread(target=recognize_stage, daemon=True) for _ in range(recognize_workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    save_judge_stats(order.take_delta())
+    if guarded:
+        print_slow_summary(guard_state)
+
+    # 识别线程可能乱序完成，按输入顺序整理结果
+    ordered = {name: ocr_result[name] for name, _ in images if name in ocr_result}
+    return classify_result, ordered
+
+
+def pipeline_with_progress(queue_size: int = 8, recognize_workers: int = None, images_dir: str = None,
+                           judge_timeout: float = None, image_timeout: float = None,
+                           classify_workers: int = None, use_templates: bool = False):
+    """
+    带进度窗口运行流水线，供主流程调用
+
+    @param recognize_workers {int} 识别阶段同时处理的图片数，默认与识别线程池的并发数相同
+
+    @param images_dir {str} 本次作业的批次目录，默认 lin_shi/dai_shi_bie
+    @param judge_timeout {float} 单个判别函数的时间预算（秒），见 run_pipeline
+    @param image_timeout {float} 单张图片判别的时间预算（秒）
+    @param classify_workers {int} 判别进程数，None为CPU核数
+    @param use_templates {bool} 按模板版面指纹分类，没有别名保存过指纹时仍用判别函数
+    @return {tuple} (classify_result, ocr_result)，失败时为 ({}, {})
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    scripts_dir = os.path.dirname(current_dir)
+    project_dir = os.path.dirname(scripts_dir)
+    pkl_path = os.path.join(project_dir, 'mu_ban', 'shared_data.pkl')
+
+    images_dir = images_dir or get_images_dir()
+    images = list_batch_images(images_dir)
+    if not images:
+        print("错误: 没有待识别的图片")
+        return {}, {}
+    judge_functions = load_judge_functions(pkl_path)
+    if not judge_functions:
+        print("警告: 没有找到任何判别函数")
+        return {}, {}
+    template_index = None
+    if use_templates:
+        template_index = load_template_index(pkl_path)
+        if not len(template_index):
+            print("警告: 没有别名保存了模板指纹，改用判别函数分类")
+    context = prepare_recognition(images_dir=images_dir)
+    recognize_workers = recognize_workers or context['ocr_pool'].workers
+
+    image_info = get_image_info(images_dir)
+    total = len(images)
+    events = queue.Queue()
+    output = {}
+
+    def process_func(update_copy, update_judge, update_recognize):
+        updaters = {'decode': update_copy, 'judge': update_judge, 'recognize': update_recognize}
+        counts = {'decode': 0, 'judge': 0, 'recognize': 0}
+
+        def worker():
+            try:
+                output['result'] = run_pipeline(images, judge_functions, context, queue_size,
+                                                recognize_workers, lambda stage, _: events.put(stage),
+                                                image_info, judge_timeout, image_timeout, classify_workers,
+                                                template_index)
+            except Exception as e:
+                print(f"流水线运行出错: {e}")
+            finally:
+                events.put(_DONE)
+
+        threading.Thread(target=worker, daemon=True).start()
+        # 进度窗口只能在界面线程更新，这里消费工作线程发来的事件
+        while True:
+            try:
+                stage = events.get(timeout=0.1)
+            except queue.Empty:
+                QApplication.processEvents()
+                continue
+            if stage is _DONE:
+                break
+            counts[stage] += 1
+            updaters[stage](counts[stage])
+
+    show_progress_window(total, total, total, process_func, streaming=True)
+    save_hash_index(context['hash_index'])
+    close_recognition(context)
+    return output.get('result', ({}, {}))
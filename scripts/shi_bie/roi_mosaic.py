@@ -0,0 +1,102 @@
+"""
+识别区拼图识别
+
+每个识别区单独调用一次 OCR 时，一张 4~8 个识别区的图片就要 4~8 次请求，耗时和额度主要花在每次调用的固定开销上。
+拼图模式把预处理后的识别区自上而下拼到一张画布上，识别区之间留出空白分隔带，整张画布只调用一次带位置的 OCR，
+再按每行文字的位置把文本分回它所在的识别区（与哪个识别区的纵向范围重叠最多就归哪个），最后各自做后处理。
+
+画布高度超过 MAX_CANVAS_HEIGHT 时另起一张，超长图片不会被接口拒绝或压缩得过小。
+在 mu_ban/baidu_ocr_key.txt 中追加 MOSAIC = 1 启用，默认关闭。
+"""
+import numpy as np
+import cv2
+
+# 识别区之间的空白分隔带高度（像素），足够让接口把上下两个识别区的文字分成不同的行
+SEPARATOR = 24
+# 画布四周留白（像素）
+MARGIN = 16
+# 单张画布的最大高度，百度高精度接口建议最长边不超过 4096
+MAX_CANVAS_HEIGHT = 4096
+# 画布底色
+BACKGROUND = 255
+
+
+def to_bgr(roi: np.ndarray) -> np.ndarray:
+    """
+    预处理后的识别区可能是灰度或二值图，统一成三通道 BGR 再拼接
+    """
+    if roi.ndim == 2:
+        return cv2.cvtColor(roi, cv2.COLOR_GRAY2BGR)
+    if roi.shape[2] == 4:
+        return cv2.cvtColor(roi, cv2.COLOR_BGRA2BGR)
+    return roi
+
+
+class Mosaic:
+    """
+    一张拼好的画布，以及每个识别区在画布上的纵向范围
+    """
+    def __init__(self, image: np.ndarray, slots: list):
+        """
+        @param image {np.ndarray} BGR画布
+        @param slots {list} [(识别区序号, 上边界, 下边界), ...]，自上而下
+        """
+        self.image = image
+        self.slots = slots
+
+    def assign(self, lines: list) -> dict:
+        """
+        把 OCR 返回的每行文字分回识别区
+
+        @param lines {list} [(文本, (left, top, width, height)), ...]，画布坐标，按阅读顺序
+        @return {dict} {识别区序号: [文本, ...]}，没有分到文字的识别区不出现
+        """
+        texts = {}
+        for text, (left, top, width, height) in lines:
+            best, best_overlap = None, 0
+            for index, slot_top, slot_bottom in self.slots:
+                overlap = min(top + height, slot_bottom) - max(top, slot_top)
+                if overlap > best_overlap:
+                    best, best_overlap = index, overlap
+            # 落在分隔带或留白里的噪点不属于任何识别区
+            if best is not None:
+                texts.setdefault(best, []).append(text)
+        return texts
+
+
+def build_mosaics(rois: list) -> list:
+    """
+    把识别区依次拼到画布上
+
+    @param rois {list} [(识别区序号, 预处理后的识别区图像), ...]，空图像跳过
+    @return {list} [Mosaic, ...]
+    """
+    groups = []
+    current, height = [], MARGIN
+    for index, roi in rois:
+        if roi is None or roi.size == 0:
+            continue
+        roi = to_bgr(roi)
+        needed = roi.shape[0] + SEPARATOR
+        if current and height + needed > MAX_CANVAS_HEIGHT:
+            groups.append(current)
+            current, height = [], MARGIN
+        current.append((index, roi))
+        height += needed
+    if current:
+        groups.append(current)
+    return [_paste(group) for group in groups]
+
+
+def _paste(group: list) -> Mosaic:
+    width = max(roi.shape[1] for _, roi in group) + 2 * MARGIN
+    height = sum(roi.shape[0] for _, roi in group) + SEPARATOR * (len(group) - 1) + 2 * MARGIN
+    canvas = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+    slots = []
+    y = MARGIN
+    for index, roi in group:
+        h, w = roi.shape[:2]
+        canvas[y:y + h, MARGIN:MARGIN + w] = roi
+        slots.append((index, y, y + h))
+        y += h + SEPARATOR
+    return Mosaic(canvas, slots)
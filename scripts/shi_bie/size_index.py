@@ -0,0 +1,72 @@
+"""
+按图片尺寸预筛判别函数
+
+每个别名在 image_window 中保存了模板图片的尺寸（pkl1 保存时的显示尺寸，缩放时保持宽高比）。
+不同设备导出的图片版面不同，宽高比对不上的别名不可能命中，不必调用它的判别函数。
+SizeIndex 按 log(宽/高) 分桶建立 宽高比 -> 别名 的索引，一张图片的候选别名只需查相邻几个桶，
+同一尺寸的结果会记住，混合设备的批次里每种尺寸只算一次。
+没有保存尺寸的别名总是候选，行为与以前一致。
+"""
+import math
+
+# log(宽/高) 的分桶宽度；查询时连同相邻桶一起取，容差约 2%~4%，足以容纳缩放显示时的取整误差
+ASPECT_STEP = 0.02
+
+
+def _bucket(width: int, height: int) -> int:
+    return math.floor(math.log(width / height) / ASPECT_STEP)
+
+
+class SizeIndex:
+    """
+    图片尺寸到候选别名的索引
+    """
+    def __init__(self, sizes: dict, aliases: list):
+        """
+        @param sizes {dict} {别名: (宽, 高)}
+        @param aliases {list} 全部别名，不在 sizes 中的总是候选
+        """
+        self.unsized = frozenset(alias for alias in aliases if not _valid_size(sizes.get(alias)))
+        self.buckets = {}
+        for alias in aliases:
+            size = sizes.get(alias)
+            if _valid_size(size):
+                self.buckets.setdefault(_bucket(*size), set()).add(alias)
+        # (宽, 高) -> 候选别名
+        self._by_size = {}
+
+    @classmethod
+    def from_judges(cls, judge_functions: dict) -> 'SizeIndex':
+        """
+        从判别函数上的 layout_size 属性建立索引，见 ocr2.build_judge_functions
+        """
+        sizes = {alias: getattr(f, 'layout_size', None) for alias, f in judge_functions.items()}
+        return cls(sizes, list(judge_functions))
+
+    def candidates(self, width: int, height: int):
+        """
+        @return {frozenset|None} 宽高比相容的别名；尺寸未知时为None，表示不筛选
+        """
+        if not width or not height:
+            return None
+        key = (width, height)
+        found = self._by_size.get(key)
+        if found is None:
+            bucket = _bucket(width, height)
+            aliases = set(self.unsized)
+            for b in (bucket - 1, bucket, bucket + 1):
+                aliases |= self.buckets.get(b, set())
+            found = self._by_size[key] = frozenset(aliases)
+        return found
+
+    def candidates_for(self, info: dict):
+        """
+        @param info {dict} get_image_info 中一张图片的探测信息
+        """
+        if not info:
+            return None
+        return self.candidates(info.get('width'), info.get('height'))
+
+
+def _valid_size(size) -> bool:
+    return bool(size) and len(size) == 2 and size[0] > 0 and size[1] > 0
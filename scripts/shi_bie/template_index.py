@@ -0,0 +1,92 @@
+"""
+按模板图片的版面指纹分类
+
+pkl1 保存别名时会为当时拖入的模板图片算一个版面指纹，存在该别名 image_window 的 signatures 中
+（mu_ban/add_templates.py 可以给已有别名补充更多样例）。
+版面指纹（见 mu_ban/layout_signature.py）是缩到 32x24 的灰度图，减去均值后归一化为单位向量，
+两张图片的距离为 1 - 余弦相似度：
+同一版面的图片即使地形图内容不同，距离也明显小于不同版面之间的距离。
+
+TemplateIndex 把所有别名的指纹堆成一个矩阵，一张图片与所有模板的距离只需一次矩阵乘法，
+最近的模板距离超过阈值时判为 unknown。不需要为每个别名手写判别函数，
+别名再多，分类代价也基本不变。每个别名的样例越多，阈值可以设得越严。
+"""
+import os
+import sys
+import numpy as np
+
+# 指纹算法与编辑端共用，见 mu_ban/layout_signature.py
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'mu_ban'))
+from layout_signature import (SIGNATURE_SIZE, SIGNATURE_DIM, SIGNATURE_DECODE_FLAGS,  # noqa: E402,F401
+                              compute_signature, encode_signature, decode_signature)
+
+# 最近模板的距离超过该值时判为 unknown
+DEFAULT_THRESHOLD = 0.4
+
+
+class TemplateIndex:
+    """
+    所有别名模板指纹组成的索引
+    """
+    def __init__(self, signatures: dict, threshold: float = DEFAULT_THRESHOLD):
+        """
+        @param signatures {dict} {别名: [指纹, ...]}
+        @param threshold {float} 判为 unknown 的距离阈值
+        """
+        self.threshold = threshold
+        self.aliases = [alias for alias, items in signatures.items() if items]
+        rows = [np.asarray(s, dtype=np.float32) for alias in self.aliases for s in signatures[alias]]
+        self.matrix = np.vstack(rows) if rows else np.empty((0, SIGNATURE_DIM), np.float32)
+        # 每一行属于哪个别名
+        self.labels = np.array([i for i, alias in enumerate(self.aliases) for _ in signatures[alias]], dtype=np.intp)
+
+    @classmethod
+    def from_pkl_data(cls, data: dict, threshold: float = DEFAULT_THRESHOLD) -> 'TemplateIndex':
+        """
+        从 shared_data.pkl 的内容建立索引，没有指纹的别名不参与
+        """
+        signatures = {}
+        for alias, scripts in data.items():
+            if alias == '__global__' or not isinstance(scripts, dict):
+                continue
+            items = [decode_signature(b) for b in scripts.get('image_window', {}).get('signatures', [])]
+            items = [s for s in items if s is not None]
+            if items:
+                signatures[alias] = items
+        return cls(signatures, threshold)
+
+    def __len__(self) -> int:
+        return len(self.aliases)
+
+    def distances(self, signatures: np.ndarray) -> np.ndarray:
+        """
+        每张图片到每个别名最近模板的距离
+
+        @param signatures {np.ndarray} (图片数, SIGNATURE_DIM) 或单个指纹
+        @return {np.ndarray} (图片数, 别名数)
+        """
+        signatures = np.atleast_2d(signatures)
+        to_templates = 1.0 - signatures @ self.matrix.T
+        result = np.full((signatures.shape[0], len(self.aliases)), np.inf, dtype=np.float32)
+        np.minimum.at(result.T, self.labels, to_templates.T)
+        return result
+
+    def match_many(self, signatures: np.ndarray) -> list:
+        """
+        一次矩阵运算判别多张图片
+
+        @return {list} [(别名, 距离), ...]，距离超过阈值的别名为 unknown
+        """
+        if not self.aliases:
+            return [('unknown', float('inf'))] * len(np.atleast_2d(signatures))
+        dist = self.distances(signatures)
+        best = dist.argmin(axis=1)
+        best_dist = dist[np.arange(len(best)), best]
+        return [(self.aliases[i] if d <= self.threshold else 'unknown', float(d)) for i, d in zip(best, best_dist)]
+
+    def match(self, image: np.ndarray) -> tuple:
+        """
+        @param image {np.ndarray} 已解码的图片
+        @return {tuple} (别名, 距离)
+        """
+        return self.match_many(compute_signature(image))[0]
@@ -2,8 +2,8 @@ import sys
 import cv2
 import base64
 import urllib
-import requests
 import numpy as np
+import http_client
 from PyQt6.QtWidgets import QApplication, QWidget, QLabel, QLineEdit, QTextEdit, QPushButton, QVBoxLayout, QFileDialog, QHBoxLayout
 
 class BaiduOCRTestWindow(QWidget):
@@ -77,7 +77,7 @@ class BaiduOCRTestWindow(QWidget):
     def get_access_token(self, api_key, secret_key):
         try:
             url = f'https://aip.baidubce.com/oauth/2.0/token?grant_type=client_credentials&client_id={api_key}&client_secret={secret_key}'
-            resp = requests.get(url)
+            resp = http_client.get(url)
             data = resp.json()
             return data.get('access_token', None)
         except Exception as e:
@@ -99,7 +99,7 @@ class BaiduOCRTestWindow(QWidget):
                 'Content-Type': 'application/x-www-form-urlencoded',
                 'Accept': 'application/json'
             }
-            response = requests.request("POST", url, headers=headers, data=payload.encode("utf-8"))
+            response = http_client.post(url, headers=headers, data=payload.encode("utf-8"))
             result = response.json()
             api_raw = str(result)
             if "words_result" in result:
@@ -0,0 +1,324 @@
+"""
+监视目录模式（无界面）
+
+持续轮询地形图导出目录，发现新文件后等待其写完（大小与修改时间在 settle 秒内不再变化），
+按小批次登记、判别、识别，并把结果不断追加到 results/watch_results_日期.xlsx。
+放进目录的 .zip / .tar(.gz) 压缩包不解压，成员直接进入识别。
+轮询用 os.scandir 只比较大小和修改时间，网络共享目录上也能用（inotify 对 SMB/NFS 无效）。
+
+用法：python watch_folder.py 监视目录 [--interval 2] [--settle 3] [--batch-size 16] [--judge-timeout 秒]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import datetime
+from ingest import (INGEST_MANIFEST, get_lin_shi_dir, ingest_images, list_batch_images, get_image_info,
+                    get_content_keys, clear_batch_dir, save_hash_index, is_image_file, scan_image_files,
+                    create_job, remove_job, expand_duplicates)
+from image_source import is_archive_file, split_archive_source, ARCHIVE_SEP
+from ocr2 import load_judge_functions, load_template_index
+from ocr3 import prepare_recognition, close_recognition
+from ocr6 import append_to_excel
+from pipeline import run_pipeline
+
+# 旧版所有监视目录共用的状态文件，只在迁移时读取
+STATE_NAME = 'watch_state.json'
+# 同一文件连续处理失败这么多次后不再重试（记为已处理），文件再被改写时会重新处理
+MAX_FAILURES = 3
+
+
+def get_project_dir() -> str:
+    current_dir = os.path.dirname(os.path.abspath(__file__))  # scripts/shi_bie
+    scripts_dir = os.path.dirname(current_dir)  # scripts
+    return os.path.dirname(scripts_dir)  # 项目根目录
+
+
+def get_state_path(watch_dir: str) -> str:
+    """
+    每个监视目录独立的状态文件 lin_shi/watch_state_<目录哈希>.json，
+    同时运行多个监视进程或切换监视目录时互不覆盖
+    """
+    key = hashlib.sha256(os.path.normcase(os.path.abspath(watch_dir)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(get_lin_shi_dir(), f'watch_state_{key}.json')
+
+
+def snapshot(watch_dir: str, recursive: bool = True) -> dict:
+    """
+    扫描监视目录，记录每个图片文件和压缩包的 (大小, 修改时间)
+
+    @return {dict} {路径: (size, mtime)}
+    """
+    result = {}
+    stack = [watch_dir]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                stack.append(entry.path)
+                        elif is_image_file(entry.name) or is_archive_file(entry.name):
+                            st = entry.stat()
+                            result[entry.path] = (st.st_size, st.st_mtime)
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"读取监视目录失败: {current}, {e}")
+    return result
+
+
+class FolderWatcher:
+    """
+    监视目录，按小批次处理新导出的图片
+    """
+    def __init__(self, watch_dir, interval=2.0, settle=3.0, batch_size=16, recursive=True,
+                 recognize_workers=None, judge_timeout=None, image_timeout=None, classify_workers=None,
+                 use_templates=False):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.interval = interval
+        self.settle = settle
+        self.batch_size = batch_size
+        self.recursive = recursive
+        self.recognize_workers = recognize_workers
+        # 判别的时间预算，卡死的判别函数不会让监视进程停住，见 pipeline.run_pipeline
+        self.judge_timeout = judge_timeout
+        self.image_timeout = image_timeout
+        # 判别进程数，None为CPU核数；批次太小时仍在本进程判别
+        self.classify_workers = classify_workers
+        # 按模板版面指纹分类，随识别方案一起重新加载
+        self.use_templates = use_templates
+        self.template_index = None
+        project_dir = get_project_dir()
+        self.pkl_path = os.path.join(project_dir, 'mu_ban', 'shared_data.pkl')
+        self.results_dir = os.path.join(project_dir, 'results')
+        # 监视模式使用独立的作业目录，不影响界面流程和其他监视进程
+        self.job_id, self.batch_dir = create_job()
+        self.state_path = get_state_path(self.watch_dir)
+        self.processed = self.load_state()
+        # 路径 -> 连续处理失败的次数
+        self.failures = {}
+        self.last_seen = {}
+        self.judge_functions = {}
+        self.context = None
+        self.pkl_mtime = None
+
+    def load_state(self) -> dict:
+        """
+        已处理文件的 {路径: [size, mtime]}，重启后不重复处理
+        """
+        legacy_path = os.path.join(get_lin_shi_dir(), STATE_NAME)
+        migrate = not os.path.exists(self.state_path)
+        path = legacy_path if migrate else self.state_path
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except Exception as e:
+                print(f"读取监视状态失败: {e}")
+                return {}
+            if migrate:
+                # 从旧版共用的状态文件中取出本目录下的记录
+                prefix = os.path.join(self.watch_dir, '')
+                state = {p: v for p, v in state.items() if p.startswith(prefix)}
+            return state
+        return {}
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f'{self.state_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.processed, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def reload_schemes(self) -> bool:
+        """
+        shared_data.pkl 被修改后重新加载判别函数和识别方案
+
+        @return {bool} 是否可以开始识别
+        """
+        try:
+            mtime = os.path.getmtime(self.pkl_path)
+        except OSError:
+            print(f"错误: pkl文件不存在: {self.pkl_path}")
+            return False
+        if mtime == self.pkl_mtime and self.context is not None:
+            return True
+        self.judge_functions = load_judge_functions(self.pkl_path)
+        if not self.judge_functions:
+            print("警告: 没有找到任何判别函数")
+            return False
+        if self.use_templates:
+            self.template_index = load_template_index(self.pkl_path)
+            if not len(self.template_index):
+                print("警告: 没有别名保存了模板指纹，改用判别函数分类")
+        context = prepare_recognition(images_dir=self.batch_dir)
+        if self.context is not None:
+            save_hash_index(self.context['hash_index'])
+            close_recognition(self.context)
+        self.context = context
+        self.pkl_mtime = mtime
+        print("[监视] 已加载识别方案")
+        return True
+
+    def find_ready_files(self) -> list:
+        """
+        找出已写完且未处理过的文件：两次轮询之间大小和修改时间不变，且距修改已超过 settle 秒
+        """
+        now = time.time()
+        current = snapshot(self.watch_dir, self.recursive)
+        ready = []
+        for path, (size, mtime) in current.items():
+            signature = [size, mtime]
+            if self.processed.get(path) == signature:
+                continue
+            if self.last_seen.get(path) == (size, mtime) and now - mtime >= self.settle and size > 0:
+                ready.append(path)
+        self.last_seen = current
+        ready.sort(key=lambda p: current[p][1])
+        return ready
+
+    def image_name(self, source: str) -> str:
+        """
+        监视批次中的图片名：相对监视目录的路径，压缩包成员为 "压缩包相对路径::成员名"；
+        不同子目录、不同压缩包中的同名图片不会在批次中互相覆盖，excel 中也能区分
+        """
+        parts = split_archive_source(source)
+        path = parts[0] if parts is not None else source
+        name = os.path.relpath(path, self.watch_dir).replace(os.sep, '/')
+        return f'{name}{ARCHIVE_SEP}{parts[1]}' if parts is not None else name
+
+    def process_batch(self, sources: list):
+        """
+        登记并识别一个小批次，结果追加到当天的excel
+
+        @param sources {list} 图片路径或压缩包成员来源
+        @raise {RuntimeError} 有图片在登记时被同名图片覆盖，整个批次按失败处理，不记为已处理
+        """
+        clear_batch_dir(self.batch_dir)
+        report = ingest_images(sources, self.batch_dir, INGEST_MANIFEST,
+                               names={source: self.image_name(source) for source in sources})
+        for file_name, error in report['errors']:
+            print(f"[监视] 登记失败: {file_name}, {error}")
+        if report['overwritten']:
+            # 被覆盖的图片不会被识别，不能当作已处理
+            raise RuntimeError(f"批次中有同名图片被覆盖: {', '.join(report['overwritten'])}")
+        images = list_batch_images(self.batch_dir)
+        if images:
+            self.context['content_keys'] = get_content_keys(self.batch_dir)
+            classify_result, ocr_result = run_pipeline(
+                images, self.judge_functions, self.context,
+                recognize_workers=self.recognize_workers or self.context['ocr_pool'].workers,
+                image_info=get_image_info(self.batch_dir),
+                judge_timeout=self.judge_timeout, image_timeout=self.image_timeout,
+                classify_workers=self.classify_workers, template_index=self.template_index)
+            save_hash_index(self.context['hash_index'])
+            classify_result, ocr_result = expand_duplicates(self.batch_dir, classify_result, ocr_result)
+            if ocr_result:
+                day = datetime.datetime.now().strftime('%Y%m%d')
+                append_to_excel(ocr_result, classify_result,
+                                os.path.join(self.results_dir, f'watch_results_{day}.xlsx'))
+        clear_batch_dir(self.batch_dir)
+        print(f"[监视] 已处理 {len(sources)} 个图片，重复 {len(report['duplicates'])} 个，复用 {len(report['cached'])} 个")
+
+    def run_once(self) -> int:
+        """
+        轮询一次并处理所有就绪的文件
+
+        @return {int} 本次处理的文件数
+        """
+        ready = self.find_ready_files()
+        if not ready or not self.reload_schemes():
+            return 0
+        # 压缩包展开为成员来源；一个文件的所有成员所在的批次都成功后才记为已处理
+        sources = []
+        remaining = {}
+        for path in ready:
+            members = list(scan_image_files([path]))
+            remaining[path] = len(members)
+            sources.extend((path, member) for member in members)
+        # 没有可识别成员的文件（空压缩包等）也记为已处理，文件再被改写时会重新处理
+        self.mark_processed([path for path in ready if not remaining[path]])
+        for i in range(0, len(sources), self.batch_size):
+            batch = sources[i:i + self.batch_size]
+            try:
+                self.process_batch([member for _, member in batch])
+            except Exception as e:
+                # 例如 excel 正被打开导致写入失败、网络中断；下次轮询重试，已识别的图片会复用保存的结果
+                print(f"[监视] 处理批次出错: {e}")
+                self.record_failure({path for path, _ in batch})
+                continue
+            done = []
+            for path, _ in batch:
+                remaining[path] -= 1
+                if remaining[path] == 0:
+                    done.append(path)
+            # 每个批次完成后立即保存状态，中途退出时已完成的文件不会重新识别
+            self.mark_processed(done)
+        return len(ready)
+
+    def mark_processed(self, paths):
+        if not paths:
+            return
+        for path in paths:
+            size, mtime = self.last_seen.get(path, (None, None))
+            self.processed[path] = [size, mtime]
+            self.failures.pop(path, None)
+        self.save_state()
+
+    def record_failure(self, paths):
+        given_up = []
+        for path in paths:
+            self.failures[path] = self.failures.get(path, 0) + 1
+            if self.failures[path] >= MAX_FAILURES:
+                print(f"[监视] {path} 连续 {MAX_FAILURES} 次处理失败，不再重试")
+                given_up.append(path)
+        self.mark_processed(given_up)
+
+    def run(self):
+        print(f"[监视] 开始监视: {self.watch_dir}（Ctrl+C 退出）")
+        try:
+            while True:
+                start = time.monotonic()
+                try:
+                    self.run_once()
+                except Exception as e:
+                    # 单次轮询出错（读取方案、扫描目录等）不退出，下次轮询再试
+                    print(f"[监视] 轮询出错: {e}")
+                time.sleep(max(0.0, self.interval - (time.monotonic() - start)))
+        except KeyboardInterrupt:
+            print("[监视] 已停止")
+        finally:
+            close_recognition(self.context)
+            remove_job(self.job_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='监视目录，持续识别新导出的地形图')
+    parser.add_argument('watch_dir', help='要监视的目录')
+    parser.add_argument('--interval', type=float, default=2.0, help='轮询间隔（秒）')
+    parser.add_argument('--settle', type=float, default=3.0, help='文件多少秒内不再变化才视为写完')
+    parser.add_argument('--batch-size', type=int, default=16, help='每个小批次的图片数')
+    parser.add_argument('--no-recursive', action='store_true', help='不监视子目录')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='识别阶段的线程数，默认与 baidu_ocr_key.txt 中的 WORKERS 相同')
+    parser.add_argument('--classify-workers', type=int, default=None, help='判别进程数，默认为CPU核数')
+    parser.add_argument('--templates', action='store_true', help='按模板版面指纹分类，不调用判别函数')
+    parser.add_argument('--judge-timeout', type=float, default=None, help='单个判别函数的时间预算（秒）')
+    parser.add_argument('--image-timeout', type=float, default=None, help='单张图片判别的时间预算（秒）')
+    args = parser.parse_args()
+    if not os.path.isdir(args.watch_dir):
+        print(f"错误: 监视目录不存在: {args.watch_dir}")
+        sys.exit(1)
+    watcher = FolderWatcher(args.watch_dir, args.interval, args.settle, args.batch_size,
+                            not args.no_recursive, args.workers, args.judge_timeout, args.image_timeout,
+                            args.classify_workers, args.templates)
+    watcher.run()
+
+
+if __name__ == '__main__':
+    main()